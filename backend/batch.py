@@ -0,0 +1,532 @@
+"""
+Çok sayıda kayıtlı videonun süreç havuzunda toplu sayımı.
+
+Her worker süreci modeli bir kez yükler ve kendisine düşen videoları
+yalnızca sayım modunda (çizim/önizleme/video çıktısı olmadan) işler.
+Sonuçlar ana süreçte toplanıp OverallCount ve DetectionRecord tablolarına
+toplu olarak yazılır.
+
+Komut satırı:
+    python batch.py --dir /data/2024-05-01 --lines '[{"name": "giris", "points": [[0, 300], [1280, 300]]}]'
+    python batch.py a.mp4 b.mp4 --workers 2 --output sonuc.json --no-db
+"""
+import os
+import sys
+import json
+import glob
+import time
+import uuid
+import asyncio
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from fastapi import HTTPException
+
+# Worker sayısı üst sınırı (0: çekirdek ve bellek durumuna göre) ve worker başına ayrılan bellek
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "0"))
+BATCH_WORKER_MEMORY_MB = float(os.getenv("BATCH_WORKER_MEMORY_MB", "1500"))
+# Bu kadar dosya bittiğinde sonuçlar veritabanına toplu yazılır
+BATCH_DB_FLUSH_FILES = int(os.getenv("BATCH_DB_FLUSH_FILES", "20"))
+# HTTP ile sunucudaki dizin/manifest kullanılacaksa izin verilen kök dizin (boş: kapalı)
+BATCH_INPUT_ROOT = os.getenv("BATCH_INPUT_ROOT", "")
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm", ".ts")
+
+
+# --- Girdi listesi ---
+
+def _check_root(path: str, root: str | None) -> str:
+    path = os.path.realpath(path)
+    if root is not None and os.path.commonpath([path, os.path.realpath(root)]) != os.path.realpath(root):
+        raise HTTPException(status_code=400, detail=f"İzin verilen dizin dışında: {path}")
+    return path
+
+
+def list_directory(directory: str, pattern: str = None, root: str = None) -> list[dict]:
+    """Dizindeki videoları (alt dizinler dahil değil) ada göre sıralı döndürür."""
+    directory = _check_root(directory, root)
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=400, detail=f"Dizin bulunamadı: {directory}")
+    if pattern:
+        # Desen yalnızca dosya adına uygulanır; başka dizine çıkamaz
+        if "/" in pattern or os.sep in pattern or ".." in pattern:
+            raise HTTPException(status_code=400, detail=f"Geçersiz dosya deseni: {pattern}")
+        paths = glob.glob(os.path.join(directory, pattern))
+    else:
+        paths = [os.path.join(directory, f) for f in os.listdir(directory)
+                 if f.lower().endswith(VIDEO_EXTENSIONS)]
+    # Dizin içindeki bağlantılar da izin verilen dizin dışını gösteremez
+    return [{"path": _check_root(p, root)} for p in sorted(paths) if os.path.isfile(p)]
+
+
+def parse_manifest(text: str, base_dir: str, root: str = None) -> list[dict]:
+    """
+    Manifest: JSON listesi (yol ya da {"path", "lines", "zones", "line_coordinates"}
+    nesneleri) veya satır başına bir yol. Göreli yollar base_dir'e göre çözülür.
+    """
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError:
+        entries = [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="Manifest bir liste olmalı")
+
+    items = []
+    for entry in entries:
+        item = dict(entry) if isinstance(entry, dict) else {"path": entry}
+        if not isinstance(item.get("path"), str):
+            raise HTTPException(status_code=400, detail=f"Manifest girdisinde yol yok: {entry}")
+        item["path"] = _check_root(os.path.join(base_dir, item["path"]), root)
+        if not os.path.isfile(item["path"]):
+            raise HTTPException(status_code=400, detail=f"Dosya bulunamadı: {item['path']}")
+        items.append(item)
+    return items
+
+
+def _available_memory_mb() -> float | None:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_workers(n_files: int) -> int:
+    """Kullanılabilir çekirdek ve belleğe göre worker sayısı."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    workers = cpus
+    memory = _available_memory_mb()
+    if memory is not None:
+        workers = min(workers, int(memory // BATCH_WORKER_MEMORY_MB))
+    if BATCH_MAX_WORKERS > 0:
+        workers = min(workers, BATCH_MAX_WORKERS)
+    return max(1, min(workers, n_files))
+
+
+# --- Worker süreci ---
+
+_worker_entry = None
+
+
+def _init_worker(model_name: str, backend: str, threads: int):
+    """Her worker'da bir kez çalışır: iş parçacığı sayısını sınırlar ve modeli yükler."""
+    global _worker_entry
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from model_manager import model_pool
+    _worker_entry = model_pool.acquire(model_name, backend)
+
+
+def _process_file(path: str, params: dict) -> dict:
+    """Tek bir videoyu sayar; sayım olaylarını veritabanı satırları olarak döndürür."""
+    import cv2
+    from tracking import TrackerSession
+    from counting import CountingEngine
+    from frame_gating import FrameGate
+    from region import RegionDetector
+    from inference_scheduler import BATCH_MAX_SIZE
+    from video_service import parse_counting_geometry
+
+    started = time.perf_counter()
+    started_at = datetime.now()
+    lines, zones = parse_counting_geometry(params["line_coordinates"], params.get("lines"), params.get("zones"))
+    geometry = [g["points"] for g in lines + zones]
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError("Video açılamadı")
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    gate = FrameGate(params.get("inference_mode", "full"), params.get("inference_stride", 1),
+                     geometry=geometry, frame_size=(width, height), fps=fps)
+    region = RegionDetector.from_params(params, geometry, (width, height))
+    # Model worker boyunca kiralı kalır; oturum kapatılmaz (close kirayı bırakırdı)
+    session = TrackerSession(_worker_entry, params["tracker_name"], frame_rate=gate.tracker_frame_rate())
+    names = session.names
+    counter = CountingEngine(lines, zones, selected_class_ids=params.get("selected_class_ids"), fps=fps)
+    conf, iou = params["conf_threshold"], params["iou_threshold"]
+    job_id = params["job_id"]
+    rows = []
+
+    def submit(frame):
+        if region is not None:
+            return region.submit(frame, lambda crop: session.submit(crop, conf, iou))
+        return session.submit(frame, conf, iou)
+
+    def resolve(pending):
+        frame_no, future = pending.popleft()
+        result = session.update(future.result())
+        if not result.boxes or result.boxes.id is None:
+            return
+        boxes = result.boxes.cpu().numpy()
+        for event in counter.update(boxes.xyxy, boxes.id, boxes.cls, frame_index=frame_no):
+            if event["type"] != "line_crossed":
+                continue
+            rows.append({
+                "job_id": job_id,
+                "video_name": os.path.basename(path),
+                "model_used": params["model_name"],
+                "tracker_used": params["tracker_name"],
+                "object_id": event["track_id"],
+                "object_label": names[event["cls"]],
+                "line_name": event["line"],
+                "direction": event["direction"],
+                "timestamp": datetime.now(),
+                "current_total_count": event["total_count"],
+            })
+
+    # Birkaç kare önceden gönderilir; batch scheduler bunları tek predict çağrısında işler
+    pending = deque()
+    frames = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames += 1
+            if gate.should_detect(frame):
+                pending.append((frames, submit(frame)))
+                if len(pending) >= BATCH_MAX_SIZE:
+                    resolve(pending)
+        while pending:
+            resolve(pending)
+    finally:
+        cap.release()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "job_id": job_id,
+        "path": path,
+        "video_name": os.path.basename(path),
+        "final_count": counter.total_count,
+        "counts": counter.summary(names),
+        "geometry": {"lines": lines, "zones": zones},
+        "inference": gate.stats(),
+        "frames": frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed else None,
+        "start_time": started_at,
+        "end_time": datetime.now(),
+        "rows": rows,
+    }
+
+
+# --- Ana süreç ---
+
+async def write_results(results: list[dict]):
+    """Biten dosyaların genel sayım ve tespit kayıtlarını tek işlemde toplu yazar."""
+    from sqlalchemy.sql import insert
+    from database.config import database
+    from database.models import OverallCount
+    from detection_writer import insert_detection_rows
+
+    if not results:
+        return
+    rows = [row for r in results for row in r["rows"]]
+    async with database.transaction():
+        await database.execute(insert(OverallCount).values([
+            {
+                "video_name": r["video_name"],
+                "model_used": r["params"]["model_name"],
+                "tracker_used": r["params"]["tracker_name"],
+                "final_count": r["final_count"],
+                "start_time": r["start_time"],
+                "end_time": r["end_time"],
+                "line_coordinates": json.dumps(r["params"]["line_coordinates"]),
+                "count_details": json.dumps({"geometry": r["geometry"], "inference": r["inference"],
+                                             "job_id": r["job_id"], "batch_id": r["batch_id"], **r["counts"]}),
+            } for r in results
+        ]))
+        if rows:
+            await insert_detection_rows(rows)
+
+
+class BatchRun:
+    """
+    Bir toplu sayım çalıştırması: dosyaları süreç havuzuna dağıtır,
+    ilerlemeyi tutar ve sonuçları parça parça veritabanına yazar.
+    """
+
+    def __init__(self, items: list[dict], params: dict, workers: int = None, write_db: bool = True):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        # İstenen sayı çekirdek/bellek sınırını aşamaz (her worker modeli ayrıca yükler)
+        limit = default_workers(len(items))
+        self.workers = max(1, min(workers, limit)) if workers else limit
+        self.write_db = write_db
+        self.status = "queued"
+        # temporary: HTTP ile yüklenen, işlendikten sonra silinecek dosya
+        self.files = [{"path": item["path"], "temporary": bool(item.get("temporary")),
+                       "overrides": {k: v for k, v in item.items() if k not in ("path", "temporary")},
+                       "status": "queued", "result": None, "error": None} for item in items]
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self._executor = None
+
+    def _file_params(self, file: dict) -> dict:
+        return {**self.params, **file["overrides"], "job_id": uuid.uuid4().hex}
+
+    async def run(self):
+        from model_manager import resolve_model_path
+
+        loop = asyncio.get_running_loop()
+        self.status = "running"
+        self.started_at = time.time()
+        backend = self.params["backend"]
+        # Dışa aktarma/indirme worker'lar başlamadan bir kez yapılır; worker'lar önbellekten yükler
+        await asyncio.to_thread(_prepare_model, resolve_model_path(self.params["model_name"]), backend)
+
+        cpus = os.cpu_count() or 1
+        threads = max(1, cpus // self.workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(self.params["model_name"], backend, threads))
+        pending_writes = []
+
+        async def run_one(file: dict):
+            params = self._file_params(file)
+            try:
+                result = await loop.run_in_executor(self._executor, _process_file, file["path"], params)
+            except asyncio.CancelledError:
+                if not self.cancel_requested:
+                    raise
+                return file, params, None, None
+            except Exception as e:
+                return file, params, None, e
+            return file, params, result, None
+
+        tasks = [asyncio.ensure_future(run_one(file)) for file in self.files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                file, params, result, error = await next_done
+                if error is not None:
+                    file["status"], file["error"] = "failed", str(error)
+                    continue
+                if result is None:
+                    continue
+                result.update(params=params, batch_id=self.id)
+                file["status"] = "completed"
+                file["result"] = {k: v for k, v in result.items()
+                                  if k not in ("rows", "params", "geometry", "start_time", "end_time")}
+                file["result"]["detections"] = len(result["rows"])
+                pending_writes.append(result)
+                if file["temporary"]:
+                    _remove(file["path"])
+                if self.write_db and len(pending_writes) >= BATCH_DB_FLUSH_FILES:
+                    await write_results(pending_writes)
+                    pending_writes = []
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            for task in tasks:
+                task.cancel()
+            if self.write_db:
+                await write_results(pending_writes)
+            for file in self.files:
+                if file["temporary"]:
+                    _remove(file["path"])
+                if file["status"] == "queued":
+                    file["status"] = "cancelled"
+            self.finished_at = time.time()
+            self.status = "cancelled" if self.cancel_requested else "completed"
+
+    def cancel(self):
+        self.cancel_requested = True
+        if self._executor is not None:
+            # Başlamamış dosyalar iptal edilir, çalışanlar bitince havuz kapanır
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def to_dict(self, include_files: bool = True) -> dict:
+        done = [f for f in self.files if f["status"] == "completed"]
+        frames = sum(f["result"]["frames"] for f in done)
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        summary = {
+            "batch_id": self.id,
+            "status": self.status,
+            "workers": self.workers,
+            "files_total": len(self.files),
+            "files_completed": len(done),
+            "files_failed": sum(f["status"] == "failed" for f in self.files),
+            "total_count": sum(f["result"]["final_count"] for f in done),
+            "frames": frames,
+            "seconds": round(elapsed, 3),
+            # Toplam kare/sn (tüm worker'lar) ve dakikada biten dosya
+            "throughput_fps": round(frames / elapsed, 2) if elapsed else None,
+            "files_per_minute": round(len(done) / elapsed * 60, 2) if elapsed else None,
+        }
+        if include_files:
+            summary["files"] = [{"path": os.path.basename(f["path"]) if f["temporary"] else f["path"],
+                                 "status": f["status"], "error": f["error"], "result": f["result"]}
+                                for f in self.files]
+        return summary
+
+
+def _prepare_model(model_path: str, backend: str):
+    from model_export import export_model
+    if backend != "pytorch":
+        export_model(model_path, backend)
+    elif not model_path.startswith("memory://") and not os.path.exists(model_path):
+        # Hazır modeller worker'lar aynı anda indirmeye çalışmasın diye önceden indirilir
+        from ultralytics import YOLO
+        YOLO(model_path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class BatchManager:
+    """Toplu çalıştırmaları sırayla yürütür (aynı anda tek havuz, çekirdekler paylaşılmaz)."""
+
+    def __init__(self):
+        self.batches: dict[str, BatchRun] = {}
+        self._lock = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, batch: BatchRun) -> BatchRun:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        self.batches[batch.id] = batch
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return batch
+
+    async def _run(self, batch: BatchRun):
+        async with self._lock:
+            if batch.cancel_requested:
+                batch.status = "cancelled"
+                return
+            try:
+                await batch.run()
+            except Exception as e:
+                batch.status = "failed"
+                print(f"Toplu iş {batch.id} başarısız: {e}")
+
+    def get(self, batch_id: str) -> BatchRun:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Toplu iş bulunamadı")
+        return batch
+
+    async def stop(self):
+        for batch in self.batches.values():
+            batch.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Uygulama genelinde kullanılacak tekil toplu iş yöneticisi
+batch_manager = BatchManager()
+
+
+# --- Komut satırı ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kayıtlı videoları toplu olarak sayar")
+    parser.add_argument("files", nargs="*", help="video dosyaları")
+    parser.add_argument("--dir", help="videoların bulunduğu dizin")
+    parser.add_argument("--pattern", help="dizinde eşleşecek dosyalar (ör. '*.mp4')")
+    parser.add_argument("--manifest", help="JSON ya da satır başına bir yol içeren manifest dosyası")
+    parser.add_argument("--model", default="yolov8n")
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--tracker", default="bytetrack")
+    parser.add_argument("--line-coordinates", default="[[0,0],[0,0]]")
+    parser.add_argument("--lines", default="[]", help='ör. \'[{"name": "giris", "points": [[x1, y1], [x2, y2]]}]\'')
+    parser.add_argument("--zones", default="[]")
+    parser.add_argument("--classes", default="[]", help="sayılacak sınıf ID'leri (JSON liste)")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--inference-mode", default=None)
+    parser.add_argument("--inference-stride", type=int, default=None)
+    parser.add_argument("--roi", default="full")
+    parser.add_argument("--tile", action="store_true")
+    parser.add_argument("--workers", type=int, default=None, help="varsayılan: çekirdek/bellek durumuna göre")
+    parser.add_argument("--no-db", dest="write_db", action="store_false", help="sonuçları veritabanına yazma")
+    parser.add_argument("--output", help="sonuçların yazılacağı JSON dosyası")
+    return parser.parse_args(argv)
+
+
+def collect_items(files: list[str], directory: str = None, pattern: str = None,
+                  manifest: str = None) -> list[dict]:
+    items = [{"path": os.path.realpath(p)} for p in files]
+    if directory:
+        items += list_directory(directory, pattern)
+    if manifest:
+        with open(manifest) as f:
+            items += parse_manifest(f.read(), os.path.dirname(os.path.abspath(manifest)))
+    missing = [i["path"] for i in items if not os.path.isfile(i["path"])]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Dosya bulunamadı: {', '.join(missing)}")
+    return items
+
+
+async def main_async(args) -> dict:
+    from video_service import build_job_params
+    from model_export import resolve_backend
+    from model_manager import resolve_model_path
+
+    items = collect_items(args.files, args.dir, args.pattern, args.manifest)
+    if not items:
+        raise HTTPException(status_code=400, detail="İşlenecek video yok")
+    params = build_job_params(args.model, args.tracker, args.line_coordinates, args.conf, args.iou,
+                              args.classes, args.lines, args.zones, preview_fps=0,
+                              inference_mode=args.inference_mode, inference_stride=args.inference_stride,
+                              roi=args.roi, tile=args.tile, backend=args.backend, renderer="none")
+    params["backend"] = resolve_backend(params["backend"], resolve_model_path(args.model))
+
+    if args.write_db:
+        from database.config import connect_db, disconnect_db, create_db_tables
+        await connect_db()
+        await create_db_tables()
+    try:
+        batch = BatchRun(items, params, workers=args.workers, write_db=args.write_db)
+        print(f"{len(items)} video, {batch.workers} worker ile işleniyor...")
+        await batch.run()
+    finally:
+        if args.write_db:
+            await disconnect_db()
+    return batch.to_dict()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+    try:
+        report = asyncio.run(main_async(args))
+    except HTTPException as e:
+        print(f"Hata: {e.detail}")
+        sys.exit(2)
+
+    for f in report["files"]:
+        if f["status"] == "completed":
+            r = f["result"]
+            print(f"{f['path']}: {r['final_count']} ({r['frames']} kare, {r['fps']} FPS)")
+        else:
+            print(f"{f['path']}: {f['status']} {f['error'] or ''}")
+    print(f"Toplam: {report['total_count']} | {report['files_completed']}/{report['files_total']} dosya, "
+          f"{report['seconds']} sn, {report['throughput_fps']} FPS")
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=2, default=str)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from video_service import build_job_params
+from model_export import resolve_backend
+from model_manager import resolve_model_path
+from job_manager import job_source_path
+from uploads import save_upload_file
+from batch import BatchRun, batch_manager, list_directory, parse_manifest, BATCH_INPUT_ROOT
+import uuid
+import asyncio
+
+router = APIRouter()
+
+
+@router.post("/batches")
+async def submit_batch(
+    video_files: list[UploadFile] = File(None),
+    directory: str = Form(None),
+    pattern: str = Form(None),
+    manifest: UploadFile = File(None),
+    workers: int = Form(None, ge=1),
+    model_name: str = Form("yolov8n"),
+    tracker_name: str = Form("bytetrack"),
+    line_coordinates: str = Form("[[0,0],[0,0]]"),
+    conf_threshold: float = Form(0.25),
+    iou_threshold: float = Form(0.7),
+    selected_class_ids: str = Form("[]"),
+    lines: str = Form("[]"),
+    zones: str = Form("[]"),
+    inference_mode: str = Form(None),
+    inference_stride: int = Form(None),
+    roi: str = Form("full"),
+    tile: bool = Form(False),
+    backend: str = Form("auto")
+):
+    """
+    Birden çok videoyu süreç havuzunda yalnızca sayım modunda işler.
+    Videolar yüklenebilir ya da BATCH_INPUT_ROOT altındaki bir dizin veya
+    manifest (JSON liste / satır başına yol) ile verilebilir. İlerleme ve
+    dosya bazlı sonuçlar GET /batches/{batch_id} ile izlenir.
+    """
+    params = build_job_params(model_name, tracker_name, line_coordinates, conf_threshold,
+                              iou_threshold, selected_class_ids, lines, zones, preview_fps=0,
+                              inference_mode=inference_mode, inference_stride=inference_stride,
+                              roi=roi, tile=tile, backend=backend, renderer="none")
+    params["backend"] = await asyncio.to_thread(resolve_backend, params["backend"], resolve_model_path(model_name))
+
+    if (directory or manifest) and not BATCH_INPUT_ROOT:
+        raise HTTPException(status_code=400, detail="Sunucu dizinleri için BATCH_INPUT_ROOT tanımlı değil")
+    items = []
+    if directory:
+        items += list_directory(directory, pattern, root=BATCH_INPUT_ROOT)
+    if manifest is not None:
+        text = (await manifest.read()).decode("utf-8", errors="replace")
+        items += parse_manifest(text, BATCH_INPUT_ROOT, root=BATCH_INPUT_ROOT)
+    for video_file in video_files or []:
+        path = job_source_path(uuid.uuid4().hex, video_file.filename)
+        await save_upload_file(video_file, path)
+        items.append({"path": path, "temporary": True})
+    if not items:
+        raise HTTPException(status_code=400, detail="İşlenecek video yok")
+
+    batch = batch_manager.submit(BatchRun(items, params, workers=workers))
+    return batch.to_dict()
+
+
+@router.get("/batches")
+async def list_batches():
+    return {"batches": [b.to_dict(include_files=False) for b in batch_manager.batches.values()]}
+
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    return batch_manager.get(batch_id).to_dict()
+
+
+@router.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    batch = batch_manager.get(batch_id)
+    batch.cancel()
+    return batch.to_dict(include_files=False)
@@ -0,0 +1,255 @@
+"""
+Video sayım hattı için benchmark ve profil aracı.
+
+Gerçek iş akışını (run_video_job: decode -> inference -> takip -> sayım ->
+çizim -> JPEG -> VideoWriter -> DB -> yayın) sentetik ya da verilen bir klip
+üzerinde 1..N eşzamanlı işle çalıştırır. Varsayılan olarak ağırlık
+indirmeyen, parlak nesneleri bulan sahte bir model kullanır; böylece CPU
+üzerinde ve çevrimdışı çalışır.
+
+Örnek:
+    python benchmark.py --jobs 1 2 4 --frames 300 --output bench.json
+    python benchmark.py --model yolov8n --clip deneme.mp4 --jobs 1
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import timeit
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+
+import cv2
+import numpy as np
+
+STUB_MODEL = "benchmark-stub"
+
+
+class StubModel:
+    """
+    Parlak dikdörtgenleri tespit eden sahte YOLO modeli. Çıktısı gerçek
+    ultralytics Results nesneleridir; takip ve çizim adımları değişmeden çalışır.
+    """
+
+    names = {0: "person"}
+    task = "detect"
+
+    def predict(self, source, conf: float = 0.25, iou: float = 0.7, verbose: bool = False, **kwargs):
+        import torch
+        from ultralytics.engine.results import Results
+
+        frames = source if isinstance(source, list) else [source]
+        results = []
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+            n, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+            boxes = [[x, y, x + w, y + h, 0.9, 0] for x, y, w, h, area in stats[1:n] if area >= 16]
+            data = torch.as_tensor(np.asarray(boxes, dtype=np.float32).reshape(-1, 6))
+            results.append(Results(orig_img=frame, path="", names=self.names, boxes=data))
+        return results
+
+
+def make_synthetic_clip(path: str, frames: int, width: int, height: int, objects: int, fps: float = 30.0):
+    """Soldan sağa, dikey sayım çizgisini geçen beyaz kutulardan oluşan klip üretir."""
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    size = max(12, height // 12)
+    lanes = np.linspace(size, height - 2 * size, max(1, objects)).astype(int)
+    speeds = rng.uniform(2, 6, objects) * width / 640
+    offsets = rng.uniform(0, width, objects)
+    for i in range(frames):
+        frame = background.copy()
+        for lane, speed, offset in zip(lanes, speeds, offsets):
+            x = int((offset + i * speed) % (width + size)) - size
+            cv2.rectangle(frame, (x, lane), (x + size, lane + size), (255, 255, 255), -1)
+        out.write(frame)
+    out.release()
+
+
+def peak_rss_mb() -> float:
+    # Linux'ta KB, macOS'ta bayt döner
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+async def run_scenario(args, clip: str, concurrency: int, width: int) -> dict:
+    import metrics
+    from job_manager import JobState
+    from video_service import build_job_params, run_video_job
+
+    lines = json.dumps([{"name": "center", "points": [[width // 2, 0], [width // 2, 10**5]]}])
+    params = build_job_params(args.model, args.tracker, "[[0,0],[0,0]]", 0.25, 0.7, "[]", lines, "[]",
+                              preview_fps=0, inference_mode=args.inference_mode,
+                              inference_stride=args.inference_stride, backend=args.backend,
+                              sink=args.sink, renderer=args.renderer)
+
+    jobs = [JobState(f"bench{concurrency}_{i}", os.path.basename(clip), params, clip)
+            for i in range(concurrency)]
+
+    async def watch(job):
+        # Bir izleyici varmış gibi önizlemeyi tüketir; imencode ölçüme girer
+        async for _ in job.preview():
+            pass
+
+    watchers = [asyncio.create_task(watch(job)) for job in jobs] if args.preview else []
+    metrics.reset()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_video_job(job) for job in jobs))
+    wall = time.perf_counter() - started
+    for job in jobs:
+        job.done.set()
+    await asyncio.gather(*watchers, return_exceptions=True)
+
+    frames = sum(r["frames_processed"] for r in results)
+    stages = metrics.snapshot()
+    return {
+        "concurrency": concurrency,
+        "frames": frames,
+        "wall_seconds": round(wall, 4),
+        "fps_total": round(frames / wall, 2) if wall else None,
+        "fps_per_job": round(frames / wall / concurrency, 2) if wall else None,
+        "frame_latency_ms": {k: stages.get("frame_latency", {}).get(k) for k in ("p50_ms", "p99_ms", "max_ms")},
+        "final_counts": [r["final_count"] for r in results],
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": stages,
+    }
+
+
+def run_micro_benchmarks(number: int) -> dict:
+    """Sayım hattının sıcak noktaları için mikro benchmark'lar (çağrı başına ns)."""
+    from utils import check_line_crossing, segments_intersect
+    from counting import CountingEngine
+
+    results = {}
+    line = ((320, 0), (320, 480))
+    cases = {"crossing": ((300, 100), (340, 110)), "no_crossing": ((100, 100), (140, 110))}
+    for name, (p1, p2) in cases.items():
+        t = timeit.timeit(lambda: check_line_crossing(p1, p2, *line), number=number)
+        results[f"check_line_crossing_{name}_ns"] = round(t / number * 1e9, 1)
+
+    rng = np.random.default_rng(0)
+    n = 10_000
+    p1, p2 = rng.uniform(0, 640, (n, 2)), rng.uniform(0, 640, (n, 2))
+    repeat = max(1, number // 1000)
+    t = timeit.timeit(lambda: segments_intersect(p1, p2, np.array(line[0]), np.array(line[1])), number=repeat)
+    results["segments_intersect_per_segment_ns"] = round(t / repeat / n * 1e9, 2)
+
+    tracks, steps = 50, 500
+    engine = CountingEngine([{"name": "center", "points": list(line)}], fps=30)
+    ids = np.arange(1, tracks + 1, dtype=np.float64)
+    cls = np.zeros(tracks)
+    y = rng.uniform(0, 440, tracks)
+    start = time.perf_counter()
+    for step in range(steps):
+        x = (np.arange(tracks) * 13 + step * 3) % 640
+        xyxy = np.stack([x, y, x + 20, y + 40], axis=1)
+        engine.update(xyxy, ids, cls)
+    results[f"counting_engine_update_{tracks}_tracks_us"] = round((time.perf_counter() - start) / steps * 1e6, 2)
+    return results
+
+
+async def main_async(args) -> dict:
+    from database.config import connect_db, disconnect_db, create_db_tables
+    from detection_writer import detection_writer
+    from model_manager import register_in_memory_model
+
+    if args.model == STUB_MODEL:
+        register_in_memory_model(STUB_MODEL, StubModel())
+
+    clip = args.clip
+    if clip is None:
+        clip = os.path.join(args.workdir, "synthetic.mp4")
+        make_synthetic_clip(clip, args.frames, args.width, args.height, args.objects)
+    cap = cv2.VideoCapture(clip)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    cap.release()
+
+    await connect_db()
+    await create_db_tables()
+    await detection_writer.start()
+    scenarios = []
+    try:
+        for concurrency in args.jobs:
+            scenario = await run_scenario(args, clip, concurrency, width)
+            scenarios.append(scenario)
+            print(f"{concurrency} iş: {scenario['fps_total']} FPS toplam, "
+                  f"p50 {scenario['frame_latency_ms']['p50_ms']} ms, "
+                  f"p99 {scenario['frame_latency_ms']['p99_ms']} ms, "
+                  f"tepe RSS {scenario['peak_rss_mb']} MB")
+    finally:
+        await detection_writer.stop()
+        await disconnect_db()
+    return {"clip": clip if args.clip else "synthetic", "scenarios": scenarios}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Video sayım hattı benchmark aracı")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1], help="eşzamanlı iş sayıları (ör. 1 2 4)")
+    parser.add_argument("--frames", type=int, default=300, help="sentetik klip kare sayısı")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--objects", type=int, default=4, help="sentetik klipteki nesne sayısı")
+    parser.add_argument("--clip", help="sentetik klip yerine kullanılacak video")
+    parser.add_argument("--model", default=STUB_MODEL, help="model adı (varsayılan: çevrimdışı sahte model)")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--tracker", default="bytetrack")
+    parser.add_argument("--inference-mode", default="full")
+    parser.add_argument("--inference-stride", type=int, default=1)
+    parser.add_argument("--sink", default="auto", help="çıktı hedefi: auto, ffmpeg, opencv, null")
+    parser.add_argument("--renderer", default="plot", help="çizim modu: plot, overlay, none")
+    parser.add_argument("--no-preview", dest="preview", action="store_false", help="önizleme kodlamasını ölçme")
+    parser.add_argument("--micro-number", type=int, default=100_000, help="mikro benchmark tekrar sayısı")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--output", help="sonuçların yazılacağı JSON dosyası")
+    parser.add_argument("--database-url", help="kayıtların yazılacağı veritabanı (varsayılan: geçici SQLite)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.clip = os.path.abspath(args.clip) if args.clip else None
+    output = os.path.abspath(args.output) if args.output else None
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+
+    args.workdir = tempfile.mkdtemp(prefix="bench_")
+    # Çıktı videoları ve veritabanı geçici dizinde tutulur, üretim verisine dokunulmaz;
+    # ortamdaki DATABASE_URL (ör. konteynerdeki PostgreSQL) yalnızca --database-url ile kullanılır
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+    cwd = os.getcwd()
+    os.chdir(args.workdir)
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                     "cpus": os.cpu_count(), "opencv": cv2.__version__},
+        "config": {k: v for k, v in vars(args).items() if k not in ("workdir", "database_url")},
+    }
+    try:
+        if not args.skip_micro:
+            report["micro"] = run_micro_benchmarks(args.micro_number)
+            for name, value in report["micro"].items():
+                print(f"{name}: {value}")
+        if not args.skip_pipeline:
+            report["pipeline"] = asyncio.run(main_async(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Sonuçlar yazıldı: {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import numpy as np
+from utils import segments_intersect, orientations
+
+DIRECTIONS = ("in", "out")
+
+
+def _polygon_edges(zones):
+    """Tüm bölgelerin kenarlarını tek dizide toplar; her bölgenin kenar başlangıç indeksini döndürür."""
+    starts, a, b = [], [], []
+    for poly in zones:
+        starts.append(len(a))
+        a.extend(poly)
+        b.extend(np.roll(poly, -1, axis=0))
+    return (np.asarray(a, dtype=np.float64).reshape(-1, 2),
+            np.asarray(b, dtype=np.float64).reshape(-1, 2),
+            np.asarray(starts, dtype=np.int64))
+
+
+class CountingEngine:
+    """
+    Bir karedeki tüm kutuları tek seferde işleyen vektörel sayım motoru.
+
+    - Çizgiler: Her (track, çizgi) çifti ilk geçişte bir kez sayılır. Yön,
+      p1 -> p2 doğrultusuna göre belirlenir: saat yönü tarafına geçiş "in",
+      diğer taraf "out". Sayımlar çizgi ve sınıf bazında tutulur.
+    - Bölgeler: Çokgen içindeki nesneler (anlık doluluk), giriş/çıkış
+      sayıları ve bölgede kalma süreleri tutulur.
+
+    Tüm çizgi ve bölgeler her karede tek bir NumPy işlemiyle değerlendirilir;
+    track ID -> son konum durumu sıralı diziler halinde tutulur.
+    """
+
+    def __init__(self, lines=None, zones=None, selected_class_ids=None,
+                 fps: float = 30.0, stale_after: int = 600):
+        # lines: [{"name": str, "points": [[x1, y1], [x2, y2]]}, ...]
+        # zones: [{"name": str, "points": [[x, y], ...]}, ...]
+        lines = lines or []
+        zones = zones or []
+        self.line_names = [l["name"] for l in lines]
+        self.lines = np.asarray([l["points"] for l in lines], dtype=np.int64).reshape(-1, 2, 2)
+        self.zone_names = [z["name"] for z in zones]
+        self.zones = [np.asarray(z["points"], dtype=np.float64).reshape(-1, 2) for z in zones]
+        self._edge_a, self._edge_b, self._edge_starts = _polygon_edges(self.zones)
+
+        self.selected_class_ids = (np.asarray(selected_class_ids, dtype=np.int64)
+                                   if selected_class_ids else None)
+        self.fps = fps or 30.0
+        # Bu kadar (kaynak videoda) kare görülmeyen track'ler durumdan silinir (tracker ID'leri yeniden kullanmaz)
+        self.stale_after = stale_after
+        self.total_count = 0
+        # Kaynak videodaki kare numarası; süreler ve eskime buna göre hesaplanır
+        self.frame_index = 0
+        self._pruned_at = 0
+
+        n_lines, n_zones = len(self.lines), len(self.zones)
+        # Çizgi x sınıf x yön sayımları; sınıf ekseni yeni sınıf görüldükçe büyür
+        self._line_counts = np.zeros((n_lines, 0, 2), dtype=np.int64)
+        self._zone_entries = np.zeros(n_zones, dtype=np.int64)
+        self._zone_exits = np.zeros(n_zones, dtype=np.int64)
+        self._dwell_total = np.zeros(n_zones, dtype=np.float64)
+        self._dwell_max = np.zeros(n_zones, dtype=np.float64)
+
+        self._ids = np.empty(0, dtype=np.int64)
+        self._cls = np.empty(0, dtype=np.int64)
+        self._pos = np.empty((0, 2), dtype=np.int64)
+        self._last_seen = np.empty(0, dtype=np.int64)
+        self._crossed = np.empty((0, n_lines), dtype=bool)
+        self._inside = np.empty((0, n_zones), dtype=bool)
+        self._entered_at = np.empty((0, n_zones), dtype=np.int64)
+
+    @property
+    def track_count(self) -> int:
+        return len(self._ids)
+
+    def update(self, xyxy, ids, cls, frame_index: int = None) -> list[dict]:
+        """
+        xyxy: (N, 4), ids: (N,), cls: (N,) dizileri.
+        frame_index: karenin kaynak videodaki numarası. Tespit her karede
+        yapılmıyorsa (stride/motion, canlı akışta atılan kareler) verilmelidir;
+        verilmezse her çağrı bir kare sayılır.
+        Bu karede oluşan sayım ve bölge giriş/çıkış olaylarını döndürür.
+        """
+        self.frame_index = self.frame_index + 1 if frame_index is None else int(frame_index)
+        events = []
+
+        if ids is None or len(ids) == 0:
+            self._prune(events)
+            return events
+
+        boxes = np.asarray(xyxy).astype(np.int64).reshape(-1, 4)
+        ids = np.asarray(ids).astype(np.int64).reshape(-1)
+        cls = np.asarray(cls).astype(np.int64).reshape(-1)
+
+        if self.selected_class_ids is not None:
+            keep = np.isin(cls, self.selected_class_ids)
+            boxes, ids, cls = boxes[keep], ids[keep], cls[keep]
+            if len(ids) == 0:
+                self._prune(events)
+                return events
+
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2], axis=1)
+
+        # Yeni track'leri sıralı dizilere ekle, ardından tüm kutuların yuvasını bul
+        slot = np.searchsorted(self._ids, ids)
+        known = slot < len(self._ids)
+        known[known] = self._ids[slot[known]] == ids[known]
+        if not known.all():
+            self._insert_tracks(ids[~known], cls[~known], centers[~known])
+            slot = np.searchsorted(self._ids, ids)
+
+        if len(self.lines) and known.any():
+            self._update_lines(np.flatnonzero(known), slot, boxes, ids, cls, centers, events)
+
+        if self.zones:
+            self._update_zones(slot, ids, cls, centers, events)
+
+        self._pos[slot] = centers
+        self._cls[slot] = cls
+        self._last_seen[slot] = self.frame_index
+        self._prune(events)
+        return events
+
+    def _insert_tracks(self, ids, cls, centers):
+        new_ids, first = np.unique(ids, return_index=True)
+        at = np.searchsorted(self._ids, new_ids)
+        self._ids = np.insert(self._ids, at, new_ids)
+        self._cls = np.insert(self._cls, at, cls[first])
+        self._pos = np.insert(self._pos, at, centers[first], axis=0)
+        self._last_seen = np.insert(self._last_seen, at, self.frame_index)
+        self._crossed = np.insert(self._crossed, at, False, axis=0)
+        self._inside = np.insert(self._inside, at, False, axis=0)
+        self._entered_at = np.insert(self._entered_at, at, 0, axis=0)
+
+    def _update_lines(self, rows, slot, boxes, ids, cls, centers, events):
+        prev = self._pos[slot[rows]][:, None, :]
+        cur = centers[rows][:, None, :]
+        p1 = self.lines[None, :, 0, :]
+        p2 = self.lines[None, :, 1, :]
+        hits = segments_intersect(prev, cur, p1, p2) & ~self._crossed[slot[rows]]
+        if not hits.any():
+            return
+
+        self._crossed[slot[rows]] |= hits
+        # Yön: nesnenin çizgiye göre hangi taraftan hangi tarafa geçtiği
+        side_change = orientations(p1, p2, cur) - orientations(p1, p2, prev)
+        hit_rows, hit_lines = np.nonzero(hits)
+        direction = (side_change[hit_rows, hit_lines] <= 0).astype(np.int64)  # 0 -> in, 1 -> out
+        hit_cls = cls[rows[hit_rows]]
+
+        n_cls = int(hit_cls.max()) + 1
+        if n_cls > self._line_counts.shape[1]:
+            grow = n_cls - self._line_counts.shape[1]
+            self._line_counts = np.pad(self._line_counts, ((0, 0), (0, grow), (0, 0)))
+        np.add.at(self._line_counts, (hit_lines, hit_cls, direction), 1)
+
+        for r, line_idx, d in zip(hit_rows, hit_lines, direction):
+            i = rows[r]
+            self.total_count += 1
+            events.append({
+                "type": "line_crossed",
+                "track_id": int(ids[i]),
+                "cls": int(cls[i]),
+                "line": self.line_names[line_idx],
+                "direction": DIRECTIONS[d],
+                "box": tuple(int(v) for v in boxes[i]),
+                "total_count": self.total_count,
+            })
+
+    def _update_zones(self, slot, ids, cls, centers, events):
+        # Işın yöntemi: tüm noktalar x tüm bölge kenarları tek matriste
+        px = centers[:, None, 0].astype(np.float64)
+        py = centers[:, None, 1].astype(np.float64)
+        ax, ay = self._edge_a[None, :, 0], self._edge_a[None, :, 1]
+        bx, by = self._edge_b[None, :, 0], self._edge_b[None, :, 1]
+        straddle = (ay > py) != (by > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = ax + (py - ay) * (bx - ax) / (by - ay)
+        crossings = straddle & (px < x_cross)
+        inside_now = (np.add.reduceat(crossings.astype(np.int64), self._edge_starts, axis=1) % 2) == 1
+
+        was_inside = self._inside[slot]
+        entered = inside_now & ~was_inside
+        exited = was_inside & ~inside_now
+
+        if entered.any():
+            self._entered_at[slot] = np.where(entered, self.frame_index, self._entered_at[slot])
+            self._zone_entries += entered.sum(axis=0)
+            for i, z in zip(*np.nonzero(entered)):
+                events.append({"type": "zone_entered", "track_id": int(ids[i]), "cls": int(cls[i]),
+                               "zone": self.zone_names[z]})
+        if exited.any():
+            dwell = (self.frame_index - self._entered_at[slot]) / self.fps
+            self._record_exits(exited, dwell)
+            for i, z in zip(*np.nonzero(exited)):
+                events.append({"type": "zone_exited", "track_id": int(ids[i]), "cls": int(cls[i]),
+                               "zone": self.zone_names[z], "dwell_seconds": float(dwell[i, z])})
+
+        self._inside[slot] = inside_now
+
+    def _record_exits(self, exited, dwell):
+        self._zone_exits += exited.sum(axis=0)
+        self._dwell_total += np.where(exited, dwell, 0.0).sum(axis=0)
+        self._dwell_max = np.maximum(self._dwell_max, np.where(exited, dwell, 0.0).max(axis=0))
+
+    def _prune(self, events):
+        # Her karede değil, yalnızca periyodik olarak temizlik yapılır
+        if self.frame_index - self._pruned_at < 64 or not len(self._ids):
+            return
+        self._pruned_at = self.frame_index
+        alive = self.frame_index - self._last_seen <= self.stale_after
+        if alive.all():
+            return
+        if self.zones:
+            # Kaybolan ve bölgede görünen track'ler son görüldükleri anda çıkmış sayılır
+            gone = self._inside & ~alive[:, None]
+            if gone.any():
+                self._record_exits(gone, (self._last_seen[:, None] - self._entered_at) / self.fps)
+        self._ids = self._ids[alive]
+        self._cls = self._cls[alive]
+        self._pos = self._pos[alive]
+        self._last_seen = self._last_seen[alive]
+        self._crossed = self._crossed[alive]
+        self._inside = self._inside[alive]
+        self._entered_at = self._entered_at[alive]
+
+    def line_totals(self):
+        """Çizgi başına [in, out] toplamları (N, 2); kare üzerine etiket çizmek için."""
+        return self._line_counts.sum(axis=1)
+
+    def zone_occupancy(self) -> list[int]:
+        """Her bölgede şu an (son görüldüğü konuma göre) bulunan nesne sayısı."""
+        if not self.zones:
+            return []
+        return [int(v) for v in self._inside.sum(axis=0)]
+
+    def state(self) -> dict:
+        """
+        Checkpoint için toplam sayımlar. Track bazlı durum dahil edilmez; iş
+        yeniden başladığında takipçi de sıfırdan başlar.
+        """
+        return {
+            "frame_index": self.frame_index,
+            "total_count": self.total_count,
+            "line_counts": self._line_counts.tolist(),
+            "zone_entries": self._zone_entries.tolist(),
+            "zone_exits": self._zone_exits.tolist(),
+            "dwell_total": self._dwell_total.tolist(),
+            "dwell_max": self._dwell_max.tolist(),
+        }
+
+    def restore(self, state: dict):
+        self.frame_index = self._pruned_at = int(state.get("frame_index", 0))
+        self.total_count = int(state.get("total_count", 0))
+        if state.get("line_counts"):
+            self._line_counts = np.asarray(state["line_counts"], dtype=np.int64).reshape(len(self.lines), -1, 2)
+        for attr, key, dtype in (("_zone_entries", "zone_entries", np.int64), ("_zone_exits", "zone_exits", np.int64),
+                                 ("_dwell_total", "dwell_total", np.float64), ("_dwell_max", "dwell_max", np.float64)):
+            if state.get(key):
+                setattr(self, attr, np.asarray(state[key], dtype=dtype))
+
+    def summary(self, names=None) -> dict:
+        """Çizgi/sınıf/yön bazında sayımlar ve bölge istatistikleri."""
+        names = names or {}
+        lines = {}
+        for l, line_name in enumerate(self.line_names):
+            per_class = {}
+            for c in np.flatnonzero(self._line_counts[l].sum(axis=1)):
+                label = names.get(int(c), str(int(c)))
+                per_class[label] = {"in": int(self._line_counts[l, c, 0]),
+                                    "out": int(self._line_counts[l, c, 1])}
+            lines[line_name] = {"in": int(self._line_counts[l, :, 0].sum()),
+                                "out": int(self._line_counts[l, :, 1].sum()),
+                                "classes": per_class}
+
+        zones = {}
+        occupancy = self.zone_occupancy()
+        for z, zone_name in enumerate(self.zone_names):
+            exits = int(self._zone_exits[z])
+            zones[zone_name] = {
+                "occupancy": occupancy[z],
+                "entries": int(self._zone_entries[z]),
+                "exits": exits,
+                "avg_dwell_seconds": float(self._dwell_total[z] / exits) if exits else 0.0,
+                "max_dwell_seconds": float(self._dwell_max[z]),
+            }
+        return {"total_count": self.total_count, "lines": lines, "zones": zones}
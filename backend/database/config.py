@@ -1,5 +1,5 @@
 from databases import Database
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, inspect, text
 from .models import Base 
 import os
 
@@ -15,9 +15,35 @@ async def create_db_tables():
     print("Veritabanı tabloları oluşturuluyor...")
     # SQLAlchemy'nin MetaData'sını kullanarak tabloları oluşturuldu
     Base.metadata.create_all(engine)
+    _upgrade_existing_tables()
     print("Veritabanı tabloları oluşturuldu (veya zaten mevcut).")
 
 
+def _upgrade_existing_tables():
+    """
+    create_all mevcut tabloları değiştirmez; önceki sürümlerden kalan
+    tablolara sonradan eklenen boş geçilebilir kolonlar ve indeksler eklenir.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    print(f"Kolon eklendi: {table.name}.{column.name}")
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    # Büyük tablolarda bu işlem bir kez, açılışta sürebilir
+                    index.create(conn)
+                    print(f"İndeks oluşturuldu: {index.name}")
+
+
 async def connect_db():
     print("Veritabanına bağlanılıyor...")
     await database.connect()
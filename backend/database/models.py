@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import datetime
@@ -9,17 +9,48 @@ class DetectionRecord(Base):
     __tablename__ = "detection_records"
 
     id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), nullable=True) # Kaydı üreten iş (video_jobs.id)
     video_name = Column(String(255), nullable=False)
     model_used = Column(String(50), nullable=False)
     tracker_used = Column(String(50), nullable=False)
     object_id = Column(Integer, nullable=False)
     object_label = Column(String(50), nullable=False)
+    line_name = Column(String(100), nullable=True) # Geçişin sayıldığı çizgi
+    direction = Column(String(10), nullable=True) # "in" / "out"
     timestamp = Column(DateTime(timezone=True), default=func.now()) 
     current_total_count = Column(Integer, nullable=False, default=0)
 
+    # Geçmiş sorguları iş ya da sınıf bazında zaman aralığına göre süzer
+    __table_args__ = (
+        Index("ix_detection_records_job_time", "job_id", "timestamp"),
+        Index("ix_detection_records_label_time", "object_label", "timestamp"),
+    )
+
     def __repr__(self):
         return f"<DetectionRecord(id={self.id}, object_id={self.object_id}, label='{self.object_label}', timestamp='{self.timestamp}')>"
 
+class CountRollup(Base):
+    """İş, sınıf, çizgi ve yön bazında zaman kovası başına sayım (tespit yazılırken artırılır)."""
+    __tablename__ = "count_rollups"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String(32), nullable=False, default="")
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    object_label = Column(String(50), nullable=False)
+    line_name = Column(String(100), nullable=False, default="")
+    direction = Column(String(10), nullable=False, default="")
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "object_label", "line_name", "direction", "bucket_start",
+                         name="uq_count_rollups_key"),
+        Index("ix_count_rollups_time", "bucket_start"),
+        Index("ix_count_rollups_label_time", "object_label", "bucket_start"),
+    )
+
+    def __repr__(self):
+        return f"<CountRollup(job={self.job_id}, label='{self.object_label}', bucket='{self.bucket_start}', count={self.count})>"
+
 class OverallCount(Base):
     __tablename__ = "overall_counts"
 
@@ -32,6 +63,58 @@ class OverallCount(Base):
     end_time = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
     line_coordinates = Column(Text, nullable=True) # JSON string olarak
     processed_video_path = Column(String(255), nullable=True) # İşlenmiş videonun yolu
+    count_details = Column(Text, nullable=True) # Çizgi/bölge tanımları ve yön/sınıf bazlı sayımlar (JSON)
     
     def __repr__(self):
-        return f"<OverallCount(id={self.id}, video='{self.video_name}', final_count={self.final_count})>"
\ No newline at end of file
+        return f"<OverallCount(id={self.id}, video='{self.video_name}', final_count={self.final_count})>"
+
+class VideoJob(Base):
+    __tablename__ = "video_jobs"
+
+    id = Column(String(32), primary_key=True)
+    status = Column(String(20), nullable=False, index=True) # queued, running, completed, failed, cancelled
+    video_name = Column(String(255), nullable=False)
+    source_path = Column(String(512), nullable=True) # İş bitene kadar saklanan kaynak video
+    params = Column(Text, nullable=False) # İş parametreleri (JSON)
+    overall_count_id = Column(Integer, nullable=True)
+    frames_processed = Column(Integer, nullable=False, default=0)
+    total_frames = Column(Integer, nullable=False, default=0)
+    checkpoint = Column(Text, nullable=True) # Son kaydedilen sayım durumu (JSON)
+    result = Column(Text, nullable=True) # Bitmiş işin sonucu (JSON)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<VideoJob(id={self.id}, status='{self.status}', frames={self.frames_processed}/{self.total_frames})>"
+
+class ResultCache(Base):
+    """Video içerik özeti + iş parametreleri anahtarıyla saklanan tamamlanmış iş sonucu."""
+    __tablename__ = "result_cache"
+
+    cache_key = Column(String(64), primary_key=True)
+    video_hash = Column(String(64), nullable=False, index=True) # Yüklenen dosyanın SHA-256 özeti
+    job_id = Column(String(32), nullable=False) # Sonucu üreten iş
+    overall_count_id = Column(Integer, nullable=True)
+    result = Column(Text, nullable=False) # İş sonucu (JSON)
+    processed_video_path = Column(String(255), nullable=True)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<ResultCache(key={self.cache_key[:12]}, job={self.job_id}, hits={self.hits})>"
+
+class ProcessedVideo(Base):
+    """processed_videos dizinindeki çıktı dosyaları; saklama (LRU) kararları bu tablodan verilir."""
+    __tablename__ = "processed_videos"
+
+    filename = Column(String(255), primary_key=True)
+    job_id = Column(String(32), nullable=True) # Videoyu üreten iş
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), default=func.now(), index=True)
+    access_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ProcessedVideo(filename='{self.filename}', size={self.size_bytes}, last_access='{self.last_accessed_at}')>"
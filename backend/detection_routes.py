@@ -1,13 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import JSONResponse
 from database.config import database
 from database.models import DetectionRecord, OverallCount
 from sqlalchemy.sql import select, insert
-from model_manager import load_yolo_model, extract_class_names, SUPPORTED_YOLO_MODELS, SUPPORTED_TRACKERS, CUSTOM_MODELS_DIR
-from video_service import process_video_stream
+from model_manager import model_pool, benchmark_backends, resolve_model_path, SUPPORTED_YOLO_MODELS, SUPPORTED_TRACKERS, CUSTOM_MODELS_DIR
+from model_export import export_model, resolve_backend, available_backends, list_artifacts, load_benchmarks, BACKENDS, INFERENCE_BACKEND
+from model_registry import model_registry
+from uploads import save_upload_file, scratch_path
+from detection_writer import detection_writer
+from inference_scheduler import scheduler_stats
+from websocket_manager import manager
+from video_store import preview_urls
 import os
-import shutil
+import cv2
 import json
+import asyncio
 
 router = APIRouter()
 
@@ -21,40 +28,122 @@ async def get_supported_trackers():
 
 @router.get("/custom-models")
 async def get_custom_models():
-    models_list = []
-    if os.path.exists(CUSTOM_MODELS_DIR):
-        for filename in os.listdir(CUSTOM_MODELS_DIR):
-            if filename.endswith(".pt"):
-                models_list.append(filename)
-    return {"custom_models": models_list}
+    return {"custom_models": model_registry.custom_models()}
 
 @router.post("/upload-model/")
 async def upload_model(model_file: UploadFile = File(...)):
-    if not model_file.filename.endswith(".pt"):
-        raise HTTPException(status_code=400, detail="Sadece .pt uzantılı model dosyaları yüklenebilir.")
+    if not model_file.filename.endswith((".pt", ".onnx")):
+        raise HTTPException(status_code=400, detail="Sadece .pt veya .onnx uzantılı model dosyaları yüklenebilir.")
     
     file_location = os.path.join(CUSTOM_MODELS_DIR, model_file.filename)
     try:
-        with open(file_location, "wb") as f:
-            shutil.copyfileobj(model_file.file, f)
+        await save_upload_file(model_file, file_location)
+        # Aynı isimle yüklenen yeni ağırlıklar için havuzdaki eski model (tüm arka uçlar) bırakılır
+        model_pool.invalidate(model_file.filename)
+        # Metadata yüklemede bir kez okunur; okunamayan dosya saklanmaz
+        try:
+            await asyncio.to_thread(model_registry.register, model_file.filename)
+        except HTTPException:
+            os.remove(file_location)
+            model_registry.remove(model_file.filename)
+            raise
         return JSONResponse(status_code=200, content={"message": f"Model '{model_file.filename}' yüklendi."})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Model yüklenirken hata: {e}")
 
+async def _model_metadata(model_name: str) -> dict:
+    # İndekste güncel kayıt varsa ağırlıklara hiç dokunulmaz
+    return model_registry.get(model_name) or await asyncio.to_thread(model_registry.describe, model_name)
+
 @router.get("/model-classes/{model_name}")
 async def get_model_classes(model_name: str):
-    model_instance = load_yolo_model(model_name)
-    class_list = extract_class_names(model_instance)
-    if class_list:
-        return {"classes": class_list}
+    metadata = await _model_metadata(model_name)
+    if metadata["classes"]:
+        return {"classes": metadata["classes"]}
     raise HTTPException(status_code=400, detail="Modelde sınıf isimleri bulunamadı.")
 
-@router.get("/processed-videos/{filename}")
-async def get_processed_video(filename: str):
-    video_path = os.path.join("processed_videos", filename)
-    if not os.path.exists(video_path):
-        raise HTTPException(status_code=404, detail="Video bulunamadı.")
-    return FileResponse(path=video_path, media_type="video/mp4", filename=filename)
+@router.get("/models/{model_name}/info")
+async def get_model_info(model_name: str):
+    return await _model_metadata(model_name)
+
+@router.get("/inference-backends")
+async def get_inference_backends():
+    return {
+        "backends": list(BACKENDS.keys()),
+        "available": available_backends(),
+        "default": INFERENCE_BACKEND,
+        "artifacts": list_artifacts(),
+        "benchmarks": load_benchmarks(),
+    }
+
+@router.post("/models/{model_name}/export")
+async def export_model_endpoint(model_name: str, backend: str = Query(...)):
+    # İlk işte beklememek için modeli önceden dışa aktarır
+    model_path = resolve_model_path(model_name)
+    backend = await asyncio.to_thread(resolve_backend, backend, model_path)
+    artifact = await asyncio.to_thread(export_model, model_path, backend)
+    return {"model": model_name, "backend": backend, "artifact": artifact}
+
+def _read_sample_frames(path: str, max_frames: int) -> list:
+    cap = cv2.VideoCapture(path)
+    frames = []
+    try:
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+@router.post("/benchmark-backends")
+async def benchmark_backends_endpoint(
+    video_file: UploadFile = File(...),
+    model_name: str = Form("yolov8n"),
+    backends: str = Form("[]"),
+    max_frames: int = Form(60)
+):
+    """Örnek klip üzerinde arka uçları karşılaştırır; boş liste tüm kullanılabilir arka uçlar demektir."""
+    try:
+        requested = json.loads(backends) or available_backends()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Girdi hatası: {e}")
+    model_path = resolve_model_path(model_name)
+    for backend in requested:
+        await asyncio.to_thread(resolve_backend, backend, model_path)
+
+    sample_path = scratch_path(video_file.filename)
+    try:
+        await save_upload_file(video_file, sample_path)
+        frames = await asyncio.to_thread(_read_sample_frames, sample_path, max(1, min(max_frames, 1000)))
+    finally:
+        if os.path.exists(sample_path):
+            os.remove(sample_path)
+    if not frames:
+        raise HTTPException(status_code=400, detail="Video açılamadı")
+
+    results = await asyncio.to_thread(benchmark_backends, model_name, frames, requested)
+    return {"model": model_name, "frames": len(frames), "results": results,
+            "selected": await asyncio.to_thread(resolve_backend, "auto", model_path)}
+
+@router.get("/model-pool/stats")
+async def get_model_pool_stats():
+    return model_pool.stats()
+
+@router.get("/inference-scheduler/stats")
+async def get_inference_scheduler_stats():
+    return {"schedulers": scheduler_stats()}
+
+@router.get("/detection-writer/stats")
+async def get_detection_writer_stats():
+    return detection_writer.stats()
+
+@router.get("/websocket/stats")
+async def get_websocket_stats():
+    return manager.stats()
 
 @router.get("/last-10-counts")
 async def get_last_10_overall_counts():
@@ -71,30 +160,10 @@ async def get_last_10_overall_counts():
                 "start_time": r.start_time.isoformat() if r.start_time else None,
                 "end_time": r.end_time.isoformat() if r.end_time else None,
                 "line_coordinates": r.line_coordinates,
-                "processed_video_path": r.processed_video_path
+                "processed_video_path": r.processed_video_path,
+                **preview_urls(r.processed_video_path),
+                "count_details": json.loads(r.count_details) if r.count_details else None
             } for r in records
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Hata oluştu: {e}")
-
-@router.post("/process-video/")
-async def process_video_endpoint(
-    video_file: UploadFile = File(...),
-    model_name: str = Form("yolov8n"),
-    tracker_name: str = Form("bytetrack"),
-    line_coordinates: str = Form("[[0,0],[0,0]]"),
-    conf_threshold: float = Form(0.25),
-    iou_threshold: float = Form(0.7),
-    selected_class_ids: str = Form("[]")
-):
-    try:
-        selected_class_ids_list = json.loads(selected_class_ids)
-        parsed_line = json.loads(line_coordinates)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Girdi hatası: {e}")
-
-    return await process_video_stream(
-        video_file, model_name, tracker_name,
-        selected_class_ids_list, parsed_line,
-        conf_threshold, iou_threshold
-    )
@@ -0,0 +1,197 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from sqlalchemy.sql import insert, select, update, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from database.config import database
+from database.models import DetectionRecord, CountRollup
+import metrics
+
+# Tampon bu kadar satıra ulaşınca ya da bu kadar saniye geçince veritabanına yazılır
+DETECTION_FLUSH_SIZE = int(os.getenv("DETECTION_FLUSH_SIZE", "200"))
+DETECTION_FLUSH_INTERVAL = float(os.getenv("DETECTION_FLUSH_INTERVAL", "1.0"))
+# Bekleyen satır sayısı bu sınırı aşarsa add() yazma bitene kadar bekler (backpressure)
+DETECTION_MAX_PENDING = int(os.getenv("DETECTION_MAX_PENDING", "5000"))
+
+# Özet (rollup) tablosundaki zaman kovası genişliği (saniye)
+COUNT_ROLLUP_BUCKET_SECONDS = int(os.getenv("COUNT_ROLLUP_BUCKET_SECONDS", "60"))
+
+# Tek bir INSERT ifadesindeki en fazla satır (PostgreSQL parametre sınırının altında kalmak için)
+_ROWS_PER_STATEMENT = 1000
+
+
+def rollup_bucket(timestamp: datetime, bucket_seconds: int = COUNT_ROLLUP_BUCKET_SECONDS) -> datetime:
+    """Zaman damgasını ait olduğu kovanın başlangıcına yuvarlar."""
+    epoch = timestamp.timestamp()
+    return datetime.fromtimestamp(epoch - epoch % bucket_seconds, tz=timestamp.tzinfo)
+
+
+def _rollup_rows(rows: list[dict]) -> list[dict]:
+    counts: dict[tuple, int] = {}
+    for row in rows:
+        key = (row.get("job_id") or "", rollup_bucket(row["timestamp"]), row["object_label"],
+               row.get("line_name") or "", row.get("direction") or "")
+        counts[key] = counts.get(key, 0) + 1
+    return [
+        {"job_id": job_id, "bucket_start": bucket, "object_label": label,
+         "line_name": line, "direction": direction, "count": n}
+        for (job_id, bucket, label, line, direction), n in counts.items()
+    ]
+
+
+def _rollup_upsert(rows: list[dict]):
+    # Aynı kova varsa sayaç artırılır; ON CONFLICT sözdizimi PostgreSQL ve SQLite'ta ortaktır
+    dialect_insert = postgresql.insert if database.url.dialect.startswith("postgres") else sqlite.insert
+    stmt = dialect_insert(CountRollup).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["job_id", "object_label", "line_name", "direction", "bucket_start"],
+        set_={"count": CountRollup.count + stmt.excluded.count},
+    )
+
+
+async def insert_detection_rows(rows: list[dict]):
+    """
+    Tespit satırlarını çok satırlı INSERT'lerle yazar ve özet sayaçlarını
+    artırır. Çağıran taraf tutarlılık için bir transaction içinde çağırmalıdır.
+    """
+    for start in range(0, len(rows), _ROWS_PER_STATEMENT):
+        chunk = rows[start:start + _ROWS_PER_STATEMENT]
+        await database.execute(insert(DetectionRecord).values(chunk))
+        await database.execute(_rollup_upsert(_rollup_rows(chunk)))
+
+
+async def delete_detection_rows_after(job_id: str, total_count: int) -> int:
+    """
+    İşin checkpoint'ten sonra yazılmış (current_total_count > total_count)
+    tespit satırlarını siler ve özet sayaçlarından düşer. Checkpoint'ten
+    devam eden iş bu kareleri yeniden işleyip aynı kayıtları tekrar yazar.
+    """
+    after = (DetectionRecord.job_id == job_id) & (DetectionRecord.current_total_count > total_count)
+    async with database.transaction():
+        rows = await database.fetch_all(
+            select(DetectionRecord.job_id, DetectionRecord.timestamp, DetectionRecord.object_label,
+                   DetectionRecord.line_name, DetectionRecord.direction).where(after))
+        if not rows:
+            return 0
+        rows = [{"job_id": r.job_id, "timestamp": r.timestamp, "object_label": r.object_label,
+                 "line_name": r.line_name, "direction": r.direction} for r in rows]
+        for r in _rollup_rows(rows):
+            await database.execute(update(CountRollup).where(
+                (CountRollup.job_id == r["job_id"]) & (CountRollup.bucket_start == r["bucket_start"])
+                & (CountRollup.object_label == r["object_label"]) & (CountRollup.line_name == r["line_name"])
+                & (CountRollup.direction == r["direction"])
+            ).values(count=CountRollup.count - r["count"]))
+        await database.execute(delete(CountRollup).where((CountRollup.job_id == job_id) & (CountRollup.count <= 0)))
+        await database.execute(delete(DetectionRecord).where(after))
+    return len(rows)
+
+
+class DetectionWriter:
+    """
+    DetectionRecord satırlarını bellekte toplayıp boyut/süre eşiğinde
+    çok satırlı tek INSERT ile yazan write-behind tampon.
+    Kare döngüsü her sayılan nesne için veritabanını beklemez.
+    Aynı işlemde count_rollups özet tablosu da artırılır; analiz sorguları
+    ham kayıtları taramak zorunda kalmaz.
+    """
+
+    def __init__(self, flush_size: int = DETECTION_FLUSH_SIZE,
+                 flush_interval: float = DETECTION_FLUSH_INTERVAL,
+                 max_pending: int = DETECTION_MAX_PENDING):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._buffer: list[dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task = None
+        self._metrics = {
+            "rows_added": 0, "rows_written": 0, "flushes": 0, "flush_errors": 0,
+            "backpressure_waits": 0, "last_flush_rows": 0, "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0, "flush_ms_total": 0.0,
+        }
+
+    async def start(self):
+        if self._task is None:
+            # Senkronizasyon nesneleri çalışan event loop'a bağlanır
+            self._flush_lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            self._space = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Arka plan görevini durdurur ve kalan satırları yazar (kapanışta çağrılır)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            print(f"Uyarı: {len(self._buffer)} tespit kaydı veritabanına yazılamadı.")
+
+    async def add(self, row: dict):
+        if len(self._buffer) >= self.max_pending:
+            self._metrics["backpressure_waits"] += 1
+            self._wake.set()
+            async with self._space:
+                await self._space.wait_for(lambda: len(self._buffer) < self.max_pending)
+        self._buffer.append(row)
+        self._metrics["rows_added"] += 1
+        if len(self._buffer) >= self.flush_size:
+            self._wake.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._buffer:
+                rows = self._buffer[:_ROWS_PER_STATEMENT]
+                started = time.perf_counter()
+                try:
+                    async with database.transaction():
+                        await insert_detection_rows(rows)
+                except Exception as e:
+                    # Satırlar tamponda kalır, bir sonraki denemede tekrar yazılır
+                    self._metrics["flush_errors"] += 1
+                    print(f"Tespit kayıtları yazılamadı: {e}")
+                    return
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                metrics.observe("db_insert", elapsed_ms / 1000)
+                del self._buffer[:len(rows)]
+
+                self._metrics["flushes"] += 1
+                self._metrics["rows_written"] += len(rows)
+                self._metrics["last_flush_rows"] = len(rows)
+                self._metrics["last_flush_ms"] = elapsed_ms
+                self._metrics["max_flush_ms"] = max(self._metrics["max_flush_ms"], elapsed_ms)
+                self._metrics["flush_ms_total"] += elapsed_ms
+
+                async with self._space:
+                    self._space.notify_all()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        flushes = self._metrics["flushes"]
+        return {
+            **self._metrics,
+            "pending": len(self._buffer),
+            "avg_flush_ms": self._metrics["flush_ms_total"] / flushes if flushes else 0.0,
+            "flush_size": self.flush_size,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+        }
+
+
+# Uygulama genelinde kullanılacak tekil yazıcı
+detection_writer = DetectionWriter()
@@ -0,0 +1,140 @@
+import os
+import asyncio
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+
+# Dosyadan her okumada gönderilen parça boyutu
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", str(256 * 1024)))
+# İşlenmiş dosyaların adları benzersiz olduğu için istemci önbelleğinde tutulabilir
+FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", "86400"))
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    # Zayıf karşılaştırma: W/ öneki yok sayılır
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def _not_modified(request: Request, stat: os.stat_result, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    "bytes=a-b", "bytes=a-" ve "bytes=-n" biçimlerini [başlangıç, bitiş) olarak
+    döndürür. Çoklu ya da çözülemeyen aralıkta None (tüm dosya gönderilir),
+    karşılanamayan aralıkta 416 döner.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            start, end = max(0, size - suffix), size
+            if suffix <= 0:
+                start = size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise HTTPException(status_code=416, detail="İstenen aralık karşılanamıyor",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """
+    Dosyanın [start, end) aralığını gönderir. Sunucu ASGI zerocopysend
+    eklentisini destekliyorsa sendfile kullanılır; aksi halde dosya event
+    loop'u bloklamadan parça parça okunur.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int = 200,
+                 headers: dict = None, media_type: str = None):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.end <= self.start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        f = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": self.start, "count": self.end - self.start})
+                return
+            await asyncio.to_thread(f.seek, self.start)
+            remaining = self.end - self.start
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Dosya gönderim sırasında kısaldı (ör. saklama süresi dolup silindi)
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await asyncio.to_thread(f.close)
+
+
+def file_response(request: Request, path: str, media_type: str, filename: str = None) -> Response:
+    """
+    Dosyayı Range (tek aralık, 206), If-Range ve ETag/Last-Modified koşullu
+    istek (304) desteğiyle döndürür.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Dosya bulunamadı.")
+    etag = file_etag(stat)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "cache-control": f"public, max-age={FILE_CACHE_MAX_AGE}",
+    }
+    if filename:
+        quoted = quote(filename)
+        headers["content-disposition"] = (f'attachment; filename="{filename}"' if quoted == filename
+                                          else f"attachment; filename*=utf-8''{quoted}")
+    if _not_modified(request, stat, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range tutmuyorsa dosya değişmiştir; aralık yerine tüm dosya gönderilir
+    if range_header and (if_range is None or if_range.strip() in (etag, headers["last-modified"])):
+        byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        return FileRangeResponse(path, 0, size, headers=headers, media_type=media_type)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+    return FileRangeResponse(path, start, end, status_code=206, headers=headers, media_type=media_type)
@@ -0,0 +1,114 @@
+import os
+import cv2
+import numpy as np
+
+# Tespit modu: "full" her karede, "stride" her N karede bir, "motion" yalnızca
+# sayım çizgileri/bölgeleri çevresinde hareket olan karelerde model çalıştırır
+INFERENCE_MODES = ("full", "stride", "motion")
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "full")
+INFERENCE_STRIDE = int(os.getenv("INFERENCE_STRIDE", "1"))
+# İlgi alanındaki piksellerin bu oranı değişmişse kare "hareketli" sayılır
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.002"))
+# Hareket olmasa da en fazla bu kadar kare tespitsiz geçer (0: sınırsız)
+MOTION_MAX_SKIP = int(os.getenv("MOTION_MAX_SKIP", "150"))
+
+# Fark görüntüsü bu genişliğe küçültülmüş gri karelerde hesaplanır
+_MOTION_WIDTH = 160
+_PIXEL_DIFF = 25
+
+
+class FrameGate:
+    """
+    Hangi karelerde modelin çalışacağına karar verir (track thread'inde çağrılır).
+    Atlanan karelerde son takip sonucu korunur; sayım yalnızca tespit yapılan
+    karelerde güncellenir. Çizgi kesişimi ardışık iki tespit arasındaki doğru
+    parçasıyla hesaplandığı için takipçi ID'yi korudukça geçişler kaçmaz.
+    """
+
+    def __init__(self, mode: str = INFERENCE_MODE, stride: int = INFERENCE_STRIDE,
+                 geometry: list = None, frame_size: tuple = None, fps: float = 30,
+                 threshold: float = MOTION_THRESHOLD, max_skip: int = MOTION_MAX_SKIP):
+        self.mode = mode if mode in INFERENCE_MODES else "full"
+        self.stride = max(1, int(stride)) if self.mode == "stride" else 1
+        self.fps = fps or 30
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self._mask = None
+        self._scale = 1.0
+        self._size = None
+        if self.mode == "motion":
+            self._build_mask(geometry or [], frame_size)
+        self._prev = None
+        self._since_detect = 0
+        self.frames = 0
+        self.detected = 0
+        self.max_gap = 0
+
+    def _build_mask(self, geometry: list, frame_size: tuple):
+        width, height = frame_size
+        self._scale = min(1.0, _MOTION_WIDTH / max(1, width))
+        size = (max(1, round(width * self._scale)), max(1, round(height * self._scale)))
+        mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+        # Çizgilerin çevresinde nesnenin yaklaşabileceği kadar pay bırakılır
+        margin = max(3, size[0] // 8)
+        for points in geometry:
+            pts = np.round(np.asarray(points, dtype=np.float64) * self._scale).astype(np.int32)
+            if len(pts) == 2:
+                cv2.line(mask, tuple(pts[0]), tuple(pts[1]), 255, margin * 2)
+            else:
+                cv2.fillPoly(mask, [pts], 255)
+                cv2.polylines(mask, [pts], True, 255, margin)
+        self._mask = mask if mask.any() else None
+        self._size = size
+
+    def _motion(self, frame) -> bool:
+        small = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA) if self._scale < 1.0 else frame
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        prev, self._prev = self._prev, gray
+        if prev is None:
+            return True
+        diff = cv2.absdiff(gray, prev) > _PIXEL_DIFF
+        if self._mask is not None:
+            changed = np.count_nonzero(diff & (self._mask > 0))
+            area = np.count_nonzero(self._mask)
+        else:
+            changed = np.count_nonzero(diff)
+            area = diff.size
+        return changed >= self.threshold * area
+
+    def should_detect(self, frame) -> bool:
+        index = self.frames
+        self.frames += 1
+        if self.mode == "stride":
+            detect = index % self.stride == 0
+        elif self.mode == "motion":
+            detect = self._motion(frame) or (self.max_skip > 0 and self._since_detect >= self.max_skip)
+        else:
+            detect = True
+
+        if detect:
+            self.detected += 1
+            self._since_detect = 0
+        else:
+            self._since_detect += 1
+            self.max_gap = max(self.max_gap, self._since_detect)
+        return detect
+
+    def tracker_frame_rate(self) -> float:
+        """Takipçiye verilecek kare hızı; stride modunda takipçi yalnızca tespit karelerini görür."""
+        return self.fps / self.stride
+
+    def stats(self) -> dict:
+        """Doğruluk/maliyet ödünleşimi: atlanan kare oranı ve en uzun tespitsiz aralık."""
+        skipped = self.frames - self.detected
+        return {
+            "mode": self.mode,
+            "stride": self.stride,
+            "frames": self.frames,
+            "detected_frames": self.detected,
+            "skipped_frames": skipped,
+            "skip_ratio": round(skipped / self.frames, 4) if self.frames else 0.0,
+            # Bu süreden kısa sürede çizgiye girip çıkan nesne hiç görülmeyebilir
+            "max_gap_frames": self.max_gap,
+            "max_gap_seconds": round(self.max_gap / self.fps, 3),
+        }
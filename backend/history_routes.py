@@ -0,0 +1,187 @@
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import BigInteger, cast, func, literal_column
+from sqlalchemy.sql import select, and_, or_
+from database.config import database, engine
+from database.models import DetectionRecord, CountRollup, OverallCount
+from detection_writer import COUNT_ROLLUP_BUCKET_SECONDS, rollup_bucket
+from video_store import preview_urls
+import json
+
+router = APIRouter(prefix="/history")
+
+# Sayfa başına en fazla kayıt ve bir sayım sorgusunun döndürebileceği en fazla (seri, kova) noktası
+HISTORY_MAX_PAGE_SIZE = 1000
+HISTORY_MAX_SERIES_POINTS = 200_000
+
+
+def _encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return f"{timestamp.isoformat()}|{row_id}"
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        timestamp, row_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz cursor değeri")
+
+
+def _epoch_seconds(column):
+    """Zaman sütununu veritabanında Unix saniyesine çevirir (kovalama SQL'de yapılsın diye)."""
+    if engine.dialect.name == "sqlite":
+        return cast(func.strftime("%s", column), BigInteger)
+    return cast(func.extract("epoch", column), BigInteger)
+
+
+@router.get("/detections")
+async def list_detections(job_id: str = None, label: str = None, line: str = None,
+                          start: datetime = None, end: datetime = None, cursor: str = None,
+                          limit: int = Query(100, ge=1, le=HISTORY_MAX_PAGE_SIZE)):
+    """
+    Tespit kayıtlarını yeniden eskiye, keyset sayfalama ile döndürür.
+    Sonraki sayfa için yanıttaki next_cursor gönderilir; OFFSET kullanılmadığı
+    için derin sayfalar da (iş, zaman) / (sınıf, zaman) indeksinden okunur.
+    """
+    conditions = []
+    if job_id is not None:
+        conditions.append(DetectionRecord.job_id == job_id)
+    if label is not None:
+        conditions.append(DetectionRecord.object_label == label)
+    if line is not None:
+        conditions.append(DetectionRecord.line_name == line)
+    if start is not None:
+        conditions.append(DetectionRecord.timestamp >= start)
+    if end is not None:
+        conditions.append(DetectionRecord.timestamp < end)
+    if cursor is not None:
+        timestamp, row_id = _decode_cursor(cursor)
+        conditions.append(or_(DetectionRecord.timestamp < timestamp,
+                              and_(DetectionRecord.timestamp == timestamp, DetectionRecord.id < row_id)))
+
+    query = (select(DetectionRecord).where(*conditions)
+             .order_by(DetectionRecord.timestamp.desc(), DetectionRecord.id.desc()).limit(limit + 1))
+    rows = await database.fetch_all(query)
+    page = rows[:limit]
+    return {
+        "items": [
+            {
+                "id": r.id,
+                "job_id": r.job_id,
+                "video_name": r.video_name,
+                "model_used": r.model_used,
+                "tracker_used": r.tracker_used,
+                "object_id": r.object_id,
+                "object_label": r.object_label,
+                "line_name": r.line_name,
+                "direction": r.direction,
+                "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+                "current_total_count": r.current_total_count,
+            } for r in page
+        ],
+        "next_cursor": _encode_cursor(page[-1].timestamp, page[-1].id) if len(rows) > limit else None,
+    }
+
+
+@router.get("/counts")
+async def count_series(job_id: str = None, label: str = None, line: str = None, direction: str = None,
+                       start: datetime = None, end: datetime = None,
+                       bucket_seconds: int = Query(3600, ge=1),
+                       group_by: str = Query("label", pattern="^(label|job|line|none)$")):
+    """
+    Özet tablosundan zaman serisi döndürür. Kova genişliği özet kovasının
+    katına yuvarlanır; kovalama ve toplama veritabanında (GROUP BY) yapılır,
+    yanıta yalnızca (seri, kova) başına bir satır gelir.
+    """
+    bucket_seconds = max(COUNT_ROLLUP_BUCKET_SECONDS,
+                         bucket_seconds // COUNT_ROLLUP_BUCKET_SECONDS * COUNT_ROLLUP_BUCKET_SECONDS)
+    conditions = []
+    if job_id is not None:
+        conditions.append(CountRollup.job_id == job_id)
+    if label is not None:
+        conditions.append(CountRollup.object_label == label)
+    if line is not None:
+        conditions.append(CountRollup.line_name == line)
+    if direction is not None:
+        conditions.append(CountRollup.direction == direction)
+    if start is not None:
+        conditions.append(CountRollup.bucket_start >= rollup_bucket(start))
+    if end is not None:
+        conditions.append(CountRollup.bucket_start < end)
+
+    # Kova genişliği sorguya gömülür: parametre olsaydı SELECT ve GROUP BY'daki ifadeler
+    # (farklı yer tutucular yüzünden) PostgreSQL'de eşleşmezdi
+    width = literal_column(str(int(bucket_seconds)))
+    bucket = (_epoch_seconds(CountRollup.bucket_start) // width * width).label("bucket")
+    group_column = {
+        "label": CountRollup.object_label,
+        "job": CountRollup.job_id,
+        "line": CountRollup.line_name,
+        "none": None,
+    }[group_by]
+    columns = [bucket, func.sum(CountRollup.count).label("n")]
+    group = [bucket]
+    if group_column is not None:
+        columns.append(group_column.label("key"))
+        group.append(group_column)
+    query = (select(*columns).where(*conditions).group_by(*group)
+             .order_by(bucket).limit(HISTORY_MAX_SERIES_POINTS + 1))
+    rows = await database.fetch_all(query)
+    if len(rows) > HISTORY_MAX_SERIES_POINTS:
+        raise HTTPException(status_code=400, detail="Sorgu çok geniş; kova genişliğini artırın ya da filtre ekleyin")
+
+    series: dict[str, list[dict]] = {}
+    totals: dict[str, int] = {}
+    for r in rows:
+        key = r.key if group_column is not None else "total"
+        n = int(r.n)
+        series.setdefault(key, []).append({
+            "bucket_start": datetime.fromtimestamp(int(r.bucket), tz=timezone.utc).isoformat(),
+            "count": n,
+        })
+        totals[key] = totals.get(key, 0) + n
+
+    return {
+        "bucket_seconds": bucket_seconds,
+        "group_by": group_by,
+        "totals": totals,
+        "series": series,
+    }
+
+
+@router.get("/overall-counts")
+async def list_overall_counts(video_name: str = None, start: datetime = None, end: datetime = None,
+                              before_id: int = None,
+                              limit: int = Query(20, ge=1, le=HISTORY_MAX_PAGE_SIZE)):
+    """Genel sayım kayıtlarını yeniden eskiye sayfalar (before_id = önceki sayfanın next_before_id'si)."""
+    conditions = []
+    if video_name is not None:
+        conditions.append(OverallCount.video_name == video_name)
+    if start is not None:
+        conditions.append(OverallCount.start_time >= start)
+    if end is not None:
+        conditions.append(OverallCount.start_time < end)
+    if before_id is not None:
+        conditions.append(OverallCount.id < before_id)
+
+    query = select(OverallCount).where(*conditions).order_by(OverallCount.id.desc()).limit(limit + 1)
+    rows = await database.fetch_all(query)
+    page = rows[:limit]
+    return {
+        "items": [
+            {
+                "id": r.id,
+                "video_name": r.video_name,
+                "model_used": r.model_used,
+                "tracker_used": r.tracker_used,
+                "final_count": r.final_count,
+                "start_time": r.start_time.isoformat() if r.start_time else None,
+                "end_time": r.end_time.isoformat() if r.end_time else None,
+                "processed_video_path": r.processed_video_path,
+                # Liste görünümü tam video yerine küçük resim/GIF yükler
+                **preview_urls(r.processed_video_path),
+                "count_details": json.loads(r.count_details) if r.count_details else None,
+            } for r in page
+        ],
+        "next_before_id": page[-1].id if len(rows) > limit else None,
+    }
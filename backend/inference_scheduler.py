@@ -0,0 +1,147 @@
+import os
+import time
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+from model_manager import PooledModel
+import metrics
+
+# Bir mikro-batch'teki en fazla kare sayısı ve ilk kareden sonra beklenecek en uzun süre
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+
+# Bu kadar süre istek gelmezse scheduler thread'i kapanır
+_IDLE_TIMEOUT = 30.0
+
+
+class _Request:
+    __slots__ = ("frame", "conf", "iou", "future")
+
+    def __init__(self, frame, conf: float, iou: float):
+        self.frame = frame
+        self.conf = conf
+        self.iou = iou
+        self.future = Future()
+
+
+class BatchScheduler:
+    """
+    Tek bir havuz modeli için, aktif tüm oturumlardan gelen kareleri
+    mikro-batch'ler halinde toplayıp tek bir predict çağrısıyla işler.
+    Sonuçlar Future üzerinden ilgili oturuma döner; takip (tracker) adımı
+    her oturumun kendi takipçisinde yapılır.
+    """
+
+    def __init__(self, entry: PooledModel, max_batch: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.entry = entry
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"batches": 0, "frames": 0, "max_batch_seen": 0, "predict_seconds_total": 0.0}
+
+    def submit(self, frame, conf: float, iou: float) -> Future:
+        req = _Request(frame, conf, iou)
+        with self._lock:
+            self._queue.put(req)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name=f"batch-{self.entry.name}")
+                self._thread.start()
+        return req.future
+
+    def _next_batch(self) -> list | None:
+        try:
+            first = self._queue.get(timeout=_IDLE_TIMEOUT)
+        except queue.Empty:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            # Eşik değerleri farklı olan istekler ayrı predict çağrılarına bölünür
+            groups: dict[tuple, list[_Request]] = {}
+            for req in batch:
+                groups.setdefault((req.conf, req.iou), []).append(req)
+
+            for (conf, iou), reqs in groups.items():
+                self._predict(reqs, conf, iou)
+
+    def _predict(self, reqs: list, conf: float, iou: float):
+        for req in reqs:
+            req.future.set_running_or_notify_cancel()
+        started = time.perf_counter()
+        try:
+            with self.entry.lock:
+                results = self.entry.model.predict(
+                    [req.frame for req in reqs], conf=conf, iou=iou, verbose=False)
+        except Exception as e:
+            for req in reqs:
+                req.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+        metrics.observe("inference", elapsed / len(reqs), count=len(reqs))
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["frames"] += len(reqs)
+            self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(reqs))
+            self._stats["predict_seconds_total"] += elapsed
+
+        for req, result in zip(reqs, results):
+            req.future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = self._stats["batches"]
+            return {
+                **self._stats,
+                "model": self.entry.name,
+                "avg_batch_size": self._stats["frames"] / batches if batches else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+
+# İstatistikler için; scheduler'ın sahibi havuz modelidir (PooledModel.scheduler)
+_schedulers: "weakref.WeakSet[BatchScheduler]" = weakref.WeakSet()
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(entry: PooledModel) -> BatchScheduler:
+    """
+    Havuz modelinin ortak scheduler'ını döndürür. Scheduler model nesnesine
+    bağlıdır: yeniden yüklenen (aynı isimli) model kendi scheduler'ını alır,
+    eski modeli kullanmaya devam eden işlerinkine dokunulmaz.
+    """
+    with _schedulers_lock:
+        if entry.scheduler is None:
+            entry.scheduler = BatchScheduler(entry)
+            _schedulers.add(entry.scheduler)
+        return entry.scheduler
+
+
+def scheduler_stats() -> list[dict]:
+    with _schedulers_lock:
+        schedulers = list(_schedulers)
+    return [s.stats() for s in schedulers]
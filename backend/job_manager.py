@@ -0,0 +1,406 @@
+import os
+import json
+import uuid
+import asyncio
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy.sql import select, insert, update
+from database.config import database
+from database.models import VideoJob, OverallCount
+from uploads import UPLOAD_SCRATCH_DIR
+from video_service import run_video_job
+import result_cache
+import metrics
+
+# Aynı anda işlenecek en fazla video sayısı
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+# Aynı anda çalışacak en fazla canlı akış işi; iptal edilene kadar süren bu işler
+# dosya işlerinin worker'larını işgal etmez, ayrı bir havuzda çalışır
+MAX_LIVE_JOBS = int(os.getenv("MAX_LIVE_JOBS", "2"))
+# İş bitene kadar kaynak videoların saklandığı dizin; yeniden başlatmada
+# işlerin devam edebilmesi için kalıcı bir dizin olmalı
+JOB_SOURCE_DIR = os.getenv("JOB_SOURCE_DIR", UPLOAD_SCRATCH_DIR)
+
+os.makedirs(JOB_SOURCE_DIR, exist_ok=True)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def job_source_path(job_id: str, filename: str) -> str:
+    return os.path.join(JOB_SOURCE_DIR, f"job_{job_id}_{os.path.basename(filename)}")
+
+
+class JobState:
+    """Bellekteki bir video işinin durumu; kalıcı alanlar video_jobs tablosuna yazılır."""
+
+    def __init__(self, job_id: str, video_name: str, params: dict, source_path: str,
+                 status: str = "queued", overall_count_id: int = None,
+                 frames_processed: int = 0, total_frames: int = 0, checkpoint: dict = None):
+        self.id = job_id
+        self.video_name = video_name
+        self.params = params
+        self.source_path = source_path
+        self.status = status
+        self.overall_count_id = overall_count_id
+        self.frames_processed = frames_processed
+        self.total_frames = total_frames
+        self.checkpoint = checkpoint or {}
+        self.result = None
+        self.error = None
+        # Akışla yüklenen işlerde kaynağın doğrudan okunduğu decoder
+        self.capture = None
+        # Canlı işlerde akışı okuyan kaynak (LiveCapture)
+        self.live_source = None
+        self.cancel_requested = False
+        self.done = asyncio.Event()
+        self._preview_queues: set[asyncio.Queue] = set()
+
+    # --- Kalıcılık ---
+
+    async def save(self, **extra):
+        with metrics.timer("db_job_update"):
+            await database.execute(update(VideoJob).where(VideoJob.id == self.id).values(
+                status=self.status,
+                overall_count_id=self.overall_count_id,
+                frames_processed=self.frames_processed,
+                total_frames=self.total_frames,
+                updated_at=datetime.now(),
+                **extra
+            ))
+
+    async def save_checkpoint(self, checkpoint: dict, total_count: int):
+        self.checkpoint = checkpoint
+        await self.save(checkpoint=json.dumps(checkpoint))
+        if self.overall_count_id is not None:
+            # Süreç çökse bile genel sayım kaydı 0'da kalmaz
+            await database.execute(update(OverallCount).where(OverallCount.id == self.overall_count_id)
+                                   .values(final_count=total_count))
+
+    # --- Canlı önizleme ---
+
+    @property
+    def preview_subscribers(self) -> int:
+        return len(self._preview_queues)
+
+    def publish_preview(self, jpeg: bytes):
+        if jpeg is None:
+            return
+        for q in self._preview_queues:
+            # Yavaş izleyici işi yavaşlatmaz: bekleyen eski kare atılır, en yenisi gönderilir
+            if q.full():
+                q.get_nowait()
+            q.put_nowait(jpeg)
+
+    async def preview(self):
+        """İş bitene kadar önizleme karelerini üretir."""
+        q = asyncio.Queue(maxsize=1)
+        self._preview_queues.add(q)
+        done_wait = asyncio.create_task(self.done.wait())
+        try:
+            while True:
+                get = asyncio.create_task(q.get())
+                finished, _ = await asyncio.wait({get, done_wait}, return_when=asyncio.FIRST_COMPLETED)
+                if get in finished:
+                    yield get.result()
+                    continue
+                get.cancel()
+                return
+        finally:
+            done_wait.cancel()
+            self._preview_queues.discard(q)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "video_name": self.video_name,
+            "overall_count_id": self.overall_count_id,
+            "frames_processed": self.frames_processed,
+            "total_frames": self.total_frames,
+            "progress": (self.frames_processed / self.total_frames) if self.total_frames else None,
+            "preview_subscribers": self.preview_subscribers,
+            "live": self.live_source.stats() if self.live_source is not None else None,
+            "error": self.error,
+        }
+
+
+def _row_to_dict(row) -> dict:
+    return {
+        "job_id": row.id,
+        "status": row.status,
+        "video_name": row.video_name,
+        "overall_count_id": row.overall_count_id,
+        "frames_processed": row.frames_processed,
+        "total_frames": row.total_frames,
+        "progress": (row.frames_processed / row.total_frames) if row.total_frames else None,
+        "preview_subscribers": 0,
+        "live": None,
+        "error": row.error,
+    }
+
+
+class JobManager:
+    """
+    Video işlerini kuyruğa alıp sınırlı sayıda worker ile işler.
+    İşlem HTTP bağlantısından bağımsızdır; istemci koparsa iş devam eder.
+    Uygulama yeniden başladığında yarım kalan işler checkpoint'ten sürdürülür.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_JOBS, max_live: int = MAX_LIVE_JOBS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_live = max(0, max_live)
+        self.jobs: dict[str, JobState] = {}
+        self._queue: asyncio.Queue = None
+        self._live_queue: asyncio.Queue = None
+        self._live_running = 0
+        self._workers: list[asyncio.Task] = []
+        # Kuyruğu beklemeden başlatılacak işler için ayrılmış yer sayısı (akışla yükleme)
+        self._reserved = 0
+        self._running = 0
+        self._slot_free: asyncio.Condition = None
+        self._direct: set[asyncio.Task] = set()
+        self._finished = {status: 0 for status in FINAL_STATUSES}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._live_queue = asyncio.Queue()
+        self._slot_free = asyncio.Condition()
+        rows = await database.fetch_all(
+            select(VideoJob).where(VideoJob.status.in_(ACTIVE_STATUSES)).order_by(VideoJob.created_at))
+        for row in rows:
+            job = JobState(row.id, row.video_name, json.loads(row.params), row.source_path,
+                           status="queued", overall_count_id=row.overall_count_id,
+                           frames_processed=row.frames_processed, total_frames=row.total_frames,
+                           checkpoint=json.loads(row.checkpoint) if row.checkpoint else None)
+            self.jobs[job.id] = job
+            self._queue_for(job).put_nowait(job)
+        if rows:
+            print(f"{len(rows)} yarım kalmış iş yeniden kuyruğa alındı.")
+
+        for i in range(self.max_concurrent):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"job-worker-{i}"))
+        for i in range(self.max_live):
+            self._workers.append(asyncio.create_task(self._live_worker(), name=f"live-worker-{i}"))
+
+    async def stop(self):
+        # Çalışan işler checkpoint kaydedip "running" durumunda kalır; açılışta devam ederler
+        tasks = self._workers + list(self._direct)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+
+    def has_free_slot(self) -> bool:
+        return (self._running + self._reserved < self.max_concurrent
+                and (self._queue is None or self._queue.empty()))
+
+    def reserve_slot(self) -> bool:
+        """
+        Boş yer varsa bir işi kuyruğu beklemeden başlatmak için ayırır.
+        Kontrol ve ayırma arasında await olmadığından eşzamanlı isteklerden
+        yalnızca biri son boş yeri alır. Ayrılan yer submit(reserved=True)
+        ile kullanılmalı ya da release_slot ile bırakılmalıdır.
+        """
+        if not self.has_free_slot():
+            return False
+        self._reserved += 1
+        return True
+
+    async def release_slot(self):
+        self._reserved -= 1
+        async with self._slot_free:
+            self._slot_free.notify_all()
+
+    def _queue_for(self, job: JobState) -> asyncio.Queue:
+        return self._live_queue if job.params.get("live") else self._queue
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    async def submit(self, job_id: str, video_name: str, params: dict, source_path: str,
+                     capture=None, video_hash: str = None, reserved: bool = False) -> JobState:
+        if video_hash is not None:
+            params["video_hash"] = video_hash
+            # Aynı video aynı parametrelerle daha önce işlendiyse sonuç hemen döner
+            cached = await result_cache.lookup(params) if params.get("cache") else None
+            if cached is not None:
+                return await self._complete_from_cache(job_id, video_name, params, source_path, cached)
+        if params.get("live") and self.max_live == 0:
+            raise HTTPException(status_code=503, detail="Canlı akış işleri bu sunucuda kapalı (MAX_LIVE_JOBS=0)")
+        job = JobState(job_id, video_name, params, source_path)
+        job.capture = capture
+        await database.execute(insert(VideoJob).values({
+            "id": job.id,
+            "status": job.status,
+            "video_name": video_name,
+            "source_path": source_path,
+            "params": json.dumps(params),
+            "frames_processed": 0,
+            "total_frames": 0,
+            "created_at": datetime.now(),
+        }))
+        self.jobs[job.id] = job
+        if reserved:
+            # Ayrılan yerde hemen başlar; kuyruktaki işler bu sırada yer açılmasını bekler
+            self._reserved -= 1
+            self._running += 1
+            task = asyncio.create_task(self._run(job), name=f"job-{job.id}")
+            self._direct.add(task)
+            task.add_done_callback(self._direct.discard)
+        else:
+            await self._queue_for(job).put(job)
+        return job
+
+    async def _complete_from_cache(self, job_id: str, video_name: str, params: dict,
+                                   source_path: str, result: dict) -> JobState:
+        job = JobState(job_id, video_name, params, None, status="completed",
+                       overall_count_id=result.get("id"),
+                       frames_processed=result.get("frames_processed", 0),
+                       total_frames=result.get("frames_processed", 0))
+        job.result = result
+        await database.execute(insert(VideoJob).values({
+            "id": job.id,
+            "status": job.status,
+            "video_name": video_name,
+            "params": json.dumps(params),
+            "overall_count_id": job.overall_count_id,
+            "frames_processed": job.frames_processed,
+            "total_frames": job.total_frames,
+            "result": json.dumps(result),
+            "created_at": datetime.now(),
+        }))
+        self._finished["completed"] += 1
+        if os.path.exists(source_path):
+            os.remove(source_path)
+        job.done.set()
+        return job
+
+    async def cancel(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        if job is None:
+            status = await self.get_status(job_id)
+            if status["status"] in FINAL_STATUSES:
+                return status
+            raise HTTPException(status_code=409, detail="İş bu süreçte çalışmıyor")
+        if job.status in FINAL_STATUSES:
+            return job.to_dict()
+        job.cancel_requested = True
+        if job.live_source is not None:
+            # Akış kesikken bekleyen okuma da sonlanır
+            job.live_source.stop()
+        if job.status == "queued":
+            # Kuyruktaki iş worker tarafından alındığında atlanır
+            await self._finish(job, "cancelled")
+        return job.to_dict()
+
+    async def get_status(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        row = await database.fetch_one(select(VideoJob).where(VideoJob.id == job_id))
+        if row is None:
+            raise HTTPException(status_code=404, detail="İş bulunamadı")
+        return _row_to_dict(row)
+
+    async def get_result(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        if job is not None and job.result is not None:
+            return job.result
+        row = await database.fetch_one(select(VideoJob).where(VideoJob.id == job_id))
+        if row is None:
+            raise HTTPException(status_code=404, detail="İş bulunamadı")
+        if row.status != "completed" and not row.result:
+            raise HTTPException(status_code=409, detail=f"İş henüz tamamlanmadı (durum: {row.status})")
+        return json.loads(row.result)
+
+    async def list_jobs(self, limit: int = 20) -> list[dict]:
+        rows = await database.fetch_all(select(VideoJob).order_by(VideoJob.created_at.desc()).limit(limit))
+        return [self.jobs[r.id].to_dict() if r.id in self.jobs else _row_to_dict(r) for r in rows]
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_concurrent": self.max_concurrent,
+            "live_running": self._live_running,
+            "live_queued": self._live_queue.qsize() if self._live_queue is not None else 0,
+            "max_live": self.max_live,
+            "finished": dict(self._finished),
+            "jobs": [
+                {"job_id": job.id, "status": job.status, "frames_processed": job.frames_processed,
+                 "total_frames": job.total_frames, "preview_subscribers": job.preview_subscribers}
+                for job in self.jobs.values()
+            ],
+        }
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            async with self._slot_free:
+                # Ayrılmış yerler doluysa kuyruktaki iş onların başlamasını bekler
+                await self._slot_free.wait_for(lambda: self._running + self._reserved < self.max_concurrent)
+                if job.status != "queued":
+                    continue
+                self._running += 1
+            await self._run(job)
+
+    async def _live_worker(self):
+        while True:
+            job = await self._live_queue.get()
+            if job.status != "queued":
+                continue
+            self._live_running += 1
+            await self._run(job)
+
+    async def _run(self, job: JobState):
+        try:
+            job.status = "running"
+            await job.save()
+            job.result = await run_video_job(job)
+            await self._finish(job, "cancelled" if job.cancel_requested else "completed")
+        except asyncio.CancelledError:
+            if job.capture is not None:
+                job.capture.release()
+            raise
+        except Exception as e:
+            job.error = e.detail if isinstance(e, HTTPException) else str(e)
+            if job.cancel_requested:
+                # İptal sırasında kapanan kaynak hatası işi başarısız saydırmaz
+                await self._finish(job, "cancelled")
+            else:
+                print(f"İş {job.id} başarısız: {job.error}")
+                await self._finish(job, "failed")
+        finally:
+            if job.params.get("live"):
+                self._live_running -= 1
+            else:
+                self._running -= 1
+                async with self._slot_free:
+                    self._slot_free.notify_all()
+
+    async def _finish(self, job: JobState, status: str):
+        job.status = status
+        self._finished[status] += 1
+        await job.save(
+            result=json.dumps(job.result) if job.result is not None else None,
+            error=job.error,
+        )
+        if status == "completed":
+            try:
+                await result_cache.store(job)
+            except Exception as e:
+                print(f"İş {job.id} sonucu önbelleğe yazılamadı: {e}")
+        if job.capture is not None:
+            job.capture.release()
+            job.capture = None
+        # Canlı işlerde kaynak bir adres (ya da test için oynatılan dosya) olduğu için silinmez
+        if job.source_path and not job.params.get("live") and os.path.exists(job.source_path):
+            os.remove(job.source_path)
+        job.done.set()
+        # Bitmiş işler bellekte tutulmaz; durumları veritabanından okunur
+        self.jobs.pop(job.id, None)
+
+
+# Uygulama genelinde kullanılacak tekil iş yöneticisi
+job_manager = JobManager()
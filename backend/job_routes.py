@@ -0,0 +1,237 @@
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
+from video_service import build_job_params, mjpeg_stream
+from job_manager import job_manager, job_source_path
+from uploads import save_upload_file, FFmpegPipeCapture, ingest_request_stream
+from live_source import parse_live_source, redact_source
+from result_cache import new_hasher, RESULT_CACHE_ENABLED
+
+router = APIRouter()
+
+
+async def _submit_upload(video_file: UploadFile, params: dict):
+    job_id = job_manager.new_job_id()
+    source_path = job_source_path(job_id, video_file.filename)
+    # İçerik özeti yazarken alınır; aynı video + parametreler için önbellek anahtarıdır
+    hasher = new_hasher() if RESULT_CACHE_ENABLED else None
+    await save_upload_file(video_file, source_path, hasher=hasher)
+    return await job_manager.submit(job_id, video_file.filename, params, source_path,
+                                    video_hash=hasher.hexdigest() if hasher is not None else None)
+
+
+@router.post("/jobs")
+async def submit_job(
+    video_file: UploadFile = File(...),
+    model_name: str = Form("yolov8n"),
+    tracker_name: str = Form("bytetrack"),
+    line_coordinates: str = Form("[[0,0],[0,0]]"),
+    conf_threshold: float = Form(0.25),
+    iou_threshold: float = Form(0.7),
+    selected_class_ids: str = Form("[]"),
+    lines: str = Form("[]"),
+    zones: str = Form("[]"),
+    preview_fps: float = Form(None),
+    preview_width: int = Form(None),
+    preview_quality: int = Form(None),
+    inference_mode: str = Form(None),
+    inference_stride: int = Form(None),
+    roi: str = Form("full"),
+    tile: bool = Form(False),
+    backend: str = Form("auto"),
+    sink: str = Form(None),
+    renderer: str = Form(None),
+    cache: bool = Form(None)
+):
+    """
+    Aynı video daha önce aynı parametrelerle işlendiyse iş "completed" olarak
+    hemen döner. Yalnızca çizgi/bölge ya da sınıf filtresi değiştiyse dedektör
+    çalıştırılmaz, kayıtlı takip kutularıyla sayım yeniden yapılır.
+    cache=false önbelleği okumadan baştan işler ve kaydı yeniler.
+    """
+    params = build_job_params(model_name, tracker_name, line_coordinates, conf_threshold,
+                              iou_threshold, selected_class_ids, lines, zones,
+                              preview_fps, preview_width, preview_quality,
+                              inference_mode, inference_stride, roi, tile, backend,
+                              sink=sink, renderer=renderer, cache=cache)
+    job = await _submit_upload(video_file, params)
+    return job.to_dict()
+
+
+@router.post("/jobs/live")
+async def submit_live_job(
+    source_url: str = Form(...),
+    name: str = Form(None),
+    record: bool = Form(False),
+    model_name: str = Form("yolov8n"),
+    tracker_name: str = Form("bytetrack"),
+    line_coordinates: str = Form("[[0,0],[0,0]]"),
+    conf_threshold: float = Form(0.25),
+    iou_threshold: float = Form(0.7),
+    selected_class_ids: str = Form("[]"),
+    lines: str = Form("[]"),
+    zones: str = Form("[]"),
+    preview_fps: float = Form(None),
+    preview_width: int = Form(None),
+    preview_quality: int = Form(None),
+    inference_mode: str = Form(None),
+    inference_stride: int = Form(None),
+    roi: str = Form("full"),
+    tile: bool = Form(False),
+    backend: str = Form("auto"),
+    sink: str = Form(None),
+    renderer: str = Form(None)
+):
+    """
+    RTSP/HTTP akışı ya da kamera üzerinde iptal edilene kadar çalışan iş başlatır.
+    Sayımlar LIVE_FLUSH_INTERVAL aralıklarla kaydedilir ve yayınlanır.
+    """
+    parse_live_source(source_url)
+    params = build_job_params(model_name, tracker_name, line_coordinates, conf_threshold,
+                              iou_threshold, selected_class_ids, lines, zones,
+                              preview_fps, preview_width, preview_quality,
+                              inference_mode, inference_stride, roi, tile, backend,
+                              live=True, record=record, sink=sink, renderer=renderer)
+    job = await job_manager.submit(job_manager.new_job_id(), name or redact_source(source_url),
+                                   params, source_url)
+    return job.to_dict()
+
+
+@router.get("/jobs")
+async def list_jobs(limit: int = Query(20, ge=1, le=200)):
+    return {"jobs": await job_manager.list_jobs(limit)}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    return await job_manager.get_status(job_id)
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    return await job_manager.cancel(job_id)
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    return await job_manager.get_result(job_id)
+
+
+@router.get("/jobs/{job_id}/preview")
+async def get_job_preview(job_id: str):
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Aktif iş bulunamadı")
+    return StreamingResponse(mjpeg_stream(job.preview()), media_type="multipart/x-mixed-replace; boundary=frame")
+
+
+@router.post("/process-video/")
+async def process_video_endpoint(
+    video_file: UploadFile = File(...),
+    model_name: str = Form("yolov8n"),
+    tracker_name: str = Form("bytetrack"),
+    line_coordinates: str = Form("[[0,0],[0,0]]"),
+    conf_threshold: float = Form(0.25),
+    iou_threshold: float = Form(0.7),
+    selected_class_ids: str = Form("[]"),
+    lines: str = Form("[]"),
+    zones: str = Form("[]"),
+    preview_fps: float = Form(None),
+    preview_width: int = Form(None),
+    preview_quality: int = Form(None),
+    inference_mode: str = Form(None),
+    inference_stride: int = Form(None),
+    roi: str = Form("full"),
+    tile: bool = Form(False),
+    backend: str = Form("auto"),
+    sink: str = Form(None),
+    renderer: str = Form(None),
+    cache: bool = Form(None)
+):
+    # İş arka planda işlenir; bu yanıt yalnızca canlı önizlemeye aboneliktir.
+    # İstemci bağlantıyı kapatsa da iş devam eder.
+    params = build_job_params(model_name, tracker_name, line_coordinates, conf_threshold,
+                              iou_threshold, selected_class_ids, lines, zones,
+                              preview_fps, preview_width, preview_quality,
+                              inference_mode, inference_stride, roi, tile, backend,
+                              sink=sink, renderer=renderer, cache=cache)
+    job = await _submit_upload(video_file, params)
+    return StreamingResponse(mjpeg_stream(job.preview()), media_type="multipart/x-mixed-replace; boundary=frame",
+                             headers={"X-Job-Id": job.id})
+
+
+@router.post("/process-video-stream/")
+async def process_video_stream_endpoint(
+    request: Request,
+    filename: str = Query("upload.mp4"),
+    model_name: str = Query("yolov8n"),
+    tracker_name: str = Query("bytetrack"),
+    line_coordinates: str = Query("[[0,0],[0,0]]"),
+    conf_threshold: float = Query(0.25),
+    iou_threshold: float = Query(0.7),
+    selected_class_ids: str = Query("[]"),
+    lines: str = Query("[]"),
+    zones: str = Query("[]"),
+    preview_fps: float = Query(None),
+    preview_width: int = Query(None),
+    preview_quality: int = Query(None),
+    inference_mode: str = Query(None),
+    inference_stride: int = Query(None),
+    roi: str = Query("full"),
+    tile: bool = Query(False),
+    backend: str = Query("auto"),
+    sink: str = Query(None),
+    renderer: str = Query(None),
+    cache: bool = Query(None)
+):
+    """
+    Video ham gövde (application/octet-stream) olarak gönderilir. Boş bir
+    worker varsa gelen parçalar ffmpeg decoder'a da borulanır ve iş yükleme
+    sürerken başlar; aksi halde dosya tamamlanınca kuyruğa alınır. Akışa
+    uygun olmayan kapsayıcılarda (ör. moov atomu sonda olan mp4) yükleme
+    bitince dosyadan okunur. Yükleme bitince iş bilgisi döner. Sonuç önbelleği
+    yalnızca dosyadan okunan işlerde kullanılır (yükleme sürerken başlayan işin
+    içerik özeti başlangıçta bilinmez).
+    """
+    params = build_job_params(model_name, tracker_name, line_coordinates, conf_threshold,
+                              iou_threshold, selected_class_ids, lines, zones,
+                              preview_fps, preview_width, preview_quality,
+                              inference_mode, inference_stride, roi, tile, backend,
+                              sink=sink, renderer=renderer, cache=cache)
+    job_id = job_manager.new_job_id()
+    source_path = job_source_path(job_id, filename)
+
+    # Yer ayrılmadan decoder açılmaz: kuyrukta bekleyen işin decoder'ını okuyan olmaz, yükleme takılır
+    reserved = job_manager.reserve_slot()
+    decoder = FFmpegPipeCapture() if reserved else None
+    hasher = new_hasher() if RESULT_CACHE_ENABLED else None
+    ingest = asyncio.create_task(ingest_request_stream(request, decoder, source_path, hasher=hasher))
+    job = None
+    try:
+        if decoder is not None and not await asyncio.to_thread(decoder.read_header):
+            decoder.release()
+            decoder = None
+        if ingest.done():
+            # Yükleme başlık okunurken bittiyse (ör. 413) iş hiç başlatılmaz
+            await ingest
+        if decoder is not None:
+            job = await job_manager.submit(job_id, filename, params, source_path, capture=decoder, reserved=True)
+        elif reserved:
+            reserved = False
+            await job_manager.release_slot()
+        await ingest
+        if job is None:
+            job = await job_manager.submit(job_id, filename, params, source_path,
+                                           video_hash=hasher.hexdigest() if hasher is not None else None)
+        return job.to_dict()
+    except BaseException:
+        if not ingest.done():
+            ingest.cancel()
+        if job is not None:
+            await job_manager.cancel(job.id)
+        else:
+            if decoder is not None:
+                decoder.release()
+            if reserved:
+                await job_manager.release_slot()
+        raise
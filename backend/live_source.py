@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+from collections import deque
+from urllib.parse import urlparse
+import cv2
+from fastapi import HTTPException
+
+# Yeniden bağlanma beklemesi: her başarısız denemede ikiye katlanır, en fazla LIVE_RECONNECT_MAX
+LIVE_RECONNECT_MIN = float(os.getenv("LIVE_RECONNECT_MIN", "0.5"))
+LIVE_RECONNECT_MAX = float(os.getenv("LIVE_RECONNECT_MAX", "30"))
+# İlk karenin en fazla beklenme süresi ve ağ akışları için açma/okuma zaman aşımı (saniye)
+LIVE_CONNECT_TIMEOUT = float(os.getenv("LIVE_CONNECT_TIMEOUT", "15"))
+LIVE_READ_TIMEOUT = float(os.getenv("LIVE_READ_TIMEOUT", "10"))
+# Canlı işlerde sayımların veritabanına ve istemcilere aktarılma aralığı (saniye)
+LIVE_FLUSH_INTERVAL = float(os.getenv("LIVE_FLUSH_INTERVAL", "10"))
+# Canlı işlerde pipeline kuyruklarının kapasitesi; küçük tutulması gecikmeyi sınırlar
+LIVE_PIPELINE_QUEUE_SIZE = int(os.getenv("LIVE_PIPELINE_QUEUE_SIZE", "2"))
+# Sunucudaki bir video dosyasının canlı kaynak gibi (gerçek zamanlı, döngüde) oynatılmasına izin ver
+LIVE_ALLOW_FILES = os.getenv("LIVE_ALLOW_FILES", "0") == "1"
+
+LIVE_SCHEMES = ("rtsp", "rtsps", "rtmp", "http", "https", "udp", "tcp", "srt")
+# Akış bilgisi gelmeyen kaynaklarda varsayılan FPS
+_DEFAULT_FPS = 25.0
+
+
+def redact_source(source) -> str:
+    """Adresteki kullanıcı adı/parolayı loglarda ve yanıtlarda gizler."""
+    source = str(source)
+    parsed = urlparse(source)
+    if parsed.scheme and "@" in parsed.netloc:
+        return source.replace(parsed.netloc, "***@" + parsed.netloc.rsplit("@", 1)[1], 1)
+    return source
+
+
+def parse_live_source(url: str):
+    """Canlı kaynak adresini doğrular; kamera indeksi için int döndürür."""
+    url = (url or "").strip()
+    if url.isdigit():
+        return int(url)
+    if url.startswith("/dev/video"):
+        return url
+    if urlparse(url).scheme.lower() in LIVE_SCHEMES:
+        return url
+    if LIVE_ALLOW_FILES and os.path.isfile(url):
+        return url
+    raise HTTPException(status_code=400, detail=f"Desteklenmeyen canlı kaynak: {redact_source(url)}. "
+                                                f"Desteklenen: {', '.join(LIVE_SCHEMES)}, kamera indeksi")
+
+
+class LiveCapture:
+    """
+    Canlı akışı kendi thread'inde okuyan, yalnızca en son kareyi tutan
+    cv2.VideoCapture benzeri kaynak. İşleme yavaş kalırsa eski kareler
+    atılır, gecikme birikmez. Akış koparsa artan beklemeyle yeniden bağlanır.
+    Dosya kaynakları kendi FPS'inde ve döngü halinde oynatılır (test için).
+    """
+
+    def __init__(self, source, reconnect_min: float = LIVE_RECONNECT_MIN,
+                 reconnect_max: float = LIVE_RECONNECT_MAX):
+        self.source = source
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.pace = isinstance(source, str) and os.path.isfile(source)
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._read_seq = 0
+        # Okunan her karenin kaynaktaki sıra numarası (atılan kareler dahil), okuma sırasıyla
+        self._positions = deque()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._props = {}
+        self._stats = {"connected": False, "connects": 0, "reconnects": 0, "frames_captured": 0,
+                       "frames_dropped": 0, "last_error": None}
+        self._thread = threading.Thread(target=self._run, daemon=True, name="live-capture")
+        self._thread.start()
+
+    def _open(self):
+        if isinstance(self.source, str) and urlparse(self.source).scheme:
+            params = []
+            if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+                params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(LIVE_CONNECT_TIMEOUT * 1000),
+                          cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(LIVE_READ_TIMEOUT * 1000)]
+            cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG, params)
+        else:
+            cap = cv2.VideoCapture(self.source)
+        if cap.isOpened():
+            # Sürücü tarafında kare biriktirilmez (destekleyen kaynaklarda)
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            return cap
+        cap.release()
+        return None
+
+    def _run(self):
+        delay = self.reconnect_min
+        while not self._stop.is_set():
+            cap = self._open()
+            if cap is None:
+                self._stats["last_error"] = "Kaynak açılamadı"
+            else:
+                self._stats["connects"] += 1
+                self._stats["connected"] = True
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                self._props = {
+                    cv2.CAP_PROP_FRAME_WIDTH: cap.get(cv2.CAP_PROP_FRAME_WIDTH),
+                    cv2.CAP_PROP_FRAME_HEIGHT: cap.get(cv2.CAP_PROP_FRAME_HEIGHT),
+                    # RTSP kaynakları çoğu zaman 0 ya da zaman tabanını (ör. 90000) bildirir
+                    cv2.CAP_PROP_FPS: fps if 0 < fps <= 120 else _DEFAULT_FPS,
+                }
+                try:
+                    if self._read_frames(cap):
+                        delay = self.reconnect_min
+                finally:
+                    cap.release()
+                    self._stats["connected"] = False
+            if self._stop.is_set():
+                break
+            self._stats["reconnects"] += 1
+            print(f"Canlı kaynak kesildi, {delay:.1f} sn sonra yeniden bağlanılacak: {redact_source(self.source)}")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    def _read_frames(self, cap) -> bool:
+        """Akış bitene kadar kareleri okur; en az bir kare okunduysa True döner."""
+        interval = 1.0 / self._props[cv2.CAP_PROP_FPS] if self.pace else 0.0
+        next_at = time.monotonic()
+        got_frame = False
+        while not self._stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                self._stats["last_error"] = "Kare okunamadı"
+                return got_frame
+            got_frame = True
+            with self._cond:
+                if self._seq > self._read_seq:
+                    # Önceki kare hiç işlenmeden yenisi geldi
+                    self._stats["frames_dropped"] += 1
+                self._frame = frame
+                self._seq += 1
+                self._stats["frames_captured"] += 1
+                self._cond.notify_all()
+            self._ready.set()
+            if interval:
+                next_at += interval
+                self._stop.wait(max(0.0, next_at - time.monotonic()))
+        return got_frame
+
+    # --- cv2.VideoCapture arayüzü ---
+
+    def read(self):
+        """Henüz okunmamış en son kareyi bekler; kaynak durdurulduysa (False, None) döner."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._stop.is_set() or self._seq > self._read_seq)
+            if self._stop.is_set():
+                return False, None
+            self._read_seq = self._seq
+            self._positions.append(self._seq)
+            return True, self._frame
+
+    def frame_position(self) -> int:
+        """
+        Okunan kareler sırasıyla tüketildiğinde sıradaki karenin kaynaktaki
+        numarası; atılan kareler de sayıldığı için süreler gerçek zamana yakındır.
+        """
+        return self._positions.popleft()
+
+    def isOpened(self) -> bool:
+        # İlk kare gelene kadar bloklar (event loop'tan to_thread ile çağrılır)
+        return self._ready.wait(LIVE_CONNECT_TIMEOUT) and not self._stop.is_set()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return 0.0
+        return float(self._props.get(prop, 0.0))
+
+    def set(self, prop, value) -> bool:
+        return False
+
+    def stop(self):
+        self._stop.set()
+        # Bağlantı beklenirken durdurulursa isOpened hemen döner
+        self._ready.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def release(self):
+        self.stop()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=LIVE_READ_TIMEOUT)
+
+    def stats(self) -> dict:
+        return {**self._stats, "source": redact_source(self.source)}
@@ -1,9 +1,21 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import WebSocket, WebSocketDisconnect
-from database.config import connect_db, disconnect_db, create_db_tables
+import json
+from database.config import database, connect_db, disconnect_db, create_db_tables
 from detection_routes import router as detection_router
-from websocket_manager import manager
+from job_routes import router as job_router
+from metrics_routes import router as metrics_router
+from history_routes import router as history_router
+from batch_routes import router as batch_router
+from batch import batch_manager
+from video_routes import router as video_router
+from video_store import video_store
+from job_manager import job_manager
+from websocket_manager import manager, job_topic
+from detection_writer import detection_writer
+from warmup import warmup
 
 
 # uygulama başlatırken bilgi eklendi
@@ -34,13 +46,32 @@ app.add_middleware(
 async def startup_event():
     await connect_db()
     await create_db_tables()
+    await detection_writer.start()
+    # Saklama tablosu işler başlamadan dizinle eşitlenir
+    await video_store.start()
+    await job_manager.start()
+    # Modeller arka planda ısıtılır; API bu sırada cevap vermeye devam eder
+    warmup.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await warmup.stop()
+    await batch_manager.stop()
+    await manager.stop()
+    # Çalışan işler checkpoint'lerini kaydedip durur, açılışta devam ederler
+    await job_manager.stop()
+    await video_store.stop()
+    # Tampondaki tespit kayıtları bağlantı kapanmadan yazılır
+    await detection_writer.stop()
     await disconnect_db()
 
 # Route'ları tanıt
 app.include_router(detection_router)
+app.include_router(job_router)
+app.include_router(metrics_router)
+app.include_router(history_router)
+app.include_router(batch_router)
+app.include_router(video_router)
 
 # Ana endpoint
 @app.get("/")
@@ -52,15 +83,50 @@ async def root():
     }
 
 
+# Süreç ayakta mı (orkestratörün liveness kontrolü)
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
 
-@app.websocket("/ws/video-count")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+# Trafik almaya hazır mı: veritabanı bağlı ve ön yükleme bitmiş olmalı
+@app.get("/health/ready")
+async def readiness():
+    ready = database.is_connected and warmup.done
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "status": "ready" if ready else "not_ready",
+        "database": database.is_connected,
+        "warmup": warmup.to_dict(),
+    })
+
+async def _serve_websocket(websocket: WebSocket, topics: set[str] = None):
+    await manager.connect(websocket, topics)
     try:
         while True:
             data = await websocket.receive_text()
+            # {"action": "subscribe" | "unsubscribe", "topics": ["job:<id>", ...]}
+            try:
+                command = json.loads(data)
+            except ValueError:
+                command = None
+            if isinstance(command, dict) and command.get("action") in ("subscribe", "unsubscribe"):
+                topics = [str(t) for t in command.get("topics", [])]
+                topics += [job_topic(j) for j in command.get("job_ids", [])]
+                if command["action"] == "subscribe":
+                    manager.subscribe(websocket, topics)
+                else:
+                    manager.unsubscribe(websocket, topics)
+                continue
             print(f"Gelen mesaj: {data}")
-            await manager.broadcast(f"Sunucudan mesaj: {data}")
+            manager.publish(f"Sunucudan mesaj: {data}")
     except WebSocketDisconnect:
         manager.disconnect(websocket)
         print("WebSocket bağlantısı kesildi.")
+
+# Konu verilmezse tüm işlerin olaylarını alır; ?job_id=... ile tek işe abone olunur
+@app.websocket("/ws/video-count")
+async def websocket_endpoint(websocket: WebSocket, job_id: str = None):
+    await _serve_websocket(websocket, {job_topic(job_id)} if job_id else None)
+
+@app.websocket("/ws/jobs/{job_id}")
+async def job_websocket_endpoint(websocket: WebSocket, job_id: str):
+    await _serve_websocket(websocket, {job_topic(job_id)})
@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Yüzdelik hesapları için aşama başına saklanan en fazla örnek
+METRICS_MAX_SAMPLES = int(os.getenv("METRICS_MAX_SAMPLES", "10000"))
+# Prometheus histogram kova sınırları (saniye)
+METRICS_BUCKETS = tuple(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5").split(","))
+
+_PREFIX = "yolo_counter"
+
+
+class StageStats:
+    """Bir aşamanın süre istatistikleri (saniye)."""
+
+    __slots__ = ("count", "total", "max", "samples", "buckets")
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+        # Kova başına (kümülatif olmayan) gözlem sayısı; son eleman +Inf
+        self.buckets = [0] * (len(METRICS_BUCKETS) + 1)
+
+    def add(self, seconds: float, count: int):
+        self.count += count
+        self.total += seconds * count
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+        for i, bound in enumerate(METRICS_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += count
+                return
+        self.buckets[-1] += count
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 4) if self.count else 0.0,
+            "p50_ms": round(pct(0.50), 4),
+            "p99_ms": round(pct(0.99), 4),
+            "max_ms": round(self.max * 1000, 4),
+        }
+
+
+_stages: dict[str, StageStats] = {}
+_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float, count: int = 1):
+    """
+    Aşama süresini kaydeder. Bir çağrı birden fazla kareyi işlediyse
+    seconds kare başı süre, count kare sayısı olarak verilir.
+    """
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats(METRICS_MAX_SAMPLES)
+        stats.add(seconds, count)
+
+
+@contextmanager
+def timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {name: stats.summary() for name, stats in sorted(_stages.items())}
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+# --- Prometheus metin formatı ---
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def render_prometheus(families: list[tuple]) -> str:
+    """
+    Aşama histogramlarını ve verilen ek metrikleri Prometheus metin
+    formatında (0.0.4) döndürür. families: (ad, tip, açıklama, [(etiketler, değer), ...]).
+    """
+    name = f"{_PREFIX}_stage_seconds"
+    lines = [f"# HELP {name} Aşama başına kare işleme süresi (saniye)", f"# TYPE {name} histogram"]
+    with _lock:
+        stages = [(stage, list(s.buckets), s.total, s.count) for stage, s in sorted(_stages.items())]
+    for stage, buckets, total, count in stages:
+        cumulative = 0
+        for bound, n in zip(METRICS_BUCKETS + (float("inf"),), buckets):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{_labels({"stage": stage, "le": le})} {cumulative}')
+        lines.append(f'{name}_sum{_labels({"stage": stage})} {_number(total)}')
+        lines.append(f'{name}_count{_labels({"stage": stage})} {count}')
+
+    for family, kind, help_text, samples in families:
+        family = f"{_PREFIX}_{family}"
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{family}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
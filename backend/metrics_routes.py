@@ -0,0 +1,119 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from model_manager import model_pool
+from inference_scheduler import scheduler_stats
+from detection_writer import detection_writer
+from websocket_manager import manager
+from job_manager import job_manager
+from pipeline import pipeline_stats
+import result_cache
+from profiling import thread_dump, sample_threads, profile_event_loop, PROFILE_INTERVAL_MS
+import metrics
+import asyncio
+
+router = APIRouter()
+
+
+def _collect_families() -> list[tuple]:
+    """Bileşenlerin anlık durumunu Prometheus metrik ailelerine çevirir."""
+    jobs = job_manager.stats()
+    pool = model_pool.stats()
+    writer = detection_writer.stats()
+    ws = manager.stats()
+    schedulers = scheduler_stats()
+    pipelines = pipeline_stats()
+    cache = result_cache.stats()
+
+    return [
+        ("jobs_running", "gauge", "Çalışan iş sayısı", [({}, jobs["running"])]),
+        ("jobs_queued", "gauge", "Kuyrukta bekleyen iş sayısı", [({}, jobs["queued"])]),
+        ("live_jobs_running", "gauge", "Çalışan canlı akış işi sayısı", [({}, jobs["live_running"])]),
+        ("live_jobs_queued", "gauge", "Yer bekleyen canlı akış işi sayısı", [({}, jobs["live_queued"])]),
+        ("jobs_finished_total", "counter", "Süreç başladığından beri biten işler",
+         [({"status": status}, n) for status, n in jobs["finished"].items()]),
+        ("job_frames_processed", "gauge", "Çalışan işlerin işlediği kare sayısı",
+         [({"job_id": j["job_id"]}, j["frames_processed"]) for j in jobs["jobs"]]),
+        ("job_preview_subscribers", "gauge", "İş başına önizleme izleyicisi",
+         [({"job_id": j["job_id"]}, j["preview_subscribers"]) for j in jobs["jobs"]]),
+        ("pipeline_queue_depth", "gauge", "Pipeline aşama kuyruklarındaki kare sayısı",
+         [({"pipeline": p["name"], "queue": q}, n) for p in pipelines for q, n in p["queues"].items()]),
+        ("inference_queue_depth", "gauge", "Batch scheduler kuyruğunda bekleyen kare",
+         [({"model": s["model"]}, s["queued"]) for s in schedulers]),
+        ("inference_batches_total", "counter", "Çalıştırılan predict batch sayısı",
+         [({"model": s["model"]}, s["batches"]) for s in schedulers]),
+        ("inference_frames_total", "counter", "Batch scheduler'dan geçen kare sayısı",
+         [({"model": s["model"]}, s["frames"]) for s in schedulers]),
+        ("model_pool_hits_total", "counter", "Havuzdan karşılanan model istekleri", [({}, pool["hits"])]),
+        ("model_pool_misses_total", "counter", "Havuzda bulunmayan model istekleri", [({}, pool["misses"])]),
+        ("model_pool_loads_total", "counter", "Model yükleme sayısı", [({}, pool["loads"])]),
+        ("model_pool_load_errors_total", "counter", "Başarısız model yüklemeleri", [({}, pool["load_errors"])]),
+        ("model_pool_evictions_total", "counter", "Havuzdan çıkarılan modeller", [({}, pool["evictions"])]),
+        ("model_pool_models", "gauge", "Havuzdaki model sayısı", [({}, len(pool["models"]))]),
+        ("model_pool_used_bytes", "gauge", "Havuzdaki modellerin tahmini boyutu",
+         [({}, int(pool["used_mb"] * 2**20))]),
+        ("model_pool_leases", "gauge", "Model başına aktif kiralama",
+         [({"model": m["name"], "backend": m["backend"]}, m["leases"]) for m in pool["models"]]),
+        ("detection_writer_pending", "gauge", "Veritabanına yazılmayı bekleyen tespit satırı",
+         [({}, writer["pending"])]),
+        ("detection_writer_rows_written_total", "counter", "Yazılan tespit satırları",
+         [({}, writer["rows_written"])]),
+        ("detection_writer_flush_errors_total", "counter", "Başarısız toplu yazmalar",
+         [({}, writer["flush_errors"])]),
+        ("detection_writer_backpressure_waits_total", "counter", "Tampon dolu olduğu için bekleyen eklemeler",
+         [({}, writer["backpressure_waits"])]),
+        ("websocket_connections", "gauge", "Açık WebSocket bağlantıları", [({}, ws["connections"])]),
+        ("websocket_pending_messages", "gauge", "Gönderilmeyi bekleyen WebSocket mesajları",
+         [({}, ws["pending"])]),
+        ("websocket_published_total", "counter", "Yayınlanan mesajlar", [({}, ws["published"])]),
+        ("websocket_dropped_total", "counter", "Kuyruk dolduğu için atılan mesajlar (açık bağlantılar)",
+         [({}, ws["dropped"])]),
+        ("websocket_evicted_total", "counter", "Yavaş ya da kopuk olduğu için atılan istemciler",
+         [({}, ws["evicted"])]),
+        ("result_cache_lookups_total", "counter", "Sonuç önbelleği sorguları",
+         [({"result": "hit"}, cache["result_hits"]), ({"result": "miss"}, cache["result_misses"])]),
+        ("detection_cache_lookups_total", "counter", "Tespit önbelleği sorguları (hit: sayım yeniden oynatıldı)",
+         [({"result": "hit"}, cache["detection_hits"]), ({"result": "miss"}, cache["detection_misses"])]),
+        ("result_cache_stored_total", "counter", "Önbelleğe yazılan kayıtlar",
+         [({"cache": "result"}, cache["results_stored"]), ({"cache": "detections"}, cache["detections_stored"])]),
+    ]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(_collect_families()),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/metrics/stages")
+async def get_stage_metrics():
+    # Aşama başına yüzdelikler (ms); hangi aşamanın darboğaz olduğunu gösterir
+    return metrics.snapshot()
+
+
+@router.get("/debug/threads")
+async def get_thread_dump():
+    return {"threads": thread_dump()}
+
+
+@router.get("/debug/profile/loop", response_class=PlainTextResponse)
+async def profile_loop(seconds: float = Query(5.0, gt=0)):
+    report = await profile_event_loop(seconds)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Başka bir profil işlemi sürüyor")
+    return report
+
+
+@router.get("/jobs/{job_id}/profile")
+async def profile_job(job_id: str, seconds: float = Query(5.0, gt=0),
+                      interval_ms: float = Query(PROFILE_INTERVAL_MS, gt=0),
+                      format: str = Query("json", pattern="^(json|folded)$")):
+    """Çalışan bir işin pipeline thread'lerini örnekleyerek profiller."""
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="İş bulunamadı")
+    if job.status != "running":
+        raise HTTPException(status_code=409, detail=f"İş çalışmıyor (durum: {job.status})")
+    result = await asyncio.to_thread(sample_threads, f"job-{job_id}-", seconds, interval_ms)
+    if format == "folded":
+        return PlainTextResponse(result["folded"])
+    return {"job_id": job_id, **result}
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import importlib.util
+from fastapi import HTTPException
+
+# Dışa aktarılmış (ONNX/OpenVINO) modellerin saklandığı dizin
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/app/model_cache")
+# Dışa aktarımda kullanılan giriş boyutu; önbellek anahtarının parçasıdır
+EXPORT_IMGSZ = int(os.getenv("EXPORT_IMGSZ", "640"))
+# "auto" seçildiğinde ölçüm yoksa denenecek sıra (en hızlıdan yavaşa)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "auto")
+BACKEND_PREFERENCE = [b.strip() for b in os.getenv(
+    "BACKEND_PREFERENCE", "openvino,onnx,pytorch").split(",") if b.strip()]
+
+os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+
+# Arka uç adı -> (ultralytics export formatı, export argümanları, gereken paketler)
+BACKENDS = {
+    "pytorch": (None, {}, ()),
+    "onnx": ("onnx", {"dynamic": True, "simplify": True}, ("onnxruntime",)),
+    # ONNX INT8: dışa aktarılan model onnxruntime ile dinamik olarak nicemlenir
+    "onnx-int8": ("onnx", {"dynamic": True, "simplify": True}, ("onnxruntime",)),
+    "openvino": ("openvino", {"dynamic": True}, ("openvino",)),
+    "openvino-fp16": ("openvino", {"dynamic": True, "half": True}, ("openvino",)),
+    # OpenVINO INT8 kalibrasyonu NNCF ile yapılır; batch scheduler birden çok kare gönderdiği için dinamik
+    "openvino-int8": ("openvino", {"dynamic": True, "int8": True}, ("openvino", "nncf")),
+}
+
+_BENCHMARKS_FILE = os.path.join(MODEL_CACHE_DIR, "benchmarks.json")
+
+_hash_cache: dict[tuple, str] = {}
+_export_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def backend_available(backend: str) -> bool:
+    if backend not in BACKENDS:
+        return False
+    return all(importlib.util.find_spec(pkg) is not None for pkg in BACKENDS[backend][2])
+
+
+def available_backends() -> list[str]:
+    return [b for b in BACKENDS if backend_available(b)]
+
+
+def weights_hash(model_path: str) -> str:
+    """Ağırlık dosyasının SHA-256 özeti (dosya değişmedikçe yeniden hesaplanmaz)."""
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _hash_cache[key] = h.hexdigest()
+    return digest
+
+
+def _is_exported(model_path: str) -> bool:
+    return model_path.endswith(".onnx")
+
+
+def resolve_backend(requested: str | None, model_path: str) -> str:
+    """
+    İstenen arka ucu doğrular. "auto" için önce bu ağırlıklarla yapılmış
+    ölçümlerdeki en hızlı kullanılabilir arka uç, yoksa BACKEND_PREFERENCE
+    sırasındaki ilk kullanılabilir arka uç seçilir.
+    """
+    requested = requested or INFERENCE_BACKEND
+    if model_path.startswith("memory://"):
+        # Bellekteki modeller dışa aktarılamaz, olduğu gibi çalıştırılır
+        return "pytorch"
+    if _is_exported(model_path):
+        # ONNX olarak yüklenmiş özel modeller olduğu gibi çalıştırılır
+        return "onnx"
+    if requested != "auto":
+        if requested not in BACKENDS:
+            raise HTTPException(status_code=400, detail=f"Geçersiz arka uç: {requested}")
+        if not backend_available(requested):
+            raise HTTPException(status_code=400, detail=f"Arka uç bu sunucuda kullanılamıyor: {requested}")
+        return requested
+
+    if os.path.exists(model_path):
+        measured = load_benchmarks().get(weights_hash(model_path), {})
+        ranked = sorted((r["ms_per_frame"], b) for b, r in measured.items()
+                        if r.get("ms_per_frame") and backend_available(b))
+        if ranked:
+            return ranked[0][1]
+    for backend in BACKEND_PREFERENCE:
+        if backend_available(backend):
+            return backend
+    return "pytorch"
+
+
+def artifact_dir(model_path: str, backend: str, imgsz: int = EXPORT_IMGSZ) -> str:
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}-{weights_hash(model_path)[:16]}-{backend}-{imgsz}")
+
+
+def cached_artifact(model_path: str, backend: str, imgsz: int = EXPORT_IMGSZ) -> str | None:
+    meta_path = os.path.join(artifact_dir(model_path, backend, imgsz), "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)["artifact"]
+
+
+def export_model(model_path: str, backend: str, imgsz: int = EXPORT_IMGSZ) -> str:
+    """
+    Ağırlıkları istenen arka uca bir kez dışa aktarır ve yolunu döndürür.
+    Aynı ağırlık/arka uç/boyut için sonraki çağrılar önbellekten döner.
+    Bloklayan bir işlemdir; event loop dışında çağrılmalıdır.
+    """
+    if backend == "pytorch" or _is_exported(model_path):
+        return model_path
+    if not os.path.exists(model_path):
+        # Hazır modeller ilk kullanımda ultralytics tarafından indirilir
+        from ultralytics import YOLO
+        YOLO(model_path)
+
+    target = artifact_dir(model_path, backend, imgsz)
+    with _locks_guard:
+        lock = _export_locks.setdefault(target, threading.Lock())
+    with lock:
+        artifact = cached_artifact(model_path, backend, imgsz)
+        if artifact and os.path.exists(artifact):
+            return artifact
+
+        from ultralytics import YOLO
+        fmt, kwargs, _ = BACKENDS[backend]
+        work = target + ".tmp"
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        # Ultralytics çıktıyı ağırlıkların yanına yazar; bu yüzden kopya üzerinde çalışılır
+        weights = os.path.join(work, "model" + os.path.splitext(model_path)[1])
+        shutil.copyfile(model_path, weights)
+
+        started = time.perf_counter()
+        try:
+            exported = YOLO(weights).export(format=fmt, imgsz=imgsz, verbose=False, **kwargs)
+            if backend == "onnx-int8":
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantized = os.path.join(work, "model-int8.onnx")
+                quantize_dynamic(exported, quantized, weight_type=QuantType.QUInt8)
+                exported = quantized
+        except Exception as e:
+            shutil.rmtree(work, ignore_errors=True)
+            raise HTTPException(status_code=500, detail=f"Model dışa aktarılamadı ({backend}): {e}")
+        elapsed = time.perf_counter() - started
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(work, target)
+        artifact = os.path.join(target, os.path.relpath(str(exported), work))
+        with open(os.path.join(target, "meta.json"), "w") as f:
+            json.dump({"source": os.path.abspath(model_path), "sha256": weights_hash(model_path),
+                       "backend": backend, "imgsz": imgsz, "artifact": artifact,
+                       "export_seconds": round(elapsed, 2)}, f)
+        print(f"Model dışa aktarıldı: {os.path.basename(model_path)} -> {backend} ({elapsed:.1f} sn)")
+        return artifact
+
+
+def list_artifacts() -> list[dict]:
+    artifacts = []
+    for name in sorted(os.listdir(MODEL_CACHE_DIR)):
+        meta_path = os.path.join(MODEL_CACHE_DIR, name, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                artifacts.append(json.load(f))
+    return artifacts
+
+
+def load_benchmarks() -> dict:
+    if not os.path.exists(_BENCHMARKS_FILE):
+        return {}
+    with open(_BENCHMARKS_FILE) as f:
+        return json.load(f)
+
+
+def save_benchmark(model_path: str, results: dict):
+    """Ölçüm sonuçlarını ağırlık özetine göre saklar; "auto" seçimi bunları kullanır."""
+    with _locks_guard:
+        data = load_benchmarks()
+        data.setdefault(weights_hash(model_path), {}).update(results)
+        tmp = _BENCHMARKS_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, _BENCHMARKS_FILE)
@@ -1,6 +1,9 @@
 import os
+import time
+import threading
+from collections import OrderedDict
 from fastapi import HTTPException
-from ultralytics import YOLO
+from model_export import export_model, save_benchmark
 
 # Özel modellerin yükleneceği dizin (Docker için uygun yol)
 CUSTOM_MODELS_DIR = "/app/custom_models"
@@ -29,29 +32,260 @@ SUPPORTED_TRACKERS = {
     "botsort": "botsort.yaml",
 }
 
-# Bellekte tutulan aktif model
-loaded_model = None
-current_model_name = None
+# Model havuzu limitleri (ortam değişkenleriyle ayarlanabilir)
+MODEL_POOL_MAX_MB = float(os.getenv("MODEL_POOL_MAX_MB", "2048"))
+MODEL_POOL_MAX_MODELS = int(os.getenv("MODEL_POOL_MAX_MODELS", "4"))
+
+
+# Dosyadan değil bellekten gelen modeller (ör. benchmark'taki sahte model)
+IN_MEMORY_MODELS: dict[str, object] = {}
+_MEMORY_PREFIX = "memory://"
+
+
+def register_in_memory_model(model_identifier: str, model):
+    """Model nesnesini havuzun dosya yerine doğrudan kullanacağı şekilde kaydeder."""
+    IN_MEMORY_MODELS[model_identifier] = model
 
-def load_yolo_model(model_identifier: str):
-    global loaded_model, current_model_name
 
+def resolve_model_path(model_identifier: str) -> str:
+    if model_identifier in IN_MEMORY_MODELS:
+        return _MEMORY_PREFIX + model_identifier
     if model_identifier in SUPPORTED_YOLO_MODELS:
-        model_path = SUPPORTED_YOLO_MODELS[model_identifier]
-    elif os.path.exists(os.path.join(CUSTOM_MODELS_DIR, model_identifier)):
-        model_path = os.path.join(CUSTOM_MODELS_DIR, model_identifier)
-    else:
-        raise HTTPException(status_code=400, detail=f"Model bulunamadı: {model_identifier}")
+        return SUPPORTED_YOLO_MODELS[model_identifier]
+    custom_path = os.path.join(CUSTOM_MODELS_DIR, model_identifier)
+    if os.path.exists(custom_path):
+        return custom_path
+    raise HTTPException(status_code=400, detail=f"Model bulunamadı: {model_identifier}")
 
-    if current_model_name == model_identifier and loaded_model is not None:
-        return loaded_model
 
+def pool_key(model_identifier: str, backend: str = "pytorch") -> str:
+    return model_identifier if backend == "pytorch" else f"{model_identifier}@{backend}"
+
+
+def _path_bytes(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f))
+                   for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+
+def _estimate_model_bytes(model, model_path: str) -> int:
+    # Parametre boyutu bellekteki gerçek maliyete en yakın tahmin; yoksa dosya boyutu
     try:
-        loaded_model = YOLO(model_path)
-        current_model_name = model_identifier
-        return loaded_model
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Model yükleme hatası: {e}")
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except Exception:
+        pass
+    for path in (model_path, getattr(model, "ckpt_path", None)):
+        if path and os.path.exists(path):
+            return _path_bytes(path)
+    return 0
+
+
+class PooledModel:
+    """Havuzdaki tek bir modelin ağırlıkları ve kullanım bilgisi."""
+
+    def __init__(self, name: str, model, size_bytes: int, backend: str = "pytorch"):
+        self.name = name
+        self.backend = backend
+        self.model = model
+        self.size_bytes = size_bytes
+        # Aynı ağırlıklar üzerinde predict çağrıları bu kilitle sıraya girer
+        self.lock = threading.Lock()
+        self.leases = 0
+        self.last_used = time.monotonic()
+        # Bu modelin batch scheduler'ı (inference_scheduler.get_scheduler ilk kullanımda atar)
+        self.scheduler = None
+
+
+class ModelPool:
+    """
+    Birden fazla modeli bellek bütçesi içinde tutan LRU havuz.
+    Kullanımdaki (kiralanmış) modeller tahliye edilmez.
+    """
+
+    def __init__(self, max_bytes: int, max_models: int):
+        self.max_bytes = max_bytes
+        self.max_models = max_models
+        self._entries: OrderedDict[str, PooledModel] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+        # Model dosyası değiştikçe artar; eski ağırlıklarla süren yükleme havuza eklenmez
+        self._generations: dict[str, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "load_errors": 0,
+                       "evictions": 0, "load_seconds_total": 0.0}
+
+    def acquire(self, model_identifier: str, backend: str = "pytorch") -> PooledModel:
+        """Modeli havuzdan kiralar; işi biten çağıran release() etmelidir."""
+        # Kira havuz kilidi altında alınır; başka bir yükleme araya girip modeli tahliye edemez
+        return self._get_or_load(model_identifier, backend, lease=True)
+
+    def release(self, entry: PooledModel):
+        with self._lock:
+            entry.leases = max(0, entry.leases - 1)
+            entry.last_used = time.monotonic()
+            self._evict_if_needed()
+
+    def invalidate(self, model_identifier: str):
+        """
+        Modelin tüm arka uçlardaki kayıtlarını havuzdan çıkarır (ör. aynı isimle
+        yeni ağırlıklar yüklendiğinde). Kullanımdaki işler ellerindeki modelle
+        devam eder; sonraki kiralamalar yeni dosyayı yükler.
+        """
+        with self._lock:
+            self._generations[model_identifier] = self._generations.get(model_identifier, 0) + 1
+            for key in [k for k in self._entries if k == model_identifier or k.startswith(model_identifier + "@")]:
+                del self._entries[key]
+                print(f"Model havuzdan çıkarıldı (güncellendi): {key}")
+
+    def get(self, model_identifier: str):
+        """Kiralamadan model nesnesini döndürür (metadata okumak gibi kısa işler için)."""
+        return self._get_or_load(model_identifier).model
+
+    def peek(self, model_identifier: str, backend: str = "pytorch"):
+        """Model havuzda yüklüyse döndürür; yüklü değilse None (hiç yükleme yapmaz)."""
+        with self._lock:
+            entry = self._entries.get(pool_key(model_identifier, backend))
+            return entry.model if entry is not None else None
+
+    def _get_or_load(self, model_identifier: str, backend: str = "pytorch", lease: bool = False) -> PooledModel:
+        model_path = resolve_model_path(model_identifier)
+        key = pool_key(model_identifier, backend)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.last_used = time.monotonic()
+                entry.leases += lease
+                self._stats["hits"] += 1
+                return entry
+            self._stats["misses"] += 1
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Aynı model için eşzamanlı istekler ağırlıkları yalnızca bir kez yükler
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.leases += lease
+                    return entry
+                generation = self._generations.get(model_identifier, 0)
+
+            # ONNX/OpenVINO için önbellekteki dışa aktarılmış model kullanılır (yoksa bir kez üretilir)
+            model_path = export_model(model_path, backend)
+
+            started = time.perf_counter()
+            try:
+                # ultralytics ilk model yüklemesinde içe aktarılır; API açılışını yavaşlatmaz
+                if model_path.startswith(_MEMORY_PREFIX):
+                    model = IN_MEMORY_MODELS[model_identifier]
+                else:
+                    from ultralytics import YOLO
+                    model = YOLO(model_path) if model_path.endswith(".pt") else YOLO(model_path, task="detect")
+            except Exception as e:
+                with self._lock:
+                    self._stats["load_errors"] += 1
+                raise HTTPException(status_code=500, detail=f"Model yükleme hatası: {e}")
+            elapsed = time.perf_counter() - started
+
+            entry = PooledModel(key, model, _estimate_model_bytes(model, model_path), backend)
+            with self._lock:
+                self._stats["loads"] += 1
+                self._stats["load_seconds_total"] += elapsed
+                entry.leases += lease
+                if self._generations.get(model_identifier, 0) == generation:
+                    self._entries[key] = entry
+                    self._evict_if_needed(keep=key)
+            print(f"Model yüklendi: {key} ({elapsed:.2f} sn, "
+                  f"{entry.size_bytes / 2**20:.1f} MB)")
+            return entry
+
+    def _evict_if_needed(self, keep: str = None):
+        # self._lock tutulurken çağrılır
+        def over_budget():
+            total = sum(e.size_bytes for e in self._entries.values())
+            return total > self.max_bytes or len(self._entries) > self.max_models
+
+        for name in list(self._entries.keys()):
+            if not over_budget():
+                return
+            entry = self._entries[name]
+            if name == keep or entry.leases > 0:
+                continue
+            del self._entries[name]
+            self._stats["evictions"] += 1
+            print(f"Model havuzdan çıkarıldı: {name}")
+
+        if over_budget():
+            print("Uyarı: model havuzu bütçeyi aşıyor, tüm modeller kullanımda.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+                "max_mb": self.max_bytes / 2**20,
+                "max_models": self.max_models,
+                "used_mb": sum(e.size_bytes for e in self._entries.values()) / 2**20,
+                "models": [
+                    {"name": e.name, "backend": e.backend, "size_mb": e.size_bytes / 2**20,
+                     "leases": e.leases}
+                    for e in self._entries.values()
+                ],
+            }
+
+
+# Uygulama genelinde kullanılacak tekil model havuzu
+model_pool = ModelPool(int(MODEL_POOL_MAX_MB * 2**20), MODEL_POOL_MAX_MODELS)
+
+
+def benchmark_backends(model_identifier: str, frames: list, backends: list) -> dict:
+    """
+    Aynı karelerle her arka ucun kare başı çıkarım süresini ölçer; sonuçlar
+    "auto" arka uç seçiminde kullanılmak üzere saklanır. Bloklayan bir işlemdir.
+    """
+    model_path = resolve_model_path(model_identifier)
+    results = {}
+    for backend in backends:
+        started = time.perf_counter()
+        try:
+            entry = model_pool.acquire(model_identifier, backend)
+        except HTTPException as e:
+            results[backend] = {"error": e.detail}
+            continue
+        load_seconds = time.perf_counter() - started
+        try:
+            timings = []
+            with entry.lock:
+                # İlk çağrılar bellek ayırma/derleme içerdiği için ölçüme katılmaz
+                for frame in frames[:3]:
+                    entry.model.predict(frame, verbose=False)
+                for frame in frames:
+                    t = time.perf_counter()
+                    entry.model.predict(frame, verbose=False)
+                    timings.append((time.perf_counter() - t) * 1000)
+        except Exception as e:
+            results[backend] = {"error": str(e)}
+            continue
+        finally:
+            model_pool.release(entry)
+        timings.sort()
+        mean_ms = sum(timings) / len(timings)
+        results[backend] = {
+            "frames": len(timings),
+            "load_seconds": round(load_seconds, 3),
+            "ms_per_frame": round(mean_ms, 3),
+            "p50_ms": round(timings[len(timings) // 2], 3),
+            "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+            "fps": round(1000 / mean_ms, 2) if mean_ms else None,
+        }
+    save_benchmark(model_path, {b: r for b, r in results.items() if "error" not in r})
+    return results
+
+
+def load_yolo_model(model_identifier: str):
+    return model_pool.get(model_identifier)
 
 def extract_class_names(model_instance):
     # 1. YOLO tarzı .names varsa
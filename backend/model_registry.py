@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+from fastapi import HTTPException
+from model_manager import (resolve_model_path, extract_class_names, model_pool,
+                           SUPPORTED_YOLO_MODELS, CUSTOM_MODELS_DIR)
+from model_export import weights_hash
+
+# Model metadata indeksi; özel modellerle aynı kalıcı dizinde tutulur
+MODEL_REGISTRY_PATH = os.getenv("MODEL_REGISTRY_PATH", os.path.join(CUSTOM_MODELS_DIR, ".registry.json"))
+
+MODEL_EXTENSIONS = (".pt", ".onnx")
+
+
+def _read_metadata(model) -> dict:
+    """Yüklenmiş modelden sınıf isimleri, görev tipi ve giriş boyutunu okur."""
+    imgsz = None
+    for source in (getattr(model, "overrides", None), getattr(getattr(model, "model", None), "args", None)):
+        if isinstance(source, dict) and source.get("imgsz"):
+            imgsz = source["imgsz"]
+            break
+    return {
+        "classes": extract_class_names(model) or [],
+        "task": getattr(model, "task", None),
+        "imgsz": imgsz,
+    }
+
+
+class ModelRegistry:
+    """
+    Model dosyalarının metadata'sını (sınıflar, boyut, özet, giriş boyutu,
+    görev) diskteki küçük bir JSON indekste tutar. Metadata istekleri
+    ağırlıklara dokunmadan indeksten cevaplanır; dosyanın boyutu/mtime'ı
+    değişirse kayıt özet karşılaştırmasıyla yenilenir.
+    """
+
+    def __init__(self, path: str = MODEL_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._custom_dir_mtime = None
+        self._custom_models: list[str] = []
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Model indeksi okunamadı, yeniden oluşturulacak: {e}")
+
+    def _save(self):
+        # self._lock tutulurken çağrılır
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def _is_fresh(self, entry: dict, verify: bool) -> bool:
+        try:
+            stat = os.stat(entry["path"])
+        except OSError:
+            return False
+        if stat.st_size == entry["size_bytes"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        # Yalnızca mtime değiştiyse (kopyalama vb.) içerik aynı olabilir
+        if verify and stat.st_size == entry["size_bytes"] and weights_hash(entry["path"]) == entry["sha256"]:
+            entry["mtime_ns"] = stat.st_mtime_ns
+            return True
+        return False
+
+    def get(self, model_identifier: str, verify: bool = False) -> dict | None:
+        """
+        Güncel indeks kaydını döndürür; kayıt yoksa ya da dosya değiştiyse None.
+        verify=True ise mtime farkında özet yeniden hesaplanır (bloklayabilir).
+        """
+        with self._lock:
+            entry = self._entries.get(model_identifier)
+            if entry is None or not self._is_fresh(entry, verify):
+                return None
+            return entry
+
+    def describe(self, model_identifier: str) -> dict:
+        """Kayıt güncelse onu, değilse modeli bir kez okuyup indeksler (bloklayabilir)."""
+        return self.get(model_identifier, verify=True) or self.register(model_identifier)
+
+    def register(self, model_identifier: str) -> dict:
+        """Modeli okuyup metadata'sını indekse yazar. Bloklayan bir işlemdir."""
+        model_path = resolve_model_path(model_identifier)
+        # Hazır model havuzda zaten yüklüyse yeniden yüklenmez (özel modeller
+        # aynı adla yeniden yüklenebildiği için her zaman dosyadan okunur)
+        model = model_pool.peek(model_identifier) if model_identifier in SUPPORTED_YOLO_MODELS else None
+        if model is None:
+            try:
+                from ultralytics import YOLO
+                model = YOLO(model_path) if model_path.endswith(".pt") else YOLO(model_path, task="detect")
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Model okunamadı: {e}")
+        # Hazır modeller ilk kullanımda indirilir; gerçek dosya yolu ckpt_path'tedir
+        for candidate in (model_path, getattr(model, "ckpt_path", None)):
+            if candidate and os.path.exists(candidate):
+                model_path = candidate
+                break
+        else:
+            raise HTTPException(status_code=400, detail=f"Model dosyası bulunamadı: {model_identifier}")
+
+        stat = os.stat(model_path)
+        entry = {
+            "name": model_identifier,
+            "path": os.path.abspath(model_path),
+            "source": "builtin" if model_identifier in SUPPORTED_YOLO_MODELS else "custom",
+            "format": os.path.splitext(model_path)[1].lstrip("."),
+            "size_bytes": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": weights_hash(model_path),
+            "indexed_at": time.time(),
+            **_read_metadata(model),
+        }
+        with self._lock:
+            self._entries[model_identifier] = entry
+            self._save()
+        return entry
+
+    def remove(self, model_identifier: str):
+        with self._lock:
+            if self._entries.pop(model_identifier, None) is not None:
+                self._save()
+
+    def custom_models(self) -> list[str]:
+        """Özel model dizinindeki dosyalar; dizin değişmedikçe yeniden taranmaz."""
+        with self._lock:
+            mtime = os.stat(CUSTOM_MODELS_DIR).st_mtime_ns if os.path.exists(CUSTOM_MODELS_DIR) else None
+            if mtime != self._custom_dir_mtime:
+                self._custom_dir_mtime = mtime
+                self._custom_models = sorted(
+                    f for f in os.listdir(CUSTOM_MODELS_DIR) if f.endswith(MODEL_EXTENSIONS)
+                ) if mtime is not None else []
+                # Silinmiş özel modellerin kayıtları indeksten çıkarılır
+                stale = [name for name, e in self._entries.items()
+                         if e["source"] == "custom" and name not in self._custom_models]
+                for name in stale:
+                    del self._entries[name]
+                if stale:
+                    self._save()
+            return list(self._custom_models)
+
+
+# Uygulama genelinde kullanılacak tekil model indeksi
+model_registry = ModelRegistry()
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import cv2
+from fastapi import HTTPException
+
+# Çıktı videosunun yazılacağı yer: "auto" ffmpeg varsa onu, yoksa OpenCV'yi seçer
+OUTPUT_SINKS = ("auto", "ffmpeg", "opencv", "null")
+OUTPUT_SINK = os.getenv("OUTPUT_SINK", "auto")
+# Kareye ne çizileceği: "plot" (ultralytics plot), "overlay" (yalnızca takip edilen kutular),
+# "none" (çizim, önizleme ve video yok; yalnızca sayım)
+OUTPUT_RENDERERS = ("plot", "overlay", "none")
+OUTPUT_RENDERER = os.getenv("OUTPUT_RENDERER", "plot")
+
+# ffmpeg kodlayıcı ayarları; donanım kodlayıcı için ör. h264_nvenc, h264_vaapi, h264_videotoolbox
+OUTPUT_FFMPEG_CODEC = os.getenv("OUTPUT_FFMPEG_CODEC", "libx264")
+OUTPUT_FFMPEG_PRESET = os.getenv("OUTPUT_FFMPEG_PRESET", "veryfast")
+OUTPUT_FFMPEG_CRF = int(os.getenv("OUTPUT_FFMPEG_CRF", "23"))
+
+# OpenCV yazıcısının sırayla denediği codec'ler
+OPENCV_CODECS = ["mp4v", "XVID", "MJPG"]
+
+
+def validate_output(sink: str, renderer: str):
+    if sink not in OUTPUT_SINKS:
+        raise HTTPException(status_code=400, detail=f"Geçersiz çıktı hedefi. Desteklenen: {', '.join(OUTPUT_SINKS)}")
+    if renderer not in OUTPUT_RENDERERS:
+        raise HTTPException(status_code=400, detail=f"Geçersiz çizim modu. Desteklenen: {', '.join(OUTPUT_RENDERERS)}")
+
+
+class OpenCVSink:
+    """cv2.VideoWriter ile yazar; codec'ler sırayla denenir."""
+
+    kind = "opencv"
+
+    def __init__(self, path: str, fps: float, size: tuple):
+        self.writer = None
+        for codec in OPENCV_CODECS:
+            self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+            if self.writer.isOpened():
+                self.codec = codec
+                return
+        raise HTTPException(status_code=500, detail="VideoWriter başlatılamadı")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegSink:
+    """
+    Kareleri ham BGR olarak ffmpeg sürecine aktarır; çıktı tarayıcıda
+    oynatılabilen H.264/MP4 olur. Kodlama ayrı bir süreçte (ve ffmpeg'in
+    kendi thread'lerinde) yapılır, yazma thread'i yalnızca veriyi kopyalar.
+    """
+
+    kind = "ffmpeg"
+
+    def __init__(self, path: str, fps: float, size: tuple, codec: str = OUTPUT_FFMPEG_CODEC,
+                 preset: str = OUTPUT_FFMPEG_PRESET, crf: int = OUTPUT_FFMPEG_CRF):
+        width, height = size
+        self.codec = codec
+        quality = ["-preset", preset, "-crf", str(crf)] if codec.startswith("libx26") else []
+        # Hata çıktısı dosyaya yazılır: boru dolarsa (çok log basan donanım kodlayıcıları)
+        # ffmpeg ve onu bekleyen yazma thread'i bloklanırdı
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-y",
+             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps or 25:g}",
+             "-i", "pipe:0",
+             # yuv420p çift boyut ister
+             "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", "-c:v", codec, *quality,
+             "-pix_fmt", "yuv420p", "-movflags", "+faststart", path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr,
+        )
+
+    def _error_output(self) -> str:
+        self._stderr.seek(0)
+        return self._stderr.read()[-4096:].decode(errors="replace").strip()
+
+    def write(self, frame):
+        try:
+            self._proc.stdin.write(memoryview(frame).cast("B") if frame.flags.c_contiguous else frame.tobytes())
+        except BrokenPipeError:
+            self._proc.wait()
+            raise RuntimeError(f"ffmpeg kodlayıcı kapandı: {self._error_output()}")
+
+    def release(self):
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._proc.wait() != 0:
+            print(f"ffmpeg çıktı hatası: {self._error_output()}")
+        self._stderr.close()
+
+
+def open_sink(kind: str, path: str, fps: float, size: tuple):
+    """İstenen çıktı hedefini açar; "null" için None döner (video yazılmaz)."""
+    if kind == "null":
+        return None
+    if kind in ("auto", "ffmpeg"):
+        if shutil.which("ffmpeg"):
+            return FFmpegSink(path, fps, size)
+        if kind == "ffmpeg":
+            raise HTTPException(status_code=500, detail="ffmpeg bulunamadı")
+    return OpenCVSink(path, fps, size)
@@ -0,0 +1,268 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+import weakref
+import metrics
+from collections import deque
+from dataclasses import dataclass, field
+
+# Aşamalar arasındaki kuyrukların kapasitesi (kare sayısı)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+# Thread'lerin durdurma isteğini kontrol etme aralığı (saniye)
+_POLL_INTERVAL = 0.2
+
+_END = object()
+
+# Çalışan pipeline'lar (kuyruk derinliği metrikleri için)
+_active = weakref.WeakSet()
+
+
+@dataclass
+class FrameResult:
+    """Annotate aşamasından çıkan, event loop'a teslim edilen kare sonucu."""
+    index: int
+    jpeg: bytes | None = None
+    events: list = field(default_factory=list)
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+class VideoPipeline:
+    """
+    Bir videoyu decode -> track -> annotate/encode -> write aşamalarında,
+    her aşama ayrı bir thread'de olacak şekilde işler.
+    Aşamalar arasında sınırlı kuyruklar olduğu için yavaş bir aşama
+    öncekileri bekletir, bellek kullanımı sabit kalır.
+    Bitmiş kareler asenkron olarak `async for` ile okunur.
+
+    track_fn(frame) -> results
+    render_fn(index, frame, results) -> (annotated, jpeg_bytes | None, events)
+
+    submit_fn verilirse tespit asenkron yapılır: submit_fn(frame) -> Future,
+    track_fn(frame, detection) -> results. Track aşaması en fazla `inflight`
+    kareyi önceden gönderir, böylece batch scheduler tek bir videodan da
+    birden fazla kare toplayabilir; takipçi yine kare sırasıyla güncellenir.
+    """
+
+    def __init__(self, capture, track_fn, render_fn, writer=None, submit_fn=None,
+                 inflight: int = 1, queue_size: int = PIPELINE_QUEUE_SIZE, name: str = "video"):
+        self.capture = capture
+        self.track_fn = track_fn
+        self.submit_fn = submit_fn
+        self.inflight = max(1, inflight)
+        self.render_fn = render_fn
+        self.writer = writer
+        self.name = name
+        self.error = None
+
+        self._decoded = queue.Queue(maxsize=queue_size)
+        self._tracked = queue.Queue(maxsize=queue_size)
+        self._to_write = queue.Queue(maxsize=queue_size)
+        self._output = asyncio.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        # Kare başına decode başlangıç zamanı (uçtan uca gecikme ölçümü için)
+        self._started: dict[int, float] = {}
+        self._loop = None
+
+    # --- Yaşam döngüsü ---
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        stages = [("decode", self._decode_stage), ("track", self._track_stage),
+                  ("annotate", self._annotate_stage)]
+        if self.writer is not None:
+            stages.append(("write", self._write_stage))
+        for stage_name, target in stages:
+            t = threading.Thread(target=self._run_stage, args=(target,),
+                                 name=f"{self.name}-{stage_name}", daemon=True)
+            self._threads.append(t)
+            t.start()
+        _active.add(self)
+
+    def stop(self):
+        self._stop.set()
+
+    async def wait_closed(self):
+        """Tüm thread'lerin bitmesini (ve kaynakların bırakılmasını) bekler."""
+        self.stop()
+        await asyncio.to_thread(self._join)
+
+    def _join(self):
+        for t in self._threads:
+            t.join()
+        _active.discard(self)
+
+    def queue_depths(self) -> dict:
+        return {
+            "decoded": self._decoded.qsize(),
+            "tracked": self._tracked.qsize(),
+            "to_write": self._to_write.qsize(),
+            "output": self._output.qsize(),
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> FrameResult:
+        item = await self._output.get()
+        if item is _END:
+            # Diğer olası okuyucular için sonlandırıcıyı geri koy
+            self._output.put_nowait(_END)
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+        return item
+
+    # --- Thread yardımcıları ---
+
+    def _run_stage(self, target):
+        try:
+            target()
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            print(f"[{threading.current_thread().name}] Pipeline hatası: {e}")
+            if self.error is None:
+                self.error = e
+            self._stop.set()
+            self._emit(_END, force=True)
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _emit(self, item, force: bool = False):
+        """Event loop'taki çıkış kuyruğuna thread içinden yazar (doluysa bekler)."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        while force or not self._stop.is_set():
+            fut = asyncio.run_coroutine_threadsafe(
+                asyncio.wait_for(self._output.put(item), _POLL_INTERVAL), loop)
+            try:
+                fut.result()
+                return
+            except (asyncio.TimeoutError, TimeoutError):
+                if force:
+                    # Okuyucu yoksa kuyruğu boşaltıp sonlandırıcıyı yerleştir
+                    loop.call_soon_threadsafe(self._force_end)
+                    return
+            except RuntimeError:
+                return
+        raise PipelineStopped()
+
+    def _force_end(self):
+        while not self._output.empty():
+            self._output.get_nowait()
+        self._output.put_nowait(_END)
+
+    # --- Aşamalar ---
+
+    def _decode_stage(self):
+        index = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                ret, frame = self.capture.read()
+                if not ret:
+                    break
+                metrics.observe("decode", time.perf_counter() - started)
+                self._started[index] = started
+                self._put(self._decoded, (index, frame))
+                index += 1
+            self._put(self._decoded, _END)
+        finally:
+            self.capture.release()
+
+    def _track_stage(self):
+        if self.submit_fn is not None:
+            return self._track_stage_async()
+        while True:
+            item = self._get(self._decoded)
+            if item is _END:
+                self._put(self._tracked, _END)
+                return
+            index, frame = item
+            with metrics.timer("track"):
+                results = self.track_fn(frame)
+            self._put(self._tracked, (index, frame, results))
+
+    def _track_stage_async(self):
+        pending = deque()
+
+        def resolve():
+            index, frame, future = pending.popleft()
+            detection = future.result()
+            with metrics.timer("track"):
+                results = self.track_fn(frame, detection)
+            self._put(self._tracked, (index, frame, results))
+
+        while True:
+            # Gönderilecek yeni kare yoksa ya da sıradaki sonuç hazırsa önce onu tamamla
+            if pending and (len(pending) >= self.inflight or pending[0][2].done()
+                            or self._decoded.empty()):
+                resolve()
+                continue
+            item = self._get(self._decoded)
+            if item is _END:
+                while pending:
+                    resolve()
+                self._put(self._tracked, _END)
+                return
+            index, frame = item
+            pending.append((index, frame, self.submit_fn(frame)))
+
+    def _annotate_stage(self):
+        while True:
+            item = self._get(self._tracked)
+            if item is _END:
+                if self.writer is not None:
+                    self._put(self._to_write, _END)
+                    # Diskteki video tamamen yazılmadan akışı bitirme
+                    self._threads[-1].join()
+                self._emit(_END)
+                return
+            index, frame, results = item
+            annotated, jpeg, events = self.render_fn(index, frame, results)
+            if self.writer is not None:
+                self._put(self._to_write, annotated)
+            started = self._started.pop(index, None)
+            if started is not None:
+                metrics.observe("frame_latency", time.perf_counter() - started)
+            self._emit(FrameResult(index=index, jpeg=jpeg, events=events))
+
+    def _write_stage(self):
+        try:
+            while True:
+                frame = self._get(self._to_write)
+                if frame is _END:
+                    return
+                with metrics.timer("write"):
+                    self.writer.write(frame)
+        finally:
+            self.writer.release()
+
+
+def pipeline_stats() -> list[dict]:
+    return [{"name": p.name, "queues": p.queue_depths()} for p in list(_active)]
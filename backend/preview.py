@@ -0,0 +1,64 @@
+import os
+import time
+import cv2
+import metrics
+
+# Canlı önizleme varsayılanları; analiz (sayım ve çıktı videosu) bu ayarlardan etkilenmez
+PREVIEW_MAX_FPS = float(os.getenv("PREVIEW_MAX_FPS", "15"))
+PREVIEW_MAX_WIDTH = int(os.getenv("PREVIEW_MAX_WIDTH", "960"))
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", "70"))
+
+
+def preview_settings(max_fps: float = None, max_width: int = None, quality: int = None) -> dict:
+    """Verilmeyen değerler için ortam değişkenlerindeki varsayılanları kullanır."""
+    return {
+        "max_fps": PREVIEW_MAX_FPS if max_fps is None else max(0.0, float(max_fps)),
+        "max_width": PREVIEW_MAX_WIDTH if max_width is None else max(0, int(max_width)),
+        "quality": PREVIEW_JPEG_QUALITY if quality is None else min(100, max(1, int(quality))),
+    }
+
+
+class PreviewEncoder:
+    """
+    Annotate thread'inde çalışan önizleme kodlayıcısı. İzleyici yoksa hiç
+    kodlama yapmaz, FPS sınırını aşan kareleri atlar ve kareyi JPEG'e
+    çevirmeden önce küçültür. Küçültme tamponu ve kodlama parametreleri
+    kareler arasında yeniden kullanılır.
+    """
+
+    def __init__(self, has_viewers, max_fps: float = PREVIEW_MAX_FPS,
+                 max_width: int = PREVIEW_MAX_WIDTH, quality: int = PREVIEW_JPEG_QUALITY):
+        self.has_viewers = has_viewers
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.max_width = max_width
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self._last = 0.0
+        self._buffer = None
+        self.encoded = 0
+        self.skipped = 0
+
+    def encode(self, frame):
+        """Önizlemeye gönderilecek JPEG baytlarını ya da atlanan kare için None döndürür."""
+        if not self.has_viewers():
+            self.skipped += 1
+            return None
+        now = time.monotonic()
+        if now - self._last < self.min_interval:
+            self.skipped += 1
+            return None
+        self._last = now
+
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            size = (self.max_width, max(1, round(height * self.max_width / width)))
+            if self._buffer is None or self._buffer.shape[1::-1] != size:
+                self._buffer = None
+            self._buffer = cv2.resize(frame, size, dst=self._buffer, interpolation=cv2.INTER_AREA)
+            frame = self._buffer
+
+        with metrics.timer("imencode"):
+            ret, buffer = cv2.imencode(".jpg", frame, self.params)
+        if not ret:
+            return None
+        self.encoded += 1
+        return buffer.tobytes()
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import asyncio
+import cProfile
+import io
+import pstats
+import threading
+import traceback
+from collections import Counter
+
+# Tek bir profil isteğinin en uzun süresi ve örnekleme aralığı
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# Aynı anda yalnızca bir cProfile oturumu çalışabilir
+_loop_profile_lock = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _stack(frame) -> list[str]:
+    """Kök çerçeveden başlayan yığın (py-spy çıktısıyla aynı çerçeve biçimi)."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def thread_dump() -> list[dict]:
+    """Süreçteki tüm thread'lerin anlık yığınları."""
+    frames = sys._current_frames()
+    dump = []
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        dump.append({
+            "name": thread.name,
+            "ident": thread.ident,
+            "daemon": thread.daemon,
+            "stack": traceback.format_stack(frame) if frame is not None else [],
+        })
+    return dump
+
+
+def sample_threads(name_prefix: str, seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> dict:
+    """
+    Adı name_prefix ile başlayan thread'lerin yığınlarını belirli aralıklarla
+    örnekler. Çalışan koda dokunmaz; yük yalnızca örnekleme thread'indedir.
+    `folded` alanı flamegraph.pl / speedscope / py-spy raw formatıyla uyumludur.
+    """
+    seconds = min(max(0.1, seconds), PROFILE_MAX_SECONDS)
+    interval = max(1.0, interval_ms) / 1000.0
+    me = threading.get_ident()
+    stacks = Counter()
+    own = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate() if t.name.startswith(name_prefix)}
+        if not names and samples:
+            # Profil sırasında iş bitti
+            break
+        for ident, frame in sys._current_frames().items():
+            if ident == me or ident not in names:
+                continue
+            stack = _stack(frame)
+            stacks[";".join([names[ident]] + stack)] += 1
+            own[stack[-1]] += 1
+        samples += 1
+        time.sleep(interval)
+
+    return {
+        "samples": samples,
+        "interval_ms": interval * 1000,
+        "folded": "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()),
+        "top": [{"frame": name, "samples": n} for name, n in own.most_common(30)],
+    }
+
+
+async def profile_event_loop(seconds: float, limit: int = 50) -> str | None:
+    """
+    Event loop thread'ini belirtilen süre boyunca cProfile ile profiller
+    (yayın, veritabanı çağrıları, HTTP işleyicileri). Başka bir profil
+    sürüyorsa None döner.
+    """
+    if not _loop_profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        await asyncio.sleep(min(max(0.1, seconds), PROFILE_MAX_SECONDS))
+    finally:
+        profiler.disable()
+        _loop_profile_lock.release()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
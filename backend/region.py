@@ -0,0 +1,176 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import Future
+from fastapi import HTTPException
+
+# Otomatik ilgi alanı: çizgi/bölge sınırlarına karenin bu oranı kadar pay eklenir
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0.1"))
+# Karo boyutu (piksel) ve komşu karolar arasındaki örtüşme oranı
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+# Karo sınırında kesilen kutu, tam kutunun içinde kaldığı için IoU yerine
+# küçük kutuya göre örtüşme (IoS) ile birleştirilir
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.6"))
+
+# Bundan küçük ilgi alanı modele anlamlı bir görüntü vermez
+_MIN_ROI = 64
+
+
+def parse_roi(roi) -> str | list | None:
+    """Form alanındaki ROI değerini doğrular: "full", "auto" ya da [x1, y1, x2, y2]."""
+    if roi in (None, "", "full"):
+        return None
+    if roi == "auto":
+        return "auto"
+    try:
+        x1, y1, x2, y2 = (int(v) for v in roi)
+    except Exception:
+        raise HTTPException(status_code=400, detail="ROI koordinatları geçersiz")
+    if x2 <= x1 or y2 <= y1:
+        raise HTTPException(status_code=400, detail="ROI koordinatları geçersiz")
+    return [x1, y1, x2, y2]
+
+
+def roi_from_geometry(geometry: list, frame_size: tuple, margin: float = ROI_MARGIN) -> tuple | None:
+    """Sayım çizgileri ve bölgelerini kapsayan, pay eklenmiş dikdörtgen (geometri yoksa None)."""
+    if not geometry:
+        return None
+    width, height = frame_size
+    points = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in geometry])
+    pad_x, pad_y = margin * width, margin * height
+    x1, y1 = points.min(axis=0) - (pad_x, pad_y)
+    x2, y2 = points.max(axis=0) + (pad_x, pad_y)
+    return clamp_roi((x1, y1, x2, y2), frame_size)
+
+
+def clamp_roi(roi, frame_size: tuple) -> tuple:
+    width, height = frame_size
+    x1, y1, x2, y2 = (int(round(v)) for v in roi)
+    x1, y1 = max(0, min(x1, width - 1)), max(0, min(y1, height - 1))
+    x2, y2 = max(x1 + 1, min(x2, width)), max(y1 + 1, min(y2, height))
+    # Çok dar alanlar en az _MIN_ROI piksele genişletilir
+    if x2 - x1 < _MIN_ROI:
+        x1 = max(0, min(x1 - (_MIN_ROI - (x2 - x1)) // 2, width - _MIN_ROI))
+        x2 = min(width, x1 + _MIN_ROI)
+    if y2 - y1 < _MIN_ROI:
+        y1 = max(0, min(y1 - (_MIN_ROI - (y2 - y1)) // 2, height - _MIN_ROI))
+        y2 = min(height, y1 + _MIN_ROI)
+    return x1, y1, x2, y2
+
+
+def _axis_tiles(start: int, end: int, size: int, overlap: float) -> list[tuple]:
+    length = end - start
+    if length <= size:
+        return [(start, end)]
+    step = max(1, int(size * (1 - overlap)))
+    count = int(np.ceil((length - size) / step)) + 1
+    # Son karo alanın sonuna hizalanır, adımlar eşit dağıtılır
+    offsets = np.linspace(start, end - size, count).round().astype(int)
+    return [(int(o), int(o) + size) for o in offsets]
+
+
+def merge_boxes(boxes: np.ndarray, threshold: float = TILE_MERGE_THRESHOLD) -> np.ndarray:
+    """
+    Karolardan gelen (N, 6) [x1, y1, x2, y2, conf, cls] kutularını sınıf bazında
+    birleştirir: güveni yüksek kutu kalır, onunla IoS eşiğini aşan kutular atılır.
+    """
+    if len(boxes) < 2:
+        return boxes
+    order = np.argsort(-boxes[:, 4], kind="stable")
+    boxes = boxes[order]
+    areas = np.maximum(0, boxes[:, 2] - boxes[:, 0]) * np.maximum(0, boxes[:, 3] - boxes[:, 1])
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if not keep[i]:
+            continue
+        rest = np.nonzero(keep[i + 1:] & (boxes[i + 1:, 5] == boxes[i, 5]))[0] + i + 1
+        if rest.size == 0:
+            continue
+        iw = np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0])
+        ih = np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1])
+        inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+        smaller = np.minimum(areas[i], areas[rest])
+        ios = np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+        keep[rest[ios > threshold]] = False
+    return boxes[keep]
+
+
+class RegionDetector:
+    """
+    Tespiti yalnızca ilgi alanı (ROI) üzerinde, istenirse örtüşen karolara
+    bölerek yapar. Karolar batch scheduler'a ayrı görüntüler olarak gönderilir,
+    kutular tam kare koordinatlarına taşınıp birleştirilir; takipçi ve sayım
+    tam karedeki kutuları görür.
+    """
+
+    def __init__(self, roi: tuple, tile: bool = False, tile_size: int = TILE_SIZE,
+                 overlap: float = TILE_OVERLAP, merge_threshold: float = TILE_MERGE_THRESHOLD):
+        self.roi = tuple(roi)
+        self.merge_threshold = merge_threshold
+        x1, y1, x2, y2 = self.roi
+        if tile:
+            overlap = min(max(overlap, 0.0), 0.9)
+            self.tiles = [(tx1, ty1, tx2, ty2)
+                          for ty1, ty2 in _axis_tiles(y1, y2, tile_size, overlap)
+                          for tx1, tx2 in _axis_tiles(x1, x2, tile_size, overlap)]
+        else:
+            self.tiles = [self.roi]
+
+    @classmethod
+    def from_params(cls, params: dict, geometry: list, frame_size: tuple):
+        """İş parametrelerinden dedektörü kurar; tam kare tek parça tespitte None döner."""
+        roi = params.get("roi")
+        if roi == "auto":
+            roi = roi_from_geometry(geometry, frame_size)
+        elif roi is not None:
+            roi = clamp_roi(roi, frame_size)
+        tile = bool(params.get("tile"))
+        if roi is None:
+            if not tile:
+                return None
+            roi = (0, 0) + tuple(frame_size)
+        return cls(roi, tile=tile)
+
+    def submit(self, frame, submit_fn) -> Future:
+        """Karoları submit_fn ile gönderir; tüm karolar bitince birleşik sonucu veren Future döner."""
+        merged = Future()
+        futures = [submit_fn(frame[ty1:ty2, tx1:tx2]) for tx1, ty1, tx2, ty2 in self.tiles]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                merged.set_result(self._merge(frame, [f.result() for f in futures]))
+            except Exception as e:
+                merged.set_exception(e)
+
+        for f in futures:
+            f.add_done_callback(on_done)
+        return merged
+
+    def _merge(self, frame, results: list):
+        import torch
+        from ultralytics.engine.results import Results
+
+        parts = []
+        for (tx1, ty1, _, _), r in zip(self.tiles, results):
+            data = r.boxes.data
+            data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+            if len(data):
+                data = data[:, :6].astype(np.float32, copy=True)
+                data[:, [0, 2]] += tx1
+                data[:, [1, 3]] += ty1
+                parts.append(data)
+        boxes = np.concatenate(parts) if parts else np.zeros((0, 6), dtype=np.float32)
+        if len(self.tiles) > 1:
+            boxes = merge_boxes(boxes, self.merge_threshold)
+        first = results[0]
+        return Results(orig_img=frame, path=first.path, names=first.names, boxes=torch.as_tensor(boxes))
+
+    def stats(self) -> dict:
+        return {"roi": list(self.roi), "tiles": len(self.tiles)}
@@ -0,0 +1,285 @@
+import os
+import json
+import hashlib
+import asyncio
+from datetime import datetime
+import numpy as np
+from sqlalchemy.sql import select, insert, update, delete
+from database.config import database
+from database.models import ResultCache
+from model_manager import resolve_model_path
+from model_export import resolve_backend
+from video_store import video_store
+
+# Yüklenen videoların içerik özeti alınıp sonuçlar önbelleğe yazılsın mı
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+# Kare bazlı takip kutularının (sayımın yeniden oynatılması için) saklandığı dizin ve üst sınırı
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", "detection_cache")
+DETECTION_CACHE_MAX_MB = float(os.getenv("DETECTION_CACHE_MAX_MB", "4096"))
+
+# Tespit/takip çıktısını belirleyen parametreler; çizgi, bölge ve sınıf filtresi
+# yalnızca sayımı etkiler, bunlar değişince tespit önbelleği kullanılabilir
+_DETECTION_PARAMS = ("model_name", "tracker_name", "conf_threshold", "iou_threshold",
+                     "inference_mode", "inference_stride", "roi", "tile")
+_COUNTING_PARAMS = ("line_coordinates", "lines", "zones", "selected_class_ids")
+# Aynı sayımla farklı çıktı videosu üreten parametreler
+_OUTPUT_PARAMS = ("renderer", "sink", "record")
+
+# Her satır bir takip kutusu: kare indeksi + [x1, y1, x2, y2, track_id, conf, cls].
+# Tespit yapılıp takip edilen nesne çıkmayan karelerde track_id = -1 olan tek boş satır yazılır.
+DETECTION_DTYPE = np.dtype([("frame", "<u4"), ("box", "<f4", (7,))])
+
+_stats = {"result_hits": 0, "result_misses": 0, "results_stored": 0,
+          "detection_hits": 0, "detection_misses": 0, "detections_stored": 0}
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _model_fingerprint(model_name: str) -> list:
+    # Aynı isimle yeniden yüklenen özel model eski sonuçları geçersiz kılar
+    path = resolve_model_path(model_name)
+    try:
+        stat = os.stat(path)
+        return [model_name, stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return [model_name]
+
+
+def _detection_fields(params: dict) -> dict:
+    fields = {k: params.get(k) for k in _DETECTION_PARAMS}
+    fields["model"] = _model_fingerprint(params["model_name"])
+    fields["backend"] = resolve_backend(params.get("backend"), resolve_model_path(params["model_name"]))
+    if fields["inference_mode"] != "stride":
+        fields["inference_stride"] = 1
+    if fields["inference_mode"] == "motion" or fields["roi"] == "auto":
+        # Hareket maskesi ve otomatik ROI çizgi/bölgelerden türetilir; tespit geometriye bağlıdır
+        fields["geometry"] = [params.get(k) for k in ("line_coordinates", "lines", "zones")]
+    return fields
+
+
+def detection_key(params: dict) -> str | None:
+    """Video içeriği + tespit parametrelerinin anahtarı; içerik özeti yoksa None."""
+    if not params.get("video_hash"):
+        return None
+    return _digest([params["video_hash"], _detection_fields(params)])
+
+
+def result_key(params: dict) -> str | None:
+    """Video içeriği + sonucu belirleyen tüm parametrelerin anahtarı; içerik özeti yoksa None."""
+    if not params.get("video_hash"):
+        return None
+    fields = _detection_fields(params)
+    fields.update({k: params.get(k) for k in _COUNTING_PARAMS + _OUTPUT_PARAMS})
+    return _digest([params["video_hash"], fields])
+
+
+# --- Sonuç önbelleği (veritabanı) ---
+
+async def lookup(params: dict) -> dict | None:
+    """
+    Aynı video ve parametrelerle tamamlanmış işin sonucunu döndürür.
+    İşlenmiş video silinmişse kayıt geçersiz sayılır ve kaldırılır.
+    """
+    # Anahtar "auto" arka uç seçimi için ağırlık özeti ve ölçüm dosyası okuyabilir
+    key = await asyncio.to_thread(result_key, params)
+    if key is None:
+        return None
+    row = await database.fetch_one(select(ResultCache).where(ResultCache.cache_key == key))
+    if row is not None and row.processed_video_path and not os.path.exists(row.processed_video_path):
+        await database.execute(delete(ResultCache).where(ResultCache.cache_key == key))
+        row = None
+    if row is None:
+        _stats["result_misses"] += 1
+        return None
+    _stats["result_hits"] += 1
+    await database.execute(update(ResultCache).where(ResultCache.cache_key == key)
+                           .values(hits=ResultCache.hits + 1, last_hit_at=datetime.now()))
+    if row.processed_video_path:
+        # Önbellekten dönen video da kullanılmış sayılır (saklama sırası)
+        await video_store.touch(os.path.basename(row.processed_video_path))
+    result = json.loads(row.result)
+    result["cache"] = {"hit": "result", "job_id": row.job_id, "video_hash": row.video_hash}
+    return result
+
+
+async def store(job):
+    """Tamamlanan işin sonucunu anahtarıyla kaydeder (varsa eski kaydın yerine)."""
+    key = await asyncio.to_thread(result_key, job.params)
+    if key is None or job.result is None:
+        return
+    async with database.transaction():
+        await database.execute(delete(ResultCache).where(ResultCache.cache_key == key))
+        await database.execute(insert(ResultCache).values({
+            "cache_key": key,
+            "video_hash": job.params["video_hash"],
+            "job_id": job.id,
+            "overall_count_id": job.overall_count_id,
+            "result": json.dumps(job.result),
+            "processed_video_path": job.result.get("processed_video_path"),
+            "hits": 0,
+            "created_at": datetime.now(),
+        }))
+    _stats["results_stored"] += 1
+
+
+# --- Tespit önbelleği (diskte, memory-map ile okunan dizi dosyaları) ---
+
+def _detection_paths(key: str) -> tuple[str, str]:
+    return (os.path.join(DETECTION_CACHE_DIR, f"{key}.npy"),
+            os.path.join(DETECTION_CACHE_DIR, f"{key}.json"))
+
+
+class DetectionRecorder:
+    """Tespit yapılan karelerdeki takip kutularını biriktirir (track thread'inde çağrılır)."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def add(self, frame_index: int, result):
+        boxes = result.boxes
+        data = None
+        if boxes is not None and boxes.id is not None and len(boxes):
+            data = boxes.data
+            data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+        rows = np.zeros(len(data) if data is not None else 1, dtype=DETECTION_DTYPE)
+        rows["frame"] = frame_index
+        if data is not None:
+            rows["box"] = data[:, :7]
+        else:
+            rows["box"][:, 4] = -1
+        self._chunks.append(rows)
+
+    def save(self, key: str, meta: dict):
+        """Kutuları tek bir .npy dosyasına, video bilgisini yanındaki .json'a yazar."""
+        os.makedirs(DETECTION_CACHE_DIR, exist_ok=True)
+        data_path, meta_path = _detection_paths(key)
+        data = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=DETECTION_DTYPE)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        with open(data_path + ".tmp", "wb") as f:
+            np.save(f, data)
+        os.replace(meta_path + ".tmp", meta_path)
+        os.replace(data_path + ".tmp", data_path)
+        _stats["detections_stored"] += 1
+        _prune_detection_cache()
+
+
+class CachedDetections:
+    """
+    Önbellekteki takip kutuları. Dizi memory-map ile açılır; yalnızca
+    erişilen kareler diskten okunur. Her kare için dedektör yerine
+    takipçinin o karede ürettiği sonuç yeniden kurulur.
+    """
+
+    def __init__(self, data_path: str, meta: dict):
+        self.meta = meta
+        self.data = np.load(data_path, mmap_mode="r")
+        frames = np.asarray(self.data["frame"])
+        self._frames, self._starts = np.unique(frames, return_index=True)
+        self._ends = np.append(self._starts[1:], len(frames))
+        self.names = {int(k): v for k, v in meta["names"].items()}
+
+    @property
+    def frames(self) -> int:
+        return int(self.meta["frames"])
+
+    def result(self, frame_index: int, frame):
+        """Karede tespit yapılmadıysa None, yapıldıysa takip edilen kutularla Results döndürür."""
+        import torch
+        from ultralytics.engine.results import Results
+
+        i = np.searchsorted(self._frames, frame_index)
+        if i == len(self._frames) or self._frames[i] != frame_index:
+            return None
+        boxes = np.array(self.data["box"][self._starts[i]:self._ends[i]])
+        boxes = boxes[boxes[:, 4] >= 0]
+        return Results(orig_img=frame, path="", names=self.names, boxes=torch.as_tensor(boxes))
+
+    def capture(self):
+        return _CachedCapture(self.meta)
+
+
+class _CachedCapture:
+    """
+    Yalnızca sayım modunda video çözülmeden önbellekteki kare sayısı kadar
+    boş kare veren, cv2.VideoCapture benzeri kaynak (kareler çizilmez).
+    """
+
+    def __init__(self, meta: dict):
+        self._props = {"width": meta["width"], "height": meta["height"], "fps": meta["fps"]}
+        self._remaining = int(meta["frames"])
+        self._blank = np.zeros((meta["height"], meta["width"], 3), dtype=np.uint8)
+
+    def isOpened(self) -> bool:
+        return True
+
+    def get(self, prop):
+        import cv2
+        return float({cv2.CAP_PROP_FRAME_WIDTH: self._props["width"],
+                      cv2.CAP_PROP_FRAME_HEIGHT: self._props["height"],
+                      cv2.CAP_PROP_FPS: self._props["fps"],
+                      cv2.CAP_PROP_FRAME_COUNT: self._remaining}.get(prop, 0.0))
+
+    def set(self, prop, value) -> bool:
+        import cv2
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._remaining = max(0, self._remaining - int(value))
+            return True
+        return False
+
+    def read(self):
+        if self._remaining <= 0:
+            return False, None
+        self._remaining -= 1
+        return True, self._blank
+
+    def release(self):
+        self._remaining = 0
+
+
+def load_detections(params: dict) -> CachedDetections | None:
+    """Aynı video ve tespit parametreleriyle kaydedilmiş kutular varsa açar."""
+    key = detection_key(params)
+    if key is None:
+        return None
+    data_path, meta_path = _detection_paths(key)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        cached = CachedDetections(data_path, meta)
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.exists(meta_path):
+            print(f"Tespit önbelleği okunamadı, yeniden üretilecek: {e}")
+        _stats["detection_misses"] += 1
+        return None
+    # Son kullanım zamanı; boyut sınırı aşılınca en eski dosyalar silinir
+    os.utime(data_path)
+    _stats["detection_hits"] += 1
+    return cached
+
+
+def _prune_detection_cache():
+    entries = []
+    for name in os.listdir(DETECTION_CACHE_DIR):
+        if name.endswith(".npy"):
+            stat = os.stat(os.path.join(DETECTION_CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+    total = sum(size for _, size, _ in entries)
+    limit = DETECTION_CACHE_MAX_MB * 2**20
+    for _, size, key in sorted(entries):
+        if total <= limit:
+            break
+        for path in _detection_paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+        total -= size
+
+
+def stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,69 @@
+from concurrent.futures import Future
+from fastapi import HTTPException
+from model_manager import model_pool, PooledModel, SUPPORTED_TRACKERS
+from inference_scheduler import get_scheduler
+
+
+def _yaml_load(path):
+    try:
+        from ultralytics.utils import YAML
+        return YAML.load(path)
+    except ImportError:  # eski ultralytics sürümleri
+        from ultralytics.utils import yaml_load
+        return yaml_load(path)
+
+
+def create_tracker(tracker_name: str, frame_rate: int = 30):
+    # ultralytics/torch içe aktarımı ilk kullanıma kadar ertelenir (API hızlı açılır)
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.trackers.bot_sort import BOTSORT
+
+    if tracker_name not in SUPPORTED_TRACKERS:
+        raise HTTPException(status_code=400, detail="Geçersiz tracker adı")
+    cfg = IterableSimpleNamespace(**_yaml_load(check_yaml(SUPPORTED_TRACKERS[tracker_name])))
+    tracker_map = {"bytetrack": BYTETracker, "botsort": BOTSORT}
+    return tracker_map[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+
+class TrackerSession:
+    """
+    Bir video işine ait takip durumu.
+    Ağırlıklar havuzdaki model ile paylaşılır, takipçi her işe özeldir;
+    böylece aynı modeli kullanan işlerin track ID'leri karışmaz.
+    """
+
+    def __init__(self, entry: PooledModel, tracker_name: str, frame_rate: int = 30):
+        self.entry = entry
+        self.scheduler = get_scheduler(entry)
+        self.tracker = create_tracker(tracker_name, frame_rate=max(1, int(frame_rate)))
+        self._closed = False
+
+    @property
+    def names(self):
+        return self.entry.model.names
+
+    def submit(self, frame, conf: float, iou: float) -> Future:
+        """Kareyi modelin batch scheduler'ına gönderir; tespit sonucu Future ile döner."""
+        return self.scheduler.submit(frame, conf, iou)
+
+    def track(self, frame, conf: float, iou: float):
+        return [self.update(self.submit(frame, conf, iou).result())]
+
+    def update(self, result):
+        """Tek karelik tespit sonucunu takipçiden geçirip track ID'leri ekler."""
+        import torch
+        det = result.boxes.cpu().numpy()
+        tracks = self.tracker.update(det, result.orig_img)
+        if len(tracks) == 0:
+            return result
+        idx = tracks[:, -1].astype(int)
+        result = result[idx]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            model_pool.release(self.entry)
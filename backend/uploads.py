@@ -0,0 +1,247 @@
+import os
+import uuid
+import asyncio
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+from fastapi import UploadFile, HTTPException, Request
+
+# Yüklemelerin geçici olarak yazılacağı dizin (ör. tmpfs için /dev/shm)
+UPLOAD_SCRATCH_DIR = os.getenv("UPLOAD_SCRATCH_DIR", tempfile.gettempdir())
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "4096"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+os.makedirs(UPLOAD_SCRATCH_DIR, exist_ok=True)
+
+
+def max_upload_bytes() -> int:
+    return int(MAX_UPLOAD_MB * 1024 * 1024)
+
+
+def scratch_path(filename: str) -> str:
+    return os.path.join(UPLOAD_SCRATCH_DIR, f"temp_{uuid.uuid4().hex}_{os.path.basename(filename)}")
+
+
+def _too_large():
+    return HTTPException(status_code=413, detail=f"Dosya boyutu sınırı aşıldı ({MAX_UPLOAD_MB:g} MB)")
+
+
+def _write_chunk(f, chunk: bytes, hasher=None):
+    f.write(chunk)
+    if hasher is not None:
+        hasher.update(chunk)
+
+
+async def save_upload_file(upload: UploadFile, dest: str, max_bytes: int = None, hasher=None) -> int:
+    """
+    UploadFile içeriğini parça parça diske yazar. Okuma ve yazma event loop'u
+    bloklamaz; boyut sınırı aşılırsa dosya silinir ve 413 döner. hasher
+    (hashlib nesnesi) verilirse içerik özeti yazarken hesaplanır.
+    """
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    written = 0
+    f = await asyncio.to_thread(open, dest, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise _too_large()
+            await asyncio.to_thread(_write_chunk, f, chunk, hasher)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    await asyncio.to_thread(f.close)
+    return written
+
+
+class FFmpegPipeCapture:
+    """
+    Videoyu ffmpeg'e stdin üzerinden besleyip çözülmüş kareleri stdout'tan
+    (YUV4MPEG2) okuyan, cv2.VideoCapture benzeri arayüze sahip kaynak.
+    Yükleme devam ederken decode başlayabilir.
+    """
+
+    def __init__(self):
+        self._proc = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+             "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+             "-pix_fmt", "yuv420p", "-f", "yuv4mpegpipe", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self._frame_size = 0
+        self._opened = True
+
+    # --- Besleme tarafı (event loop'tan to_thread ile çağrılır) ---
+
+    def feed(self, chunk: bytes):
+        try:
+            self._proc.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # Decoder kapandıysa (iş iptal edildi) kalan veri yok sayılır
+            pass
+
+    def close_input(self):
+        try:
+            self._proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    # --- Okuma tarafı ---
+
+    def read_header(self) -> bool:
+        """Akış başlığını okur; ilk kare çözülene kadar bloklar."""
+        line = self._proc.stdout.readline()
+        if not line.startswith(b"YUV4MPEG2"):
+            self._opened = False
+            return False
+        for token in line.split()[1:]:
+            key, value = token[:1], token[1:].decode()
+            if key == b"W":
+                self.width = int(value)
+            elif key == b"H":
+                self.height = int(value)
+            elif key == b"F":
+                num, den = value.split(":")
+                self.fps = float(num) / float(den) if float(den) else 0.0
+        self._frame_size = self.width * self.height * 3 // 2
+        return True
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        # Toplam kare sayısı akış bitmeden bilinemez
+        return 0.0
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        line = self._proc.stdout.readline()
+        if not line.startswith(b"FRAME"):
+            return False, None
+        data = self._proc.stdout.read(self._frame_size)
+        if len(data) < self._frame_size:
+            return False, None
+        yuv = np.frombuffer(data, dtype=np.uint8).reshape(self.height * 3 // 2, self.width)
+        return True, cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+
+    def release(self):
+        self._opened = False
+        # Önce süreç sonlandırılır: beslemede bloklanmış bir yazma BrokenPipe ile döner,
+        # stdin kapatılırken onun bitmesi beklenmez
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self.close_input()
+        self._proc.wait()
+        self._proc.stdout.close()
+
+
+# Yükleme bittikten sonra decoder'ı beslemeye devam eden görevler (çöp toplanmasınlar diye)
+_feeders: set[asyncio.Task] = set()
+
+
+async def _feed_from_file(capture: FFmpegPipeCapture, path: str, progress: dict, wake: asyncio.Event):
+    """
+    Diske yazılmakta olan dosyayı takip ederek decoder'a besler. Decoder
+    yavaş tüketse de istek gövdesinin okunmasını (ve boyut kontrolünü) bekletmez.
+    """
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        position = 0
+        while not progress["aborted"]:
+            if position >= progress["written"]:
+                if progress["done"]:
+                    return
+                wake.clear()
+                await wake.wait()
+                continue
+            chunk = await asyncio.to_thread(f.read, min(UPLOAD_CHUNK_SIZE, progress["written"] - position))
+            position += len(chunk)
+            await asyncio.to_thread(capture.feed, chunk)
+    finally:
+        # Bekleyen bir yazma varsa kapatma onu bekler; event loop bloklanmaz
+        await asyncio.to_thread(capture.close_input)
+        await asyncio.to_thread(f.close)
+
+
+async def ingest_request_stream(request: Request, capture: FFmpegPipeCapture = None,
+                                dest: str = None, max_bytes: int = None, hasher=None) -> int:
+    """
+    İstek gövdesini parça parça okuyup decoder'a (verildiyse) besler; dest
+    verilirse aynı parçaları diske de yazar (ve hasher ile özetini alır).
+    İkisi birlikte verilirse decoder diske yazılan dosyadan ayrı bir görevde
+    beslenir; gövde decoder'ı beklemeden okunur. Sınır aşılırsa yazılan
+    dosya silinir ve 413 fırlatılır.
+    """
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        if capture is not None:
+            capture.close_input()
+        raise _too_large()
+
+    written = 0
+    f = await asyncio.to_thread(open, dest, "wb") if dest else None
+    feeder = None
+    progress = {"written": 0, "done": False, "aborted": False}
+    wake = asyncio.Event()
+    if capture is not None and f is not None:
+        feeder = asyncio.create_task(_feed_from_file(capture, dest, progress, wake))
+    try:
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            written += len(chunk)
+            if written > max_bytes:
+                raise _too_large()
+            if f is not None:
+                await asyncio.to_thread(_write_chunk, f, chunk, hasher)
+            if feeder is not None:
+                # Okuyan görev dosyada yeni veri olduğunu görür (tampon diske aktarıldıktan sonra)
+                await asyncio.to_thread(f.flush)
+                progress["written"] = written
+                wake.set()
+            elif capture is not None:
+                await asyncio.to_thread(capture.feed, chunk)
+        progress["done"] = True
+        wake.set()
+        if feeder is not None:
+            # Decoder'ın kalan veriyi tüketmesi beklenmez; yükleme yanıtı hemen döner
+            _feeders.add(feeder)
+            feeder.add_done_callback(_feeders.discard)
+    except BaseException:
+        if feeder is not None:
+            # Besleme bir sonraki adımda durur ve decoder girişini kapatır (iptal edilmez: hiç
+            # başlamamış görevin kapanışı çalışmazdı). Bloklanmış yazma decoder bırakılınca döner;
+            # decoder'ı bırakmak ya da işi iptal etmek çağıranın işidir, burada beklenmez
+            progress["aborted"] = True
+            wake.set()
+            _feeders.add(feeder)
+            feeder.add_done_callback(_feeders.discard)
+        if f is not None:
+            await asyncio.to_thread(f.close)
+            f = None
+            if os.path.exists(dest):
+                os.remove(dest)
+        raise
+    finally:
+        if capture is not None and feeder is None:
+            capture.close_input()
+        if f is not None:
+            await asyncio.to_thread(f.close)
+    return written
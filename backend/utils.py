@@ -1,3 +1,5 @@
+import numpy as np
+
 def orientation(p, q, r):
     """
     Üç noktanın yönünü belirler.
@@ -44,3 +46,43 @@ def check_line_crossing(point1, point2, line_p1, line_p2):
         return True
 
     return False
+
+
+def orientations(p, q, r):
+    """
+    orientation() fonksiyonunun NumPy karşılığı; (..., 2) dizileri üzerinde
+    yayınlama (broadcasting) ile çalışır.
+    Döndürür: 0 -> kolinear, 1 -> saat yönü, -1 -> saat yönü tersi
+    """
+    val = (q[..., 1] - p[..., 1]) * (r[..., 0] - q[..., 0]) - (q[..., 0] - p[..., 0]) * (r[..., 1] - q[..., 1])
+    return np.sign(val)
+
+
+def on_segments(p, q, r):
+    """
+    on_segment() fonksiyonunun NumPy karşılığı.
+    """
+    return ((q[..., 0] <= np.maximum(p[..., 0], r[..., 0])) & (q[..., 0] >= np.minimum(p[..., 0], r[..., 0])) &
+            (q[..., 1] <= np.maximum(p[..., 1], r[..., 1])) & (q[..., 1] >= np.minimum(p[..., 1], r[..., 1])))
+
+
+def segments_intersect(point1, point2, line_p1, line_p2):
+    """
+    check_line_crossing() fonksiyonunun vektörel hali.
+    Tüm argümanlar (..., 2) şeklinde dizilerdir; örneğin hareketler (N, 1, 2),
+    çizgiler (1, L, 2) verilirse (N, L) boyutlu bir bool matris döner.
+    """
+    o1 = orientations(line_p1, line_p2, point1)
+    o2 = orientations(line_p1, line_p2, point2)
+    o3 = orientations(point1, point2, line_p1)
+    o4 = orientations(point1, point2, line_p2)
+
+    # Genel durumda kesişme
+    crossed = (o1 != o2) & (o3 != o4)
+
+    # Özel durumlar: kolinear kesişmeler
+    crossed |= (o1 == 0) & on_segments(line_p1, point1, line_p2)
+    crossed |= (o2 == 0) & on_segments(line_p1, point2, line_p2)
+    crossed |= (o3 == 0) & on_segments(point1, line_p1, point2)
+    crossed |= (o4 == 0) & on_segments(point1, line_p2, point2)
+    return crossed
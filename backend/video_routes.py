@@ -0,0 +1,46 @@
+import os
+from fastapi import APIRouter, HTTPException, Request
+from file_serving import file_response
+from video_store import video_store, processed_video_path, check_filename
+
+router = APIRouter()
+
+
+@router.api_route("/processed-videos/{filename}", methods=["GET", "HEAD"])
+async def get_processed_video(filename: str, request: Request):
+    """Oynatıcıda ileri/geri sarma için Range, tarayıcı önbelleği için ETag destekler."""
+    video_path = processed_video_path(check_filename(filename))
+    if not os.path.exists(video_path):
+        raise HTTPException(status_code=404, detail="Video bulunamadı.")
+    await video_store.touch(filename)
+    return file_response(request, video_path, "video/mp4", filename=filename)
+
+
+@router.api_route("/processed-videos/{filename}/thumbnail.jpg", methods=["GET", "HEAD"])
+async def get_processed_video_thumbnail(filename: str, request: Request):
+    # Geçmiş listesi tam video yerine bunu yükler; ilk istekte üretilip saklanır
+    return file_response(request, await video_store.preview(filename, "thumbnail"), "image/jpeg")
+
+
+@router.api_route("/processed-videos/{filename}/preview.gif", methods=["GET", "HEAD"])
+async def get_processed_video_preview_gif(filename: str, request: Request):
+    return file_response(request, await video_store.preview(filename, "gif"), "image/gif")
+
+
+@router.delete("/processed-videos/{filename}")
+async def delete_processed_video(filename: str):
+    if not os.path.exists(processed_video_path(check_filename(filename))):
+        raise HTTPException(status_code=404, detail="Video bulunamadı.")
+    await video_store.remove(filename)
+    return {"deleted": filename}
+
+
+@router.get("/video-storage/stats")
+async def get_video_storage_stats():
+    return await video_store.stats()
+
+
+@router.post("/video-storage/enforce")
+async def enforce_video_retention():
+    """Saklama sınırlarını beklemeden uygular."""
+    return {"evicted": await video_store.enforce()}
@@ -1,198 +1,537 @@
 import os
 import cv2
+import numpy as np
 import json
 import uuid
 import time
-import shutil
 import asyncio
+from concurrent.futures import Future
 from datetime import datetime
-from fastapi import UploadFile, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import HTTPException
 from sqlalchemy.sql import insert, update
 from database.config import database
-from database.models import DetectionRecord, OverallCount
-from model_manager import load_yolo_model, SUPPORTED_TRACKERS
-from websocket_manager import manager
-from utils import check_line_crossing
-
-async def process_video_stream(
-    video_file: UploadFile,
-    model_name: str,
-    tracker_name: str,
-    selected_class_ids: list,
-    line_coordinates: list,
-    conf_threshold: float,
-    iou_threshold: float
-):
-    
-    try:
-        model = load_yolo_model(model_name)
-    except HTTPException as e:
-        raise e
+from database.models import OverallCount
+from detection_writer import detection_writer, delete_detection_rows_after
+from model_manager import model_pool, resolve_model_path, SUPPORTED_TRACKERS
+from model_export import resolve_backend, INFERENCE_BACKEND
+from tracking import TrackerSession
+from inference_scheduler import BATCH_MAX_SIZE
+from websocket_manager import manager, job_topic
+from counting import CountingEngine
+from pipeline import VideoPipeline
+import metrics
+from preview import PreviewEncoder, preview_settings
+from region import RegionDetector, parse_roi
+from frame_gating import FrameGate, INFERENCE_MODES, INFERENCE_MODE, INFERENCE_STRIDE
+from output_sinks import open_sink, validate_output, OUTPUT_SINK, OUTPUT_RENDERER
+from live_source import LiveCapture, parse_live_source, LIVE_FLUSH_INTERVAL, LIVE_PIPELINE_QUEUE_SIZE
+from result_cache import DetectionRecorder, load_detections, detection_key
+from video_store import video_store, processed_video_path, processed_video_url, PROCESSED_VIDEO_DIR
 
-    if tracker_name not in SUPPORTED_TRACKERS:
-        raise HTTPException(status_code=400, detail="Geçersiz tracker adı")
-    tracker_config = SUPPORTED_TRACKERS[tracker_name]
+# Bu kadar karede bir işin sayım durumu veritabanına kaydedilir
+JOB_CHECKPOINT_FRAMES = int(os.getenv("JOB_CHECKPOINT_FRAMES", "300"))
+# İlerleme (general_update) mesajlarının en sık yayın aralığı (saniye)
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.5"))
 
+
+def parse_counting_geometry(line_coordinates: list, lines: list, zones: list):
+    """
+    Eski tek çizgi parametresi ile adlandırılmış çizgi/bölge listelerini
+    sayım motorunun beklediği biçime çevirir.
+    """
+    parsed_lines, parsed_zones = [], []
     try:
         line_p1 = tuple(map(int, line_coordinates[0]))
         line_p2 = tuple(map(int, line_coordinates[1]))
-        is_line_defined = (line_p1 != (0, 0) or line_p2 != (0, 0))
-    except:
+        if line_p1 != (0, 0) or line_p2 != (0, 0):
+            parsed_lines.append({"name": "line_0", "points": [line_p1, line_p2]})
+        for line in lines or []:
+            points = [tuple(map(int, p)) for p in line["points"]]
+            if len(points) != 2:
+                raise ValueError("çizgi iki noktadan oluşmalı")
+            parsed_lines.append({"name": str(line.get("name") or f"line_{len(parsed_lines)}"), "points": points})
+    except Exception:
         raise HTTPException(status_code=400, detail="Çizgi koordinatları geçersiz")
 
-   
-    temp_path = f"temp_{uuid.uuid4().hex}_{video_file.filename}"
-    output_filename = f"processed_{uuid.uuid4().hex}_{video_file.filename}"
-    output_path = os.path.join("processed_videos", output_filename)
-    os.makedirs("processed_videos", exist_ok=True)
+    try:
+        for i, zone in enumerate(zones or []):
+            points = [tuple(map(int, p)) for p in zone["points"]]
+            if len(points) < 3:
+                raise ValueError("bölge en az üç noktadan oluşmalı")
+            parsed_zones.append({"name": str(zone.get("name") or f"zone_{i}"), "points": points})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Bölge koordinatları geçersiz")
+
+    names = [g["name"] for g in parsed_lines + parsed_zones]
+    if len(names) != len(set(names)):
+        raise HTTPException(status_code=400, detail="Çizgi ve bölge isimleri benzersiz olmalı")
+    return parsed_lines, parsed_zones
+
+
+def draw_counting_geometry(annotated, counter: CountingEngine, lines: list, zones: list):
+    # Her karede çağrılır: sınıf bazlı özet yerine yalnızca çizgi toplamları okunur
+    line_totals = counter.line_totals() if len(lines) > 1 else None
+    occupancy = counter.zone_occupancy()
+    for zone, occ in zip(zones, occupancy):
+        pts = np.asarray(zone["points"], dtype=np.int32)
+        cv2.polylines(annotated, [pts], True, (255, 128, 0), 2)
+        cv2.putText(annotated, f"{zone['name']}: {occ}", tuple(int(v) for v in pts[0]),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 128, 0), 2)
+    for i, line in enumerate(lines):
+        p1, p2 = line["points"]
+        cv2.line(annotated, p1, p2, (0, 255, 255), 2)
+        if line_totals is not None:
+            line_in, line_out = line_totals[i]
+            cv2.putText(annotated, f"{line['name']} in:{line_in} out:{line_out}", p1,
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+    if lines:
+        cv2.putText(annotated, f"Count: {counter.total_count}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
 
-    initial_record_id = None
 
+def draw_tracked_boxes(annotated, boxes, names: dict):
+    """plot() yerine yalnızca takip edilen kutuları ve kimliklerini çizer (overlay modu)."""
+    for (x1, y1, x2, y2), track_id, cls in zip(boxes.xyxy.astype(int), boxes.id.astype(int), boxes.cls.astype(int)):
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 200, 0), 1)
+        cv2.putText(annotated, f"{names[cls]} {track_id}", (x1, max(0, y1 - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 200, 0), 1)
+
+
+def build_job_params(model_name: str, tracker_name: str, line_coordinates: str,
+                     conf_threshold: float, iou_threshold: float, selected_class_ids: str,
+                     lines: str, zones: str, preview_fps: float = None,
+                     preview_width: int = None, preview_quality: int = None,
+                     inference_mode: str = None, inference_stride: int = None,
+                     roi: str = None, tile: bool = False, backend: str = None,
+                     live: bool = False, record: bool = None, sink: str = None,
+                     renderer: str = None, cache: bool = None) -> dict:
+    """Form/query alanlarındaki JSON metinlerini çözüp doğrulanmış iş parametrelerini döndürür."""
+    # lines: [{"name": "giris", "points": [[x1, y1], [x2, y2]]}, ...]
+    # zones: [{"name": "kavsak", "points": [[x, y], [x, y], [x, y], ...]}, ...]
     try:
-        with open(temp_path, "wb") as f:
-            shutil.copyfileobj(video_file.file, f)
-
-        # Veritabanına ilk kayıt
-        start_time = datetime.now()
-        query = insert(OverallCount).values({
-            "video_name": video_file.filename,
-            "model_used": model_name,
-            "tracker_used": tracker_name,
-            "final_count": 0,
-            "start_time": start_time,
-            "line_coordinates": json.dumps(line_coordinates)
-        })
-        initial_record_id = await database.execute(query)
-
-        cap = cv2.VideoCapture(temp_path)
-        if not cap.isOpened():
+        params = {
+            "model_name": model_name,
+            "tracker_name": tracker_name,
+            "line_coordinates": json.loads(line_coordinates),
+            "conf_threshold": conf_threshold,
+            "iou_threshold": iou_threshold,
+            "selected_class_ids": json.loads(selected_class_ids),
+            "lines": json.loads(lines),
+            "zones": json.loads(zones),
+            "preview": preview_settings(preview_fps, preview_width, preview_quality),
+            "inference_mode": inference_mode or INFERENCE_MODE,
+            "inference_stride": int(inference_stride or INFERENCE_STRIDE),
+            # roi: "full", "auto" (çizgi/bölgelerden) ya da [x1, y1, x2, y2]
+            "roi": roi if roi in (None, "", "full", "auto") else json.loads(roi),
+            "tile": bool(tile),
+            "backend": backend or None,
+            # Canlı kaynaklar sonsuz olduğu için varsayılan olarak çıktı videosu kaydedilmez
+            "live": bool(live),
+            "record": (not live) if record is None else bool(record),
+            # sink: "auto", "ffmpeg", "opencv", "null"; renderer: "plot", "overlay", "none"
+            "sink": sink or OUTPUT_SINK,
+            "renderer": renderer or OUTPUT_RENDERER,
+            # False ise önbellek okunmaz, iş baştan çalışır ve önbelleği yeniler
+            "cache": not live and (cache is None or bool(cache)),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Girdi hatası: {e}")
+    params["roi"] = parse_roi(params["roi"])
+    validate_job_params(params)
+    return params
+
+
+def validate_job_params(params: dict):
+    """İş kuyruğa alınmadan önce parametreleri doğrular (hatalı istek hemen 400 alır)."""
+    if params["tracker_name"] not in SUPPORTED_TRACKERS:
+        raise HTTPException(status_code=400, detail="Geçersiz tracker adı")
+    if params.get("inference_mode", "full") not in INFERENCE_MODES:
+        raise HTTPException(status_code=400, detail="Geçersiz tespit modu")
+    if (params.get("backend") or INFERENCE_BACKEND) != "auto":
+        # Açıkça seçilen arka uç doğrulanır; "auto" seçimi ağırlık özeti ve ölçüm dosyası
+        # okuduğu için istek sırasında değil, iş başlarken thread'de yapılır
+        resolve_backend(params.get("backend"), resolve_model_path(params["model_name"]))
+    validate_output(params.get("sink", "auto"), params.get("renderer", "plot"))
+    parse_counting_geometry(params["line_coordinates"], params.get("lines"), params.get("zones"))
+
+
+async def run_video_job(job) -> dict:
+    """
+    Bir video işini baştan (ya da checkpoint'ten) sonuna kadar işler.
+    HTTP bağlantısından bağımsız olarak iş kuyruğu tarafından çalıştırılır;
+    önizleme kareleri job.publish_preview ile abonelere iletilir.
+    """
+    params = job.params
+    model_name = params["model_name"]
+    tracker_name = params["tracker_name"]
+    conf_threshold = params["conf_threshold"]
+    iou_threshold = params["iou_threshold"]
+    counting_lines, counting_zones = parse_counting_geometry(
+        params["line_coordinates"], params.get("lines"), params.get("zones"))
+
+    # Akışla yüklenen işler canlı decoder ile gelir; diğerleri kaynak dosyadan açılır
+    live = params.get("live", False)
+    # Aynı video ve tespit parametreleriyle kaydedilmiş takip kutuları varsa dedektör
+    # çalıştırılmaz; yalnızca sayım (ve çizim) yeniden yapılır
+    cached = await asyncio.to_thread(load_detections, params) if params.get("cache") and not live else None
+    renderer = params.get("renderer", "plot")
+    cap, job.capture = job.capture, None
+    if cap is None:
+        if live:
+            # Canlı kaynak kendi thread'inde okunur; iptal edilince kaynak durdurulur
+            cap = job.live_source = LiveCapture(parse_live_source(job.source_path))
+        elif cached is not None and renderer == "none":
+            # Yalnızca sayımda video çözülmez; kareler önbellekteki kutulardan gelir
+            cap = cached.capture()
+        else:
+            cap = await asyncio.to_thread(cv2.VideoCapture, job.source_path)
+
+    entry = None
+    try:
+        if cached is not None:
+            backend = cached.meta["backend"]
+        else:
+            # "auto" ise ölçümlere göre en hızlı kullanılabilir arka uç seçilir
+            backend = await asyncio.to_thread(resolve_backend, params.get("backend"), resolve_model_path(model_name))
+            # Ağırlık yükleme (gerekirse dışa aktarma) event loop dışında yapılır
+            entry = await asyncio.to_thread(model_pool.acquire, model_name, backend)
+    except BaseException:
+        cap.release()
+        raise
+
+    session = None
+    checkpoint = job.checkpoint or {}
+    start_frame = int(checkpoint.get("frame", 0))
+
+    try:
+        if not await asyncio.to_thread(cap.isOpened):
             raise HTTPException(status_code=400, detail="Video açılamadı")
 
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        # Codec deneme
-        CODECS = ["mp4v", "XVID", "MJPG"]
-        out = None
-        for codec in CODECS:
-            fourcc = cv2.VideoWriter_fourcc(*codec)
-            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-            if out.isOpened():
-                break
-
-        if not out:
-            raise HTTPException(status_code=500, detail="VideoWriter başlatılamadı")
-
-        # Sayım Değişkenleri
-        total_count = 0
-        last_positions = {}
-        object_line_states = {}
-
-        async def generate():
-            nonlocal total_count
-
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+        job.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-                results = model.track(
-                    frame,
-                    persist=True,
-                    tracker=tracker_config,
-                    conf=conf_threshold,
-                    iou=iou_threshold,
-                    verbose=False
-                )
+        if start_frame and not live:
+            # Yeniden başlatılan iş kaldığı kareden devam eder
+            await asyncio.to_thread(cap.set, cv2.CAP_PROP_POS_FRAMES, start_frame)
+            print(f"İş {job.id} {start_frame}. kareden devam ediyor.")
 
-                annotated = results[0].plot() if results else frame.copy()
-                tracked_ids = set()
+        if job.overall_count_id is not None and not live:
+            # Son checkpoint'ten sonra yazılan kayıtlar, kareler yeniden işlenince tekrar yazılacak
+            removed = await delete_detection_rows_after(job.id, int(checkpoint.get("counts", {}).get("total_count", 0)))
+            if removed:
+                print(f"İş {job.id}: checkpoint sonrası {removed} tespit kaydı silindi.")
 
-                for r in results:
-                    if not r.boxes or not r.boxes.id is not None:
-                        continue
-                    for box in r.boxes:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        cls = int(box.cls[0])
-                        if selected_class_ids and cls not in selected_class_ids:
-                            continue
-
-                        track_id = int(box.id.item())
-                        label = model.names[cls]
-                        cx = (x1 + x2) // 2
-                        cy = (y1 + y2) // 2
-                        current_pos = (cx, cy)
-                        tracked_ids.add(track_id)
-
-                        if is_line_defined:
-                            key = (track_id, 0)
-                            if key not in object_line_states:
-                                object_line_states[key] = {"crossed": False}
-
-                            if track_id in last_positions:
-                                prev = last_positions[track_id]
-                                if check_line_crossing(prev, current_pos, line_p1, line_p2):
-                                    if not object_line_states[key]["crossed"]:
-                                        total_count += 1
-                                        object_line_states[key]["crossed"] = True
-                                        await manager.broadcast(json.dumps({
-                                            "event": "object_counted",
-                                            "object_id": track_id,
-                                            "object_label": label,
-                                            "total_count": total_count
-                                        }))
-
-                                        det = {
-                                            "video_name": video_file.filename,
-                                            "model_used": model_name,
-                                            "tracker_used": tracker_name,
-                                            "object_id": track_id,
-                                            "object_label": label,
-                                            "timestamp": datetime.now(),
-                                            "current_total_count": total_count,
-                                        }
-                                        await database.execute(insert(DetectionRecord).values(det))
-
-                                        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                                        cv2.putText(annotated, f"{label} COUNTED", (x1, y1 - 10),
-                                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                        last_positions[track_id] = current_pos
-
-                # Çizgi çiz
-                if is_line_defined:
-                    cv2.line(annotated, line_p1, line_p2, (0, 255, 255), 2)
-                    cv2.putText(annotated, f"Count: {total_count}", (10, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-
-                out.write(annotated)
-
-                ret, buffer = cv2.imencode(".jpg", annotated)
-                if not ret:
+        if job.overall_count_id is None:
+            # Veritabanına ilk kayıt
+            start_time = datetime.now()
+            query = insert(OverallCount).values({
+                "video_name": job.video_name,
+                "model_used": model_name,
+                "tracker_used": tracker_name,
+                "final_count": 0,
+                "start_time": start_time,
+                "line_coordinates": json.dumps(params["line_coordinates"]),
+                "count_details": json.dumps({"geometry": {"lines": counting_lines, "zones": counting_zones}})
+            })
+            job.overall_count_id = await database.execute(query)
+            await job.save()
+
+        # Hangi karelerde model çalışacağı; atlanan karelerde son takip sonucu korunur
+        gate = FrameGate(params.get("inference_mode", "full"), params.get("inference_stride", 1),
+                         geometry=[g["points"] for g in counting_lines + counting_zones],
+                         frame_size=(width, height), fps=fps)
+
+        # ROI/karo tespiti; tam kare tek parça tespitte None
+        region = RegionDetector.from_params(params, [g["points"] for g in counting_lines + counting_zones],
+                                            (width, height))
+
+        if cached is None:
+            # Her işin kendi takipçisi olur, ağırlıklar havuzdaki modelle paylaşılır
+            session = TrackerSession(entry, tracker_name, frame_rate=gate.tracker_frame_rate())
+            names = session.names
+        else:
+            names = cached.names
+        # Baştan sona işlenen videonun takip kutuları sonraki çizgi/filtre denemeleri için saklanır
+        recorder = DetectionRecorder() if cached is None and not live and not start_frame else None
+
+        # Yalnızca sayım modunda (renderer "none") ya da kayıt kapalıysa video yazılmaz
+        sink_kind = params.get("sink", "auto")
+        if renderer == "none" or not params.get("record", True):
+            sink_kind = "null"
+        output_filename = output_path = None
+        if sink_kind != "null":
+            # Devam eden işte çıktı videosu kaldığı kareden itibaren yeni bir dosyaya yazılır
+            source_name = "live.mp4" if live else os.path.basename(job.video_name)
+            output_filename = f"processed_{uuid.uuid4().hex}_{source_name}"
+            output_path = processed_video_path(output_filename)
+            os.makedirs(PROCESSED_VIDEO_DIR, exist_ok=True)
+        out = await asyncio.to_thread(open_sink, sink_kind, output_path, fps, (width, height))
+
+        # Sayım motoru; çizgi/bölge tanımlı değilse yalnızca konumları takip eder
+        counter = CountingEngine(counting_lines, counting_zones,
+                                 selected_class_ids=params.get("selected_class_ids"), fps=fps)
+        if checkpoint.get("counts"):
+            counter.restore(checkpoint["counts"])
+
+        preview = PreviewEncoder(lambda: job.preview_subscribers > 0,
+                                 **(params.get("preview") or preview_settings()))
+
+        skipped = Future()
+        skipped.set_result(None)
+        held = []
+        frame_no = start_frame
+
+        def submit(frame):
+            if not gate.should_detect(frame):
+                return skipped
+            if region is not None:
+                return region.submit(frame, lambda crop: session.submit(crop, conf_threshold, iou_threshold))
+            return session.submit(frame, conf_threshold, iou_threshold)
+
+        def track(frame, detection):
+            # Tespit yapılmayan karede son takip sonucu aynen korunur
+            nonlocal held, frame_no
+            frame_no += 1
+            if detection is None:
+                return False, held
+            held = [session.update(detection)]
+            if recorder is not None:
+                recorder.add(frame_no - 1, held[0])
+            return True, held
+
+        def replay(frame):
+            # Önbellekteki kutular takipçinin o karedeki çıktısının yerine geçer
+            nonlocal held, frame_no
+            result = cached.result(frame_no, frame)
+            frame_no += 1
+            if result is None:
+                return False, held
+            held = [result]
+            return True, held
+
+        def render(index, frame, tracked):
+            # Annotate thread'inde çalışır; ağ/DB işlemleri olay olarak döndürülür
+            events = []
+            detected, results = tracked
+            # Kalma süreleri tespit yapılan kare sayısına değil, kaynaktaki kare numarasına göre hesaplanır
+            position = cap.frame_position() if live else start_frame + index + 1
+
+            plot_started = time.perf_counter()
+            if renderer != "plot":
+                # overlay kutuları sayımdan sonra doğrudan kareye çizer; "none" hiç çizmez
+                annotated = frame
+            elif not results:
+                annotated = frame.copy()
+            elif detected:
+                annotated = results[0].plot()
+            else:
+                annotated = results[0].plot(img=frame)
+            if renderer == "plot":
+                metrics.observe("plot", time.perf_counter() - plot_started)
+
+            for r in results:
+                if not r.boxes or r.boxes.id is None:
+                    continue
+                boxes = r.boxes.cpu().numpy()
+                if renderer == "overlay":
+                    with metrics.timer("plot"):
+                        draw_tracked_boxes(annotated, boxes, names)
+                if not detected:
+                    # Tespit yapılmayan karede sayım güncellenmez
                     continue
-                yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n")
+                with metrics.timer("count"):
+                    crossed = counter.update(boxes.xyxy, boxes.id, boxes.cls, frame_index=position)
+                for event in crossed:
+                    event["object_label"] = names[event["cls"]]
+                    event["timestamp"] = datetime.now()
+                    events.append(event)
+                    if event["type"] != "line_crossed" or renderer == "none":
+                        continue
+
+                    x1, y1, x2, y2 = event["box"]
+                    cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 0, 255), 2)
+                    cv2.putText(annotated, f"{event['object_label']} COUNTED", (x1, y1 - 10),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
 
-            cap.release()
-            out.release()
+            if renderer == "none":
+                # Yalnızca sayım: çizim, önizleme ve video kodlaması yapılmaz
+                return None, None, events
 
-            await database.execute(update(OverallCount).where(OverallCount.id == initial_record_id).values(
-                final_count=total_count,
-                end_time=datetime.now(),
-                processed_video_path=output_path
-            ))
+            draw_counting_geometry(annotated, counter, counting_lines, counting_zones)
 
-            await manager.broadcast(json.dumps({
-                "event": "video_ended",
-                "total_count": total_count,
-                "processed_video_url": f"http://127.0.0.1:8000/processed-videos/{output_filename}"
-            }))
+            # Önizleme yalnızca izleyici varsa ve FPS sınırı izin verirse kodlanır
+            return annotated, preview.encode(annotated), events
+
+        def current_checkpoint():
+            return {"frame": job.frames_processed, "counts": counter.state()}
+
+        if live:
+            # Kısa kuyruklar: işleme yetişemezse kareler kaynakta atılır, gecikme sınırlı kalır
+            pipeline = VideoPipeline(cap, track, render, writer=out, submit_fn=submit,
+                                     inflight=LIVE_PIPELINE_QUEUE_SIZE,
+                                     queue_size=LIVE_PIPELINE_QUEUE_SIZE, name=f"job-{job.id}")
+        elif cached is not None:
+            pipeline = VideoPipeline(cap, replay, render, writer=out, name=f"job-{job.id}")
+        else:
+            pipeline = VideoPipeline(cap, track, render, writer=out, submit_fn=submit,
+                                     inflight=BATCH_MAX_SIZE, name=f"job-{job.id}")
+        topic = job_topic(job.id)
+        last_progress = 0.0
+        last_flush = time.monotonic()
+        pipeline.start()
+        try:
+            async for item in pipeline:
+                # Yayınlar yalnızca kuyruğa eklenir; kare döngüsü ağ beklemez
+                for event in item.events:
+                    if event["type"] != "line_crossed":
+                        manager.publish({
+                            "event": event["type"],
+                            "job_id": job.id,
+                            "object_id": event["track_id"],
+                            "object_label": event["object_label"],
+                            "zone": event["zone"],
+                            "dwell_seconds": event.get("dwell_seconds"),
+                        }, topic)
+                        continue
 
-            await asyncio.sleep(1)
+                    manager.publish({
+                        "event": "object_counted",
+                        "job_id": job.id,
+                        "object_id": event["track_id"],
+                        "object_label": event["object_label"],
+                        "line": event["line"],
+                        "direction": event["direction"],
+                        "total_count": event["total_count"]
+                    }, topic)
 
-        return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame")
+                    det = {
+                        "job_id": job.id,
+                        "video_name": job.video_name,
+                        "model_used": model_name,
+                        "tracker_used": tracker_name,
+                        "object_id": event["track_id"],
+                        "object_label": event["object_label"],
+                        "line_name": event["line"],
+                        "direction": event["direction"],
+                        "timestamp": event["timestamp"],
+                        "current_total_count": event["total_count"],
+                    }
+                    await detection_writer.add(det)
+
+                job.frames_processed = start_frame + item.index + 1
+                job.publish_preview(item.jpeg)
+
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    # Yavaş istemcide birikmez: iş başına yalnızca en güncel ilerleme tutulur
+                    manager.publish({
+                        "event": "general_update",
+                        "job_id": job.id,
+                        "total_count": counter.total_count,
+                        "frames_processed": job.frames_processed,
+                        "total_frames": job.total_frames,
+                    }, topic, coalesce_key=f"progress:{job.id}")
+
+                if job.frames_processed % JOB_CHECKPOINT_FRAMES == 0:
+                    # Checkpoint'ten önce o ana kadarki tespit kayıtları yazılır
+                    await detection_writer.flush()
+                    await job.save_checkpoint(current_checkpoint(), counter.total_count)
+
+                if live and now - last_flush >= LIVE_FLUSH_INTERVAL:
+                    # Canlı işin sonu yok: sayımlar belirli aralıklarla kalıcı hale getirilir
+                    last_flush = now
+                    await detection_writer.flush()
+                    await job.save_checkpoint(current_checkpoint(), counter.total_count)
+                    manager.publish({
+                        "event": "counts_flushed",
+                        "job_id": job.id,
+                        "total_count": counter.total_count,
+                        "counts": counter.summary(names),
+                        "source": cap.stats(),
+                    }, topic, coalesce_key=f"counts:{job.id}")
+
+                if job.cancel_requested:
+                    break
+        except asyncio.CancelledError:
+            # Uygulama kapanıyor: iş yeniden başlatıldığında buradan devam eder
+            await detection_writer.flush()
+            await job.save_checkpoint(current_checkpoint(), counter.total_count)
+            raise
+        finally:
+            # İş bitse, iptal edilse ya da hata alsa da thread'ler durdurulur, kaynaklar bırakılır
+            if live:
+                # Bekleyen okuma kaynak kesikken de sonlanır
+                cap.stop()
+            await pipeline.wait_closed()
 
     finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if session is not None:
+            session.close()
+        elif entry is not None:
+            model_pool.release(entry)
+        # Pipeline başlamadan hata alındıysa kaynak burada bırakılır (tekrar çağrı zararsızdır)
+        cap.release()
+
+    # Video sonunda bekleyen tespit kayıtları yazılır
+    await detection_writer.flush()
+    if output_path is not None:
+        # Çıktı videosu saklama (LRU) kapsamına alınır
+        await video_store.register(output_path, job.id)
+
+    inference = cached.meta["inference"] if cached is not None else gate.stats()
+    region_stats = cached.meta["region"] if cached is not None else (region.stats() if region is not None else None)
+    key = detection_key(params) if recorder is not None and not job.cancel_requested else None
+    if key is not None:
+        meta = {"frames": job.frames_processed, "width": width, "height": height, "fps": fps,
+                "names": names, "backend": backend, "inference": inference, "region": region_stats}
+        try:
+            await asyncio.to_thread(recorder.save, key, meta)
+        except OSError as e:
+            print(f"İş {job.id} tespit önbelleği yazılamadı: {e}")
+
+    summary = counter.summary(names)
+    await database.execute(update(OverallCount).where(OverallCount.id == job.overall_count_id).values(
+        final_count=counter.total_count,
+        end_time=datetime.now(),
+        processed_video_path=output_path,
+        count_details=json.dumps({"geometry": {"lines": counting_lines, "zones": counting_zones},
+                                  "inference": inference, **summary})
+    ))
+
+    result = {
+        "id": job.overall_count_id,
+        "video_name": job.video_name,
+        "final_count": counter.total_count,
+        "counts": summary,
+        "frames_processed": job.frames_processed,
+        "resumed_from_frame": start_frame,
+        "preview_frames": {"encoded": preview.encoded, "skipped": preview.skipped},
+        "inference": inference,
+        "backend": backend,
+        "output": {"sink": out.kind if out is not None else "null", "renderer": renderer},
+        "region": region_stats,
+        "source": cap.stats() if live else None,
+        "cache": {"hit": "detections" if cached is not None else None, "video_hash": params.get("video_hash")},
+        "processed_video_path": output_path,
+        "processed_video_url": processed_video_url(output_filename) if output_filename else None
+    }
+
+    manager.publish({
+        "event": "video_ended",
+        "job_id": job.id,
+        "total_count": counter.total_count,
+        "counts": summary,
+        "processed_video_url": result["processed_video_url"]
+    }, job_topic(job.id))
+    return result
+
+
+async def mjpeg_stream(frames):
+    async for jpeg in frames:
+        if jpeg is None:
+            continue
+        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n")
+    await asyncio.sleep(1)
@@ -0,0 +1,312 @@
+import os
+import time
+import shutil
+import asyncio
+import subprocess
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.sql import select, insert, update, delete
+from database.config import database
+from database.models import ProcessedVideo, OverallCount, ResultCache
+
+# İşlenmiş videoların yazıldığı dizin
+PROCESSED_VIDEO_DIR = os.getenv("PROCESSED_VIDEO_DIR", "processed_videos")
+# Saklama sınırları: toplam boyut aşılınca ya da bu kadar saattir izlenmeyen videolar
+# en uzun süredir erişilmeyenden başlayarak silinir (0: sınır yok)
+VIDEO_RETENTION_MAX_MB = float(os.getenv("VIDEO_RETENTION_MAX_MB", "20480"))
+VIDEO_RETENTION_MAX_AGE_HOURS = float(os.getenv("VIDEO_RETENTION_MAX_AGE_HOURS", "720"))
+# Saklama kontrolünün çalışma aralığı (saniye)
+VIDEO_RETENTION_INTERVAL = float(os.getenv("VIDEO_RETENTION_INTERVAL", "300"))
+# Oynatıcının ardışık Range istekleri her seferinde veritabanına yazılmaz
+VIDEO_ACCESS_TOUCH_INTERVAL = float(os.getenv("VIDEO_ACCESS_TOUCH_INTERVAL", "60"))
+
+# Geçmiş görünümü için küçük resim ve önizleme GIF'i ayarları
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+PREVIEW_GIF_WIDTH = int(os.getenv("PREVIEW_GIF_WIDTH", "240"))
+PREVIEW_GIF_FRAMES = int(os.getenv("PREVIEW_GIF_FRAMES", "12"))
+PREVIEW_GIF_FPS = float(os.getenv("PREVIEW_GIF_FPS", "4"))
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+# Küçük resimler videoların yanında gizli bir alt dizinde tutulur, video silinince silinir
+_DERIVED_DIR = ".previews"
+
+
+def processed_video_path(filename: str) -> str:
+    return os.path.join(PROCESSED_VIDEO_DIR, filename)
+
+
+def processed_video_url(filename: str) -> str:
+    return f"http://127.0.0.1:8000/processed-videos/{filename}"
+
+
+def preview_urls(path: str | None) -> dict:
+    """Geçmiş kayıtları için video yerine yüklenecek küçük resim ve GIF adresleri."""
+    if not path:
+        return {"thumbnail_url": None, "preview_gif_url": None}
+    url = processed_video_url(os.path.basename(path))
+    return {"thumbnail_url": f"{url}/thumbnail.jpg", "preview_gif_url": f"{url}/preview.gif"}
+
+
+def check_filename(filename: str) -> str:
+    # Yalnızca dizindeki dosyalar sunulur (../ ve gizli dosyalar reddedilir)
+    if not filename or filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Video bulunamadı.")
+    return filename
+
+
+def _derived_path(filename: str, suffix: str) -> str:
+    return os.path.join(PROCESSED_VIDEO_DIR, _DERIVED_DIR, f"{filename}{suffix}")
+
+
+def _resize(frame, width: int):
+    height, frame_width = frame.shape[:2]
+    if frame_width <= width:
+        return frame
+    # yuv420p/GIF kodlayıcılar için çift boyut
+    new_height = max(2, round(height * width / frame_width) // 2 * 2)
+    return cv2.resize(frame, (width, new_height), interpolation=cv2.INTER_AREA)
+
+
+def _sample_frames(video_path: str, count: int, width: int) -> list:
+    """Videodan eşit aralıklı count kare okur (tek kare istenirse ortadaki)."""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total <= 0:
+            positions = [None] * count
+        elif count == 1:
+            positions = [total // 2]
+        else:
+            positions = np.linspace(0, total - 1, count).astype(int).tolist()
+        for position in positions:
+            if position is not None:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(_resize(frame, width))
+    finally:
+        cap.release()
+    return frames
+
+
+def _write_atomic(dest: str, data: bytes):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, dest)
+
+
+def _render_thumbnail(video_path: str, dest: str):
+    frames = _sample_frames(video_path, 1, THUMBNAIL_WIDTH)
+    if not frames:
+        raise HTTPException(status_code=422, detail="Videodan kare okunamadı")
+    ok, buf = cv2.imencode(".jpg", frames[0], [cv2.IMWRITE_JPEG_QUALITY, 80])
+    if not ok:
+        raise HTTPException(status_code=500, detail="Küçük resim kodlanamadı")
+    _write_atomic(dest, buf.tobytes())
+
+
+def _render_preview_gif(video_path: str, dest: str):
+    """Eşit aralıklı kareleri ffmpeg'e ham BGR olarak verip paletli GIF üretir."""
+    if not shutil.which("ffmpeg"):
+        raise HTTPException(status_code=501, detail="ffmpeg bulunamadı")
+    frames = _sample_frames(video_path, PREVIEW_GIF_FRAMES, PREVIEW_GIF_WIDTH)
+    if not frames:
+        raise HTTPException(status_code=422, detail="Videodan kare okunamadı")
+    height, width = frames[0].shape[:2]
+    proc = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-y",
+         "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{PREVIEW_GIF_FPS:g}",
+         "-i", "pipe:0",
+         "-vf", "split[a][b];[a]palettegen=max_colors=128[p];[b][p]paletteuse",
+         "-loop", "0", "-f", "gif", "pipe:1"],
+        input=b"".join(np.ascontiguousarray(f).tobytes() for f in frames if f.shape[:2] == (height, width)),
+        capture_output=True,
+    )
+    if proc.returncode != 0 or not proc.stdout:
+        raise HTTPException(status_code=500, detail=f"GIF oluşturulamadı: {proc.stderr.decode(errors='replace').strip()}")
+    _write_atomic(dest, proc.stdout)
+
+
+class VideoStore:
+    """
+    İşlenmiş videoların kaydını processed_videos tablosunda tutar ve disk
+    kullanımını sınırlar: toplam boyut VIDEO_RETENTION_MAX_MB'ı aşınca ya da
+    video VIDEO_RETENTION_MAX_AGE_HOURS boyunca izlenmezse en uzun süredir
+    erişilmeyen videolar silinir (LRU). Silinen videoya bağlı genel sayım
+    kaydının video yolu temizlenir, sonuç önbelleği kaydı kaldırılır.
+    """
+
+    def __init__(self, max_mb: float = VIDEO_RETENTION_MAX_MB,
+                 max_age_hours: float = VIDEO_RETENTION_MAX_AGE_HOURS,
+                 interval: float = VIDEO_RETENTION_INTERVAL):
+        self.max_bytes = int(max_mb * 2**20)
+        self.max_age = timedelta(hours=max_age_hours) if max_age_hours > 0 else None
+        self.interval = interval
+        self._task = None
+        self._touched: dict[str, float] = {}
+        # Aynı küçük resim/GIF için eşzamanlı istekler tek üretimi bekler
+        self._rendering: dict[str, asyncio.Task] = {}
+        self._stats = {"evictions": 0, "evicted_bytes": 0, "previews_rendered": 0}
+
+    # --- Yaşam döngüsü ---
+
+    async def start(self):
+        os.makedirs(PROCESSED_VIDEO_DIR, exist_ok=True)
+        # İşler başlamadan önce çağrılır: yazılmakta olan çıktı dosyası olmaz
+        await self.reconcile()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.enforce()
+            except Exception as e:
+                print(f"Video saklama kontrolü başarısız: {e}")
+            await asyncio.sleep(self.interval)
+
+    # --- Kayıt ---
+
+    async def register(self, path: str, job_id: str = None):
+        """Tamamlanan işin çıktı videosunu saklama tablosuna ekler."""
+        filename = os.path.basename(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        now = datetime.now()
+        await database.execute(delete(ProcessedVideo).where(ProcessedVideo.filename == filename))
+        await database.execute(insert(ProcessedVideo).values({
+            "filename": filename,
+            "job_id": job_id,
+            "size_bytes": size,
+            "created_at": now,
+            "last_accessed_at": now,
+            "access_count": 0,
+        }))
+
+    async def reconcile(self):
+        """
+        Tablo ile dizini eşitler: kaydı olmayan dosyalar (önceki sürümler,
+        yarıda kalan işler) dosya zamanıyla eklenir, dosyası olmayan kayıtlar silinir.
+        """
+        on_disk = {}
+        for entry in os.scandir(PROCESSED_VIDEO_DIR):
+            if entry.is_file() and not entry.name.startswith(".") and entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                on_disk[entry.name] = entry.stat()
+        rows = await database.fetch_all(select(ProcessedVideo.filename))
+        known = {r.filename for r in rows}
+
+        missing = known - on_disk.keys()
+        if missing:
+            await database.execute(delete(ProcessedVideo).where(ProcessedVideo.filename.in_(missing)))
+            for filename in missing:
+                await self._remove_derived(filename)
+        added = [
+            {"filename": name, "job_id": None, "size_bytes": stat.st_size,
+             "created_at": datetime.fromtimestamp(stat.st_mtime),
+             "last_accessed_at": datetime.fromtimestamp(stat.st_mtime), "access_count": 0}
+            for name, stat in on_disk.items() if name not in known
+        ]
+        if added:
+            await database.execute_many(insert(ProcessedVideo), added)
+        if missing or added:
+            print(f"İşlenmiş videolar eşitlendi: {len(added)} eklendi, {len(missing)} kayıt silindi.")
+
+    async def touch(self, filename: str):
+        """Erişim zamanını günceller (LRU); aynı dosya için en fazla aralıkta bir kez yazılır."""
+        now = time.monotonic()
+        if now - self._touched.get(filename, float("-inf")) < VIDEO_ACCESS_TOUCH_INTERVAL:
+            return
+        self._touched[filename] = now
+        await database.execute(update(ProcessedVideo).where(ProcessedVideo.filename == filename).values(
+            last_accessed_at=datetime.now(), access_count=ProcessedVideo.access_count + 1))
+
+    # --- Saklama ---
+
+    async def enforce(self) -> list[str]:
+        """Yaş ve toplam boyut sınırlarını uygular; silinen dosya adlarını döndürür."""
+        rows = await database.fetch_all(
+            select(ProcessedVideo.filename, ProcessedVideo.size_bytes, ProcessedVideo.last_accessed_at)
+            .order_by(ProcessedVideo.last_accessed_at, ProcessedVideo.filename))
+        total = sum(r.size_bytes for r in rows)
+        cutoff = datetime.now() - self.max_age if self.max_age is not None else None
+        evicted = []
+        for r in rows:
+            last_access = r.last_accessed_at.replace(tzinfo=None) if r.last_accessed_at else None
+            expired = cutoff is not None and last_access is not None and last_access < cutoff
+            if not expired and total <= self.max_bytes:
+                # Satırlar erişim sırasında; kalanlar hem daha yeni hem de sınır içinde
+                break
+            await self.remove(r.filename)
+            total -= r.size_bytes
+            evicted.append(r.filename)
+            self._stats["evictions"] += 1
+            self._stats["evicted_bytes"] += r.size_bytes
+        if evicted:
+            print(f"Saklama sınırı: {len(evicted)} işlenmiş video silindi.")
+        return evicted
+
+    async def remove(self, filename: str):
+        path = processed_video_path(filename)
+        if os.path.exists(path):
+            await asyncio.to_thread(os.remove, path)
+        await self._remove_derived(filename)
+        self._touched.pop(filename, None)
+        await database.execute(delete(ProcessedVideo).where(ProcessedVideo.filename == filename))
+        # Silinen videoyu gösteren kayıtlar güncellenir; önbellek artık bu sonucu döndürmez
+        await database.execute(update(OverallCount).where(OverallCount.processed_video_path == path)
+                               .values(processed_video_path=None))
+        await database.execute(delete(ResultCache).where(ResultCache.processed_video_path == path))
+
+    async def _remove_derived(self, filename: str):
+        for suffix in (".jpg", ".gif"):
+            derived = _derived_path(filename, suffix)
+            if os.path.exists(derived):
+                await asyncio.to_thread(os.remove, derived)
+
+    # --- Küçük resim / önizleme ---
+
+    async def preview(self, filename: str, kind: str) -> str:
+        """Küçük resmi ("thumbnail") ya da GIF'i ("gif") döndürür; yoksa bir kez üretip diske yazar."""
+        path = processed_video_path(check_filename(filename))
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Video bulunamadı.")
+        suffix, render = {"thumbnail": (".jpg", _render_thumbnail), "gif": (".gif", _render_preview_gif)}[kind]
+        dest = _derived_path(filename, suffix)
+        if os.path.exists(dest):
+            return dest
+        task = self._rendering.get(dest)
+        if task is None:
+            task = asyncio.create_task(asyncio.to_thread(render, path, dest))
+            self._rendering[dest] = task
+            task.add_done_callback(lambda _: self._rendering.pop(dest, None))
+            self._stats["previews_rendered"] += 1
+        await asyncio.shield(task)
+        return dest
+
+    async def stats(self) -> dict:
+        rows = await database.fetch_all(select(ProcessedVideo.size_bytes))
+        return {
+            "videos": len(rows),
+            "used_mb": round(sum(r.size_bytes for r in rows) / 2**20, 2),
+            "max_mb": round(self.max_bytes / 2**20, 2),
+            "max_age_hours": self.max_age.total_seconds() / 3600 if self.max_age is not None else None,
+            **self._stats,
+        }
+
+
+# Uygulama genelinde kullanılacak tekil video deposu
+video_store = VideoStore()
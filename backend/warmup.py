@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import numpy as np
+from fastapi import HTTPException
+from model_manager import model_pool, resolve_model_path
+from model_export import resolve_backend
+
+# Açılışta arka planda yüklenip ısıtılacak modeller: "yolov8n,yolo11s@onnx" gibi
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "").split(",") if m.strip()]
+# Isıtmada kullanılacak boş karenin boyutu ve çıkarım sayısı
+WARMUP_IMGSZ = int(os.getenv("WARMUP_IMGSZ", "640"))
+WARMUP_RUNS = int(os.getenv("WARMUP_RUNS", "2"))
+
+
+def _warm_model(name: str, backend: str = None) -> dict:
+    """Modeli havuza yükler ve boş karelerle çıkarım yaparak ilk çağrı maliyetini öne alır."""
+    started = time.perf_counter()
+    if not backend:
+        # Arka uç belirtilmediyse işlerin varsayılanıyla aynı seçim yapılır; ilk iş aynı kaydı kullanır
+        backend = resolve_backend(None, resolve_model_path(name))
+    entry = model_pool.acquire(name, backend)
+    loaded = time.perf_counter()
+    try:
+        frame = np.zeros((WARMUP_IMGSZ, WARMUP_IMGSZ, 3), dtype=np.uint8)
+        with entry.lock:
+            for _ in range(max(1, WARMUP_RUNS)):
+                entry.model.predict(frame, verbose=False)
+    finally:
+        model_pool.release(entry)
+    finished = time.perf_counter()
+    return {"backend": backend, "load_seconds": round(loaded - started, 3),
+            "warmup_seconds": round(finished - loaded, 3)}
+
+
+def _warm_trackers():
+    # Takipçi modüllerinin içe aktarımı ve yapılandırma okuması da ilk işten önce yapılır
+    from tracking import create_tracker
+    from model_manager import SUPPORTED_TRACKERS
+    for tracker_name in SUPPORTED_TRACKERS:
+        create_tracker(tracker_name)
+
+
+class Warmup:
+    """
+    PRELOAD_MODELS listesindeki modelleri açılıştan sonra arka planda yükleyip
+    ısıtır. API bu sırada istek kabul etmeye devam eder; hazır olma durumu
+    /health/ready üzerinden izlenir.
+    """
+
+    def __init__(self, models: list[str] = PRELOAD_MODELS):
+        self.models = models
+        self.status = "pending"
+        self.results: dict[str, dict] = {}
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("ready", "degraded")
+
+    async def _run(self):
+        self.status = "warming"
+        self.started_at = time.time()
+        failed = False
+        try:
+            await asyncio.to_thread(_warm_trackers)
+        except Exception as e:
+            failed = True
+            self.results["trackers"] = {"error": str(e)}
+
+        for spec in self.models:
+            name, _, backend = spec.partition("@")
+            try:
+                self.results[spec] = await asyncio.to_thread(_warm_model, name, backend or None)
+                print(f"Model ısıtıldı: {spec} ({self.results[spec]})")
+            except Exception as e:
+                # Hatalı model diğerlerini engellemez; servis "degraded" olarak hazırlanır
+                failed = True
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                self.results[spec] = {"error": detail}
+                print(f"Model ısıtılamadı: {spec}: {detail}")
+
+        self.finished_at = time.time()
+        self.status = "degraded" if failed else "ready"
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "models": self.models,
+            "results": self.results,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
+
+
+# Uygulama genelinde kullanılacak tekil ısıtma görevi
+warmup = Warmup()
@@ -1,37 +1,215 @@
-from fastapi import WebSocket, WebSocketDisconnect
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from fastapi import WebSocket
+import metrics
+
+# Bağlantı başına bekleyen en fazla mesaj; dolunca en eski mesaj atılır
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+# Tek bir gönderimin en uzun süresi; aşan istemci bağlantıdan atılır
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Heartbeat aralığı ve mesajları bu süre boyunca hiç ilerlemeyen istemcinin atılma süresi
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+WS_STALL_TIMEOUT = float(os.getenv("WS_STALL_TIMEOUT", "60"))
+
+# Konu belirtmeyen bağlantılar tüm olayları alır (eski davranış)
+ALL_TOPICS = "*"
+
+
+def job_topic(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+class _Coalesced:
+    __slots__ = ("key",)
+
+    def __init__(self, key: str):
+        self.key = key
+
+
+class _Client:
+    """Tek bir WebSocket bağlantısının abonelikleri ve gönderim kuyruğu."""
+
+    def __init__(self, websocket: WebSocket, topics: set[str], queue_size: int):
+        self.websocket = websocket
+        self.topics = topics
+        # Kuyrukta mesaj ya da birleştirilen mesajın anahtarı (_Coalesced) bulunur
+        self.queue: deque = deque()
+        self.queue_size = queue_size
+        # Anahtar başına yalnızca en son mesaj tutulur (ör. bir işin güncel sayımı);
+        # mesaj kuyruktaki ilk yerinde, en güncel içeriğiyle gönderilir
+        self.coalesced: dict[str, str] = {}
+        self.wake = asyncio.Event()
+        self.task = None
+        self.sent = 0
+        self.dropped = 0
+        self.last_progress = time.monotonic()
+
+    def wants(self, topic: str | None) -> bool:
+        return ALL_TOPICS in self.topics or topic is None or topic in self.topics
+
+    def enqueue(self, message: str, coalesce_key: str = None):
+        if coalesce_key is not None and coalesce_key in self.coalesced:
+            self.coalesced[coalesce_key] = message
+            return
+        if len(self.queue) >= self.queue_size:
+            dropped = self.queue.popleft()
+            if isinstance(dropped, _Coalesced):
+                self.coalesced.pop(dropped.key, None)
+            self.dropped += 1
+        if coalesce_key is not None:
+            self.coalesced[coalesce_key] = message
+            self.queue.append(_Coalesced(coalesce_key))
+        else:
+            self.queue.append(message)
+        self.wake.set()
+
+    def next_message(self) -> str:
+        item = self.queue.popleft()
+        if isinstance(item, _Coalesced):
+            return self.coalesced.pop(item.key)
+        return item
+
+    @property
+    def pending(self) -> int:
+        return len(self.queue)
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """
+    WebSocket istemcilerine konu (iş) bazlı yayın yapar.
+    publish() ağ beklemeden mesajı her aboneye ait sınırlı kuyruğa koyar;
+    her bağlantının kendi gönderim görevi olduğu için yavaş bir istemci
+    ne diğerlerini ne de kare döngüsünü bekletir.
+    """
+
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.clients: dict[WebSocket, _Client] = {}
+        self._heartbeat_task = None
+        self._stats = {"published": 0, "evicted": 0}
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.clients.keys())
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, topics: set[str] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = _Client(websocket, set(topics) if topics else {ALL_TOPICS}, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self.clients[websocket] = client
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
         print(f"Yeni WebSocket bağlantısı: {websocket.client.host}:{websocket.client.port}")
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            client.task.cancel()
             print(f"WebSocket bağlantısı kesildi: {websocket.client.host}:{websocket.client.port}")
 
+    def subscribe(self, websocket: WebSocket, topics: list[str]):
+        client = self.clients.get(websocket)
+        if client is not None:
+            # Belirli bir konuya abone olan istemci artık her şeyi almaz
+            client.topics.discard(ALL_TOPICS)
+            client.topics.update(topics)
+
+    def unsubscribe(self, websocket: WebSocket, topics: list[str]):
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.topics.difference_update(topics)
+
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.enqueue(message)
+
+    def publish(self, message, topic: str = None, coalesce_key: str = None):
+        """Mesajı ilgili abonelerin kuyruğuna koyar; ağ işlemi beklemez."""
+        with metrics.timer("broadcast"):
+            if not isinstance(message, str):
+                message = json.dumps(message)
+            self._stats["published"] += 1
+            for client in self.clients.values():
+                if client.wants(topic):
+                    client.enqueue(message, coalesce_key)
 
     async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except WebSocketDisconnect:
-                disconnected.append(connection)
-                print("WebSocket bağlantısı koptu, temizleniyor.")
-            except Exception as e:
-                print(f"WebSocket mesaj gönderim hatası: {e}")
-                disconnected.append(connection)
-        for ws in disconnected:
-            if ws in self.active_connections:
-                self.active_connections.remove(ws)
+        # Geriye dönük uyumluluk: tüm bağlantılara kuyruk üzerinden gönderir
+        self.publish(message)
+
+    async def _sender(self, client: _Client):
+        ws = client.websocket
+        try:
+            while True:
+                await client.wake.wait()
+                client.wake.clear()
+                while client.queue:
+                    message = client.next_message()
+                    await asyncio.wait_for(ws.send_text(message), timeout=WS_SEND_TIMEOUT)
+                    client.sent += 1
+                    client.last_progress = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Zaman aşımı ya da kopmuş bağlantı: istemci atılır
+            print(f"WebSocket istemcisi atıldı ({type(e).__name__}): {ws.client.host}:{ws.client.port}")
+            self._evict(client)
+
+    def _evict(self, client: _Client):
+        if self.clients.pop(client.websocket, None) is None:
+            return
+        self._stats["evicted"] += 1
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+        asyncio.create_task(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(), timeout=WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for client in list(self.clients.values()):
+                # Kuyruğu uzun süredir hiç ilerlemeyen istemci takılmış sayılır
+                if client.pending and now - client.last_progress > WS_STALL_TIMEOUT:
+                    print(f"WebSocket istemcisi yanıt vermiyor, atılıyor: {client.websocket.client.host}")
+                    self._evict(client)
+                    continue
+                # Gönderim, kopmuş bağlantıların da fark edilmesini sağlar
+                if not client.pending:
+                    client.last_progress = now
+                client.enqueue('{"event": "heartbeat"}', coalesce_key="heartbeat")
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for client in list(self.clients.values()):
+            client.task.cancel()
+        self.clients.clear()
+
+    def stats(self) -> dict:
+        topics: dict[str, int] = {}
+        for client in self.clients.values():
+            for topic in client.topics:
+                topics[topic] = topics.get(topic, 0) + 1
+        return {
+            **self._stats,
+            "connections": len(self.clients),
+            "topics": topics,
+            "pending": sum(c.pending for c in self.clients.values()),
+            "sent": sum(c.sent for c in self.clients.values()),
+            "dropped": sum(c.dropped for c in self.clients.values()),
+        }
 
 # Uygulama genelinde kullanılacak tekil yöneticiyi tanımlıyoruz
 manager = ConnectionManager()